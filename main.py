@@ -1,10 +1,13 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
-from fastapi.responses import HTMLResponse, FileResponse, Response
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, Header
+from fastapi.responses import HTMLResponse, FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Optional
+from starlette.background import BackgroundTask
+from typing import Any, List, Dict, Optional, Set
+import hashlib
 import json
 import os
+import shutil
 import uuid
 import asyncio
 import logging
@@ -12,15 +15,30 @@ from datetime import datetime, timedelta
 
 from services.scraper_service import SocialMediaScraper
 from services.analysis_service import AnalysisService
-from services.database_service_mongo import DatabaseService
+from services.metrics_aggregator import MetricsAggregator
+from services.progress_persister import ProgressPersister
+from services.bulk_post_writer import BulkPostWriter
+from services.export_cache import ExportCache
+from services.progress_broadcaster import TERMINAL_EVENTS, ProgressBroadcaster, format_event
+from services.retention_service import RetentionService
 from data_models import BrandConfig, TimeFilter
 from utils.image_handler import ImageHandler
+from utils.compression import COLD_POST_FIELDS
+from utils.csv_export import csv_header, format_csv_rows
+from utils.http_compression import CompressionMiddleware
+from utils.json_response import FastJSONResponse
+from utils.post_fields import attach_post_ids, strip_brand_indexes
+from utils.columnar_export import COLUMNAR_FORMATS, ColumnarWriter, columnar_available
+from utils.projection import parse_fields, project, wants_field
+from utils.quantile_sketch import KLLSketch
+from utils.time_utils import to_utc_datetime, to_utc_epoch
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Social Media Analytics", description="Analyze social media engagement")
+app = FastAPI(title="Social Media Analytics", description="Analyze social media engagement",
+              default_response_class=FastJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -31,6 +49,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Responses above this many bytes are sent with br or gzip when the client accepts it
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")))
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
@@ -41,14 +62,119 @@ os.makedirs("results", exist_ok=True)
 os.makedirs("static", exist_ok=True)
 
 
-# DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./analytics.db")
+# DATABASE_BACKEND selects the store: "mongo" (default) or "sqlite" for single-node deployments
+if os.getenv("DATABASE_BACKEND", "mongo").lower() == "sqlite":
+    from services.database_service import DatabaseService
+else:
+    from services.database_service_mongo import DatabaseService
+
 # AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 
 
 # Initialize services
 db_service = DatabaseService()
+# Progress writes within this window (seconds) are coalesced into one
+progress_persister = ProgressPersister(db_service, float(os.getenv("PROGRESS_FLUSH_WINDOW", "0.5")))
+# Classified posts are written in batches of this size, or after this many seconds
+POST_WRITE_BATCH_SIZE = int(os.getenv("POST_WRITE_BATCH_SIZE", "500"))
+POST_WRITE_FLUSH_INTERVAL = float(os.getenv("POST_WRITE_FLUSH_INTERVAL", "2.0"))
 image_handler = ImageHandler()
 active_analysis = {}
+live_metrics = {}  # analysis_id -> brand -> MetricsAggregator, while classification runs
+progress_broadcaster = ProgressBroadcaster()
+# Seconds between keep-alive comments on idle progress streams
+EVENT_STREAM_KEEPALIVE = float(os.getenv("EVENT_STREAM_KEEPALIVE", "15"))
+# Most analyses one columnar export may cover
+EXPORT_MAX_ANALYSES = int(os.getenv("EXPORT_MAX_ANALYSES", "200"))
+# Most buckets per model one engagement timeseries may return
+SERIES_MAX_POINTS = 2000
+# Exports of finished analyses are kept for repeated downloads, within this many megabytes
+export_cache = ExportCache("results/cache", int(float(os.getenv("EXPORT_CACHE_MAX_MB", "500")) * 1024 * 1024))
+
+# Running analyses: their background task, the post writer of the brand being
+# classified and their in-flight result writes, so a delete can stop them first
+analysis_tasks: Dict[str, asyncio.Task] = {}
+post_writers: Dict[str, BulkPostWriter] = {}
+analysis_writes: Dict[str, Set[asyncio.Future]] = {}
+
+async def tracked_write(analysis_id: str, write):
+    """Run a result write of a running analysis to completion, even if the analysis is cancelled"""
+    future = asyncio.ensure_future(write)
+    writes = analysis_writes.setdefault(analysis_id, set())
+    writes.add(future)
+    future.add_done_callback(writes.discard)
+    await asyncio.shield(future)
+
+def forget_analysis_task(analysis_id: str):
+    """Drop the bookkeeping of a finished analysis task (its writes were awaited by the task)"""
+    analysis_tasks.pop(analysis_id, None)
+    analysis_writes.pop(analysis_id, None)
+
+async def release_analysis(analysis_id: str):
+    """Stop a running analysis and drop what the server holds for it outside the database
+    
+    Its post writer is drained and its in-flight writes are awaited, so no
+    write of the analysis lands after its rows are deleted.
+    """
+    pending_writes = analysis_writes.setdefault(analysis_id, set())
+    task = analysis_tasks.pop(analysis_id, None)
+    # The writer is drained before the task is cancelled, so no batch is cut off mid-write;
+    # the second pass catches a writer the task started for its next brand meanwhile
+    for _ in range(2):
+        post_writer = post_writers.pop(analysis_id, None)
+        if post_writer is not None:
+            await post_writer.cancel()
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    await asyncio.gather(*pending_writes, return_exceptions=True)
+    analysis_writes.pop(analysis_id, None)
+    
+    active_analysis.pop(analysis_id, None)
+    live_metrics.pop(analysis_id, None)
+    await progress_persister.discard(analysis_id)
+    export_cache.invalidate(analysis_id)
+    # Ends open event streams; publishing a terminal event drops their subscriptions
+    progress_broadcaster.publish(analysis_id, "deleted", {
+        "status": "deleted", "message": "Analysis was deleted"
+    })
+
+def remove_analysis_files(analysis_id: str):
+    """Delete the reference images and generated exports of a deleted analysis"""
+    try:
+        ref_dir = f"uploads/reference/{analysis_id}"
+        if os.path.exists(ref_dir):
+            shutil.rmtree(ref_dir)
+        
+        for extension in ['csv'] + [extension for extension, _ in COLUMNAR_FORMATS.values()]:
+            export_path = f"results/analysis_{analysis_id}_results.{extension}"
+            if os.path.exists(export_path):
+                os.remove(export_path)
+    except Exception as e:
+        logger.warning(f"Error cleaning up files for {analysis_id}: {e}")
+
+async def expire_analysis(analysis_id: str):
+    """Clean up after the retention sweep deleted an analysis from the database"""
+    await release_analysis(analysis_id)
+    remove_analysis_files(analysis_id)
+
+# Stored analyses are kept forever unless RETENTION_DAYS is set to a positive number of days
+retention_service = RetentionService(
+    db_service, active_analysis,
+    retention_days=int(os.getenv("RETENTION_DAYS", "0")),
+    interval_hours=float(os.getenv("RETENTION_INTERVAL_HOURS", "6")),
+    on_expired=expire_analysis
+)
+
+@app.on_event("startup")
+async def startup():
+    await db_service.create_indexes()
+    retention_service.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await retention_service.stop()
+    db_service.close()
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
@@ -71,9 +197,13 @@ async def image_proxy(url: str):
         return Response(content=placeholder, media_type="image/svg+xml")
 
 @app.get("/api/recent-analyses")
-async def get_recent_analyses():
-    """Get list of recent analyses"""
-    return db_service.list_analysis_results(limit=20)
+async def get_recent_analyses(limit: int = Query(20, ge=1, le=100), cursor: Optional[str] = None,
+                              brand: Optional[str] = None, status: Optional[str] = None):
+    """Get a page of recent analysis summaries (pass next_cursor to get the following page)"""
+    try:
+        return await db_service.list_analysis_results(limit=limit, cursor=cursor, brand=brand, status=status)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/api/analyze")
 async def analyze_brands(request_data: dict):
@@ -108,22 +238,26 @@ async def analyze_brands(request_data: dict):
             "progress": 5,
             "message": "Initializing analysis...",
             "brands_data": {},
+            "post_registry": {},
             "universal_filter": {
                 "start_date": universal_filter.start_date.isoformat(),
                 "end_date": universal_filter.end_date.isoformat()
             },
-            "reference_images": reference_images
+            "reference_images": reference_images,
+            "version": 1
         }
         
         active_analysis[analysis_id] = initial_data
-        db_service.save_analysis_result(analysis_id, initial_data)
-        db_service.save_brand_configs(analysis_id, brands_config)
+        await db_service.save_analysis_result(analysis_id, initial_data)
+        await db_service.save_brand_configs(analysis_id, brands_config)
         
         # Start background task
-        asyncio.create_task(
+        task = asyncio.create_task(
             process_analysis(analysis_id, brands_config, scraper, analyzer, 
                            universal_filter, reference_images)
         )
+        analysis_tasks[analysis_id] = task
+        task.add_done_callback(lambda _: forget_analysis_task(analysis_id))
         
         return {"analysis_id": analysis_id, "status": "started"}
         
@@ -131,49 +265,70 @@ async def analyze_brands(request_data: dict):
         logger.error(f"Error starting analysis: {e}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+def touch_analysis(analysis_id: str):
+    """Bump the version of a running analysis after changing it, invalidating status ETags"""
+    analysis = active_analysis.get(analysis_id)
+    if analysis is not None:
+        analysis["version"] = analysis.get("version", 0) + 1
+
 async def process_analysis(analysis_id: str, brands_config: Dict[str, BrandConfig], 
                           scraper: SocialMediaScraper, analyzer: AnalysisService, 
                           universal_filter: TimeFilter, reference_images: Dict):
     """Background task to process analysis"""
+    started_at = datetime.now()
     try:
         total_brands = len(brands_config)
         total_steps = total_brands * 5
         current_step = 1
         
-        def update_progress(message: str, step_increment: int = 1):
+        async def update_progress(message: str, step_increment: int = 1):
             nonlocal current_step
             current_step += step_increment
             progress_percentage = min(95, max(5, int((current_step / total_steps) * 90) + 5))
             
-            progress_data = {
+            active_analysis[analysis_id].update({
                 "status": "processing",
                 "progress": progress_percentage,
-                "message": message,
-                "brands_data": active_analysis[analysis_id].get("brands_data", {}),
-                "universal_filter": active_analysis[analysis_id].get("universal_filter", {}),
-                "reference_images": reference_images
-            }
-            
-            active_analysis[analysis_id].update(progress_data)
+                "message": message
+            })
+            touch_analysis(analysis_id)
             logger.info(f"Progress updated: {progress_percentage}% - {message}")
+            progress_broadcaster.publish(analysis_id, "progress", {
+                "status": "processing", "progress": progress_percentage, "message": message
+            })
             
-            # IMPORTANT: Force immediate database save (blocking for reliability)
-            try:
-                db_service.save_analysis_result(analysis_id, active_analysis[analysis_id])
-            except Exception as e:
-                logger.error(f"Failed to save progress: {e}")
+            # Only the status fields are written (coalesced) - brand results are saved once per brand
+            await progress_persister.update(analysis_id, "processing", progress_percentage, message)
             
             return progress_percentage
 
         await asyncio.sleep(0.5)
-        update_progress("Starting to scrape social media data...", 0)
+        await update_progress("Starting to scrape social media data...", 0)
+        
+        post_registry = active_analysis[analysis_id].setdefault("post_registry", {})
         
         for brand_name, brand_config in brands_config.items():
             brand_reference_images = reference_images.get(brand_name, {})
+            
+            # Metrics are updated as each post classification arrives
+            aggregator = MetricsAggregator()
+            live_metrics.setdefault(analysis_id, {})[brand_name] = aggregator
+            # Posts and their classifications are persisted in batches while classification runs
+            post_writer = BulkPostWriter(db_service, analysis_id, POST_WRITE_BATCH_SIZE, POST_WRITE_FLUSH_INTERVAL)
+            post_writers[analysis_id] = post_writer
+            
+            def record_classification(post: Dict, brand_name: str = brand_name, 
+                                      aggregator: MetricsAggregator = aggregator,
+                                      post_writer: BulkPostWriter = post_writer):
+                post_key = analyzer.register_posts(post_registry, [post], brand_name)[0]
+                aggregator.add_post(post_key, post_registry[post_key])
+                post_writer.add(post_key, post_registry[post_key])
+                touch_analysis(analysis_id)
+            
             logger.info(f"Processing {brand_name} with reference images: {list(brand_reference_images.keys())}")
             
             # Step 1: Scrape Instagram data
-            update_progress(f"Scraping Instagram data for {brand_name}...")
+            await update_progress(f"Scraping Instagram data for {brand_name}...")
             instagram_posts = await scraper.scrape_instagram_posts(
                 brand_config.instagram_url, universal_filter
             )
@@ -181,7 +336,7 @@ async def process_analysis(analysis_id: str, brands_config: Dict[str, BrandConfi
             logger.info(f"Scraped {len(instagram_posts)} Instagram posts for {brand_name}")
             
             # Step 2: Scrape Facebook data
-            update_progress(f"Scraping Facebook data for {brand_name}...")
+            await update_progress(f"Scraping Facebook data for {brand_name}...")
             facebook_posts = await scraper.scrape_facebook_posts(
                 brand_config.facebook_url, universal_filter
             )
@@ -189,42 +344,73 @@ async def process_analysis(analysis_id: str, brands_config: Dict[str, BrandConfi
             logger.info(f"Scraped {len(facebook_posts)} Facebook posts for {brand_name}")
             
             # Step 3: Classify Instagram posts
-            update_progress(f"Analyzing Instagram posts for {brand_name}...")
+            await update_progress(f"Analyzing Instagram posts for {brand_name}...")
             classified_instagram = await analyzer.classify_posts_with_vision(
-                instagram_posts, brand_config.keywords, "instagram", brand_name, brand_reference_images
+                instagram_posts, brand_config.keywords, "instagram", brand_name, brand_reference_images,
+                on_classified=record_classification
             )
             logger.info(f"Classified {len(classified_instagram)} Instagram posts for {brand_name}")
             
             # Step 4: Classify Facebook posts
-            update_progress(f"Analyzing Facebook posts for {brand_name}...")
+            await update_progress(f"Analyzing Facebook posts for {brand_name}...")
             classified_facebook = await analyzer.classify_posts_with_vision(
-                facebook_posts, brand_config.keywords, "facebook", brand_name, brand_reference_images
+                facebook_posts, brand_config.keywords, "facebook", brand_name, brand_reference_images,
+                on_classified=record_classification
             )
             logger.info(f"Classified {len(classified_facebook)} Facebook posts for {brand_name}")
             
             # Step 5: Calculate metrics and store results
-            update_progress(f"Calculating engagement metrics for {brand_name}...")
+            await update_progress(f"Calculating engagement metrics for {brand_name}...")
+            
+            # Posts are stored once in the registry, results refer to them by key
+            instagram_post_ids = analyzer.register_posts(post_registry, classified_instagram, brand_name)
+            facebook_post_ids = analyzer.register_posts(post_registry, classified_facebook, brand_name)
+            classified_instagram = [post_registry[post_key] for post_key in instagram_post_ids]
+            classified_facebook = [post_registry[post_key] for post_key in facebook_post_ids]
             
             all_posts = classified_instagram + classified_facebook
-            engagement_metrics = analyzer.calculate_engagement_metrics(all_posts, brand_config.keywords)
+            # The live aggregator already holds every classified post - its snapshot is the result
+            engagement_metrics = aggregator.snapshot(include_post_ids=True)
+            engagement_order = analyzer.build_engagement_order(all_posts)
+            time_index = {
+                "instagram": analyzer.build_time_index(classified_instagram),
+                "facebook": analyzer.build_time_index(classified_facebook)
+            }
             
             # Store brand results
             active_analysis[analysis_id]["brands_data"][brand_name] = {
                 "instagram": {
                     "profile": instagram_profile.model_dump() if hasattr(instagram_profile, 'model_dump') else instagram_profile.__dict__,
-                    "posts": classified_instagram,
+                    "post_ids": instagram_post_ids,
                     "metrics": engagement_metrics.get("instagram", {})
                 },
                 "facebook": {
                     "profile": facebook_profile.model_dump() if hasattr(facebook_profile, 'model_dump') else facebook_profile.__dict__,
-                    "posts": classified_facebook,
+                    "post_ids": facebook_post_ids,
                     "metrics": engagement_metrics.get("facebook", {})
                 },
                 "overall_metrics": engagement_metrics.get("overall", {}),
-                "top_posts": analyzer.get_top_performing_posts(all_posts, 5),
-                "low_posts": analyzer.get_low_performing_posts(all_posts, 5),
+                "top_posts": analyzer.select_ranked_post_ids(engagement_order, post_registry, 5),
+                "low_posts": analyzer.select_ranked_post_ids(engagement_order, post_registry, 5, lowest=True),
+                "engagement_order": engagement_order,
+                "time_index": time_index,
+                "daily_cube": analyzer.build_daily_cube(all_posts),
+                "engagement_sketches": aggregator.export_sketches(),
                 "keywords": brand_config.keywords
             }
+            touch_analysis(analysis_id)
+            
+            # Write the last partial batch of posts, then the completed brand that refers to them
+            await post_writer.close()
+            post_writers.pop(analysis_id, None)
+            await save_brand_result_async(
+                analysis_id, brand_name, active_analysis[analysis_id]["brands_data"][brand_name]
+            )
+            progress_broadcaster.publish(analysis_id, "brand_completed", {
+                "brand": brand_name,
+                "posts": len(instagram_post_ids) + len(facebook_post_ids),
+                "overall_metrics": engagement_metrics.get("overall", {})
+            })
         
         # Set final progress
         final_data = {
@@ -236,8 +422,14 @@ async def process_analysis(analysis_id: str, brands_config: Dict[str, BrandConfi
             "reference_images": reference_images
         }
         active_analysis[analysis_id].update(final_data)
+        live_metrics.pop(analysis_id, None)
+        touch_analysis(analysis_id)
+        progress_broadcaster.publish(analysis_id, "completed", {
+            "status": "completed", "progress": 100, "message": final_data["message"]
+        })
         
-        # Final database save
+        # Final status save (brand results were written as each brand completed)
+        await save_summary_async(analysis_id, active_analysis[analysis_id]["brands_data"], started_at)
         await save_progress_async(analysis_id, active_analysis[analysis_id])
         logger.info(f"Analysis {analysis_id} completed successfully")
         
@@ -252,22 +444,45 @@ async def process_analysis(analysis_id: str, brands_config: Dict[str, BrandConfi
             "reference_images": reference_images
         }
         active_analysis[analysis_id].update(error_data)
+        live_metrics.pop(analysis_id, None)
+        # The failed brand's result is never saved, so neither are the posts its writer still holds
+        post_writer = post_writers.get(analysis_id)
+        if post_writer is not None:
+            await post_writer.cancel()
+            post_writers.pop(analysis_id, None)
+        touch_analysis(analysis_id)
+        progress_broadcaster.publish(analysis_id, "error", {
+            "status": "error", "progress": error_data["progress"], "message": error_data["message"]
+        })
         
-        try:
-            db_service.save_analysis_result(analysis_id, active_analysis[analysis_id])
-        except Exception as db_error:
-            logger.error(f"Error saving error state to database: {db_error}")
+        await save_summary_async(analysis_id, error_data["brands_data"], started_at)
+        await save_progress_async(analysis_id, error_data)
 
 async def save_progress_async(analysis_id: str, data: dict):
-    """Save progress to database asynchronously"""
+    """Save the final progress status to database, flushing any coalesced updates"""
     try:
-        # Use run_in_executor to avoid blocking
-        import asyncio
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, db_service.save_analysis_result, analysis_id, data)
+        await progress_persister.update(
+            analysis_id, data.get("status", "unknown"), data.get("progress", 0), data.get("message", "")
+        )
+        await progress_persister.close(analysis_id)
     except Exception as e:
         logger.error(f"Error saving progress to database: {e}")
 
+async def save_summary_async(analysis_id: str, brands_data: dict, started_at: datetime):
+    """Save the listing summary of a finished analysis"""
+    try:
+        duration = (datetime.now() - started_at).total_seconds()
+        await tracked_write(analysis_id, db_service.save_analysis_summary(analysis_id, brands_data, duration))
+    except Exception as e:
+        logger.error(f"Error saving summary of {analysis_id} to database: {e}")
+
+async def save_brand_result_async(analysis_id: str, brand_name: str, brand_data: dict, posts: Optional[dict] = None):
+    """Save one completed brand to database asynchronously"""
+    try:
+        await tracked_write(analysis_id, db_service.save_brand_result(analysis_id, brand_name, brand_data, posts))
+    except Exception as e:
+        logger.error(f"Error saving brand {brand_name} to database: {e}")
+
 @app.post("/api/upload-reference-images")
 async def upload_reference_images(
     files: List[UploadFile] = File(...),
@@ -300,136 +515,677 @@ async def upload_reference_images(
         logger.error(f"Error uploading reference images: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/analysis/{analysis_id}/events")
+async def stream_analysis_events(analysis_id: str):
+    """Server-Sent Events stream of progress and per-brand completion while an analysis runs
+    
+    Sends the current status first, then "progress", "brand_completed" and finally
+    "completed" or "error"; fetch /api/analysis/{analysis_id} once it ends for the results.
+    A stream of an analysis that is deleted (or expires) while running ends with "deleted".
+    """
+    analysis = active_analysis.get(analysis_id)
+    if analysis is None:
+        analysis = await db_service.get_analysis_result(analysis_id, include_posts=False)
+        if not analysis:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    status = analysis.get("status", "unknown")
+    current = {
+        "status": status,
+        "progress": analysis.get("progress", 0),
+        "message": analysis.get("message", ""),
+        "brands_completed": list(analysis.get("brands_data", {}))
+    }
+    
+    # Subscribe before the first await, so no event is missed between the snapshot and the stream
+    queue = None
+    if analysis_id in active_analysis and status not in TERMINAL_EVENTS:
+        queue = progress_broadcaster.subscribe(analysis_id)
+    
+    async def events():
+        try:
+            if queue is None:
+                # Finished (or not running on this server): the current status is the last event
+                yield format_event(status if status in TERMINAL_EVENTS else "progress", current)
+                return
+            
+            yield format_event("progress", current)
+            while True:
+                try:
+                    event, message = await asyncio.wait_for(queue.get(), EVENT_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                yield message
+                if event in TERMINAL_EVENTS:
+                    return
+        finally:
+            if queue is not None:
+                progress_broadcaster.unsubscribe(analysis_id, queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def analysis_etag(analysis_id: str, source: str, version: int, paths: Optional[List[str]]) -> str:
+    """Weak ETag of one projection of one version of an analysis"""
+    projection = hashlib.sha1(','.join(paths).encode('utf-8')).hexdigest()[:12] if paths else "all"
+    return f'W/"{analysis_id}-{source}{version}-{projection}"'
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    # no-cache: browsers keep the response but revalidate it with If-None-Match every time
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/ prefixes are ignored
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in tags
+
 @app.get("/api/analysis/{analysis_id}")
-async def get_analysis_status(analysis_id: str):
-    """Get the current status of an analysis"""
+async def get_analysis_status(analysis_id: str, fields: Optional[str] = None,
+                              if_none_match: Optional[str] = Header(None)):
+    """Get the current status of an analysis
+    
+    fields projects the result to comma-separated dotted paths, e.g.
+    "status,progress,message" or "brands_data.BYD.overall_metrics". The ETag
+    changes with every write, so If-None-Match revalidation answers 304
+    without reading the analysis. The indexes kept with each brand (daily_cube,
+    engagement_order, ...) and per-model post_ids are left out unless a path
+    names them, e.g. "brands_data.BYD.daily_cube".
+    """
+    paths = parse_fields(fields)
+    
     # First check active memory
     if analysis_id in active_analysis:
         result = active_analysis[analysis_id]
-        return result
+        etag = analysis_etag(analysis_id, "live", result.get("version", 0), paths)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
+        
+        if analysis_id in live_metrics and wants_field(paths, "live_metrics"):
+            # Partial metrics of brands that are still being classified
+            result = {
+                **result,
+                "live_metrics": {
+                    brand_name: aggregator.snapshot()
+                    for brand_name, aggregator in live_metrics[analysis_id].items()
+                }
+            }
+        return FastJSONResponse(public_analysis(result, paths), headers=cache_headers(etag))
     
-    # Then check database
-    result = db_service.get_analysis_result(analysis_id)
+    # Then check database, reading only the version when the client's copy is current
+    if if_none_match:
+        version = await db_service.get_analysis_version(analysis_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+        etag = analysis_etag(analysis_id, "stored", version, paths)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
+    
+    result = await db_service.get_analysis_result(analysis_id, fields=paths)
     if result:
-        return result
+        etag = analysis_etag(analysis_id, "stored", result.get("version", 0), paths)
+        return FastJSONResponse(public_analysis(result, paths), headers=cache_headers(etag))
     
     raise HTTPException(status_code=404, detail="Analysis not found")
 
+def public_analysis(document: Dict[str, Any], paths: Optional[List[str]]) -> Dict[str, Any]:
+    """Projection of an analysis without the brand indexes, unless a path names one"""
+    projected = project(document, paths)
+    if not isinstance(projected.get("brands_data"), dict):
+        return projected
+    named = {key for path in paths or [] for key in path.split('.')}
+    return {**projected, "brands_data": strip_brand_indexes(projected["brands_data"], tuple(named))}
+
+async def load_export_posts(analysis_id: str, analysis_data: Dict[str, Any], time_filter: Optional[TimeFilter]):
+    """Time filter and post registry for an export, filtered in MongoDB when possible"""
+    if analysis_id in active_analysis or analysis_data.get("post_registry"):
+        return time_filter, analysis_data.get("post_registry", {})
+    
+    start = to_utc_epoch(time_filter.start_date) if time_filter else None
+    end = to_utc_epoch(time_filter.end_date) if time_filter else None
+    posts = await db_service.get_posts(analysis_id, start=start, end=end)
+    if posts:
+        # Stored brand results leave their post keys to the posts table
+        attach_post_ids(analysis_data.get("brands_data", {}), posts)
+        return None, {post["post_key"]: post for post in posts}
+    
+    # Analyses saved before the registry existed embed their posts in brands_data
+    AnalysisService().ensure_post_registry(analysis_data)
+    return time_filter, analysis_data["post_registry"]
+
+async def stored_ranked_post_keys(analysis_id: str, brand: str, start: int, end: int,
+                                 lowest: bool = False, limit: int = 5) -> List[str]:
+    """Keys of a brand's top (or lowest) stored posts in a time range, ranked by the engagement index"""
+    page = await db_service.query_posts(
+        analysis_id, sort="engagement", descending=not lowest, limit=limit,
+        brand=brand, start=start, end=end, include_cold_fields=False
+    )
+    return [post["post_key"] for post in page["posts"]]
+
 @app.post("/api/filter-results/{analysis_id}")
 async def filter_results_by_time(analysis_id: str, time_filter: TimeFilter):
     """Filter analysis results by time range"""
     try:
-        print(f"DEBUG: Filter request for analysis {analysis_id}")
-        print(f"DEBUG: Time filter - start: {time_filter.start_date}, end: {time_filter.end_date}")
+        logger.debug(f"Filter request for analysis {analysis_id}: {time_filter.start_date} to {time_filter.end_date}")
         
-        analysis_data = active_analysis.get(analysis_id) or db_service.get_analysis_result(analysis_id)
+        analyzer = AnalysisService()
+        analysis_data = active_analysis.get(analysis_id)
+        if not analysis_data:
+            # Stored analyses are answered from the daily cube and the posts indexes
+            analysis_data = await db_service.get_analysis_result(analysis_id, include_posts=False)
+            if analysis_data and (not analyzer.has_cached_indexes(analysis_data)
+                                  or analysis_data.get("post_registry") or has_embedded_posts(analysis_data)):
+                analysis_data = await db_service.get_analysis_result(analysis_id, include_cold_fields=False)
         if not analysis_data:
-            print(f"DEBUG: Analysis {analysis_id} not found")
             raise HTTPException(status_code=404, detail="Analysis not found")
         
-        print(f"DEBUG: Found analysis data with {len(analysis_data.get('brands_data', {}))} brands")
-        
-        analyzer = AnalysisService()
+        analyzer.ensure_post_registry(analysis_data)
+        post_registry = analysis_data["post_registry"]
+        start = to_utc_epoch(time_filter.start_date)
+        end = to_utc_epoch(time_filter.end_date)
         filtered_results = {}
         
         # Filter results for each brand
         for brand_name, brand_data in analysis_data["brands_data"].items():
-            print(f"DEBUG: Processing brand {brand_name}")
-            
             original_keywords = brand_data.get("keywords", [])
-            print(f"DEBUG: Original keywords for {brand_name}: {original_keywords}")
             
-            # Filter posts
-            original_instagram_posts = brand_data.get("instagram", {}).get("posts", [])
-            original_facebook_posts = brand_data.get("facebook", {}).get("posts", [])
-            
-            print(f"DEBUG: Original posts - Instagram: {len(original_instagram_posts)}, Facebook: {len(original_facebook_posts)}")
-            
-            filtered_instagram = analyzer.filter_posts_by_time(original_instagram_posts, time_filter)
-            filtered_facebook = analyzer.filter_posts_by_time(original_facebook_posts, time_filter)
-            
-            print(f"DEBUG: Filtered posts - Instagram: {len(filtered_instagram)}, Facebook: {len(filtered_facebook)}")
+            if post_registry:
+                # Filter posts through the sorted time index
+                time_index = analyzer.get_time_index(brand_data, post_registry)
+                filtered_ids = {
+                    platform: analyzer.select_post_ids_by_time(time_index[platform], time_filter)
+                    for platform in ("instagram", "facebook")
+                }
+                range_totals = analyzer.registry_range_totals(time_index, post_registry)
+                
+                # Top/low posts come from the cached ranking restricted to the filtered posts
+                engagement_order = analyzer.get_engagement_order(brand_data, post_registry)
+                filtered_post_ids = set(filtered_ids["instagram"]).union(filtered_ids["facebook"])
+                top_posts = analyzer.select_ranked_post_ids(engagement_order, post_registry, 5, post_ids=filtered_post_ids)
+                low_posts = analyzer.select_ranked_post_ids(
+                    engagement_order, post_registry, 5, lowest=True, post_ids=filtered_post_ids
+                )
+            else:
+                # Post keys and top/low posts are read through the posts indexes
+                filtered_ids = {
+                    platform: await db_service.get_post_keys(analysis_id, brand_name, platform, start, end)
+                    for platform in ("instagram", "facebook")
+                }
+                # Partial edge days are summed by the database before the cube is queried
+                edge_totals = {
+                    edge_range: await db_service.aggregate_post_totals(analysis_id, brand_name, *edge_range)
+                    for edge_range in analyzer.cube_edge_ranges(time_filter)
+                }
+                range_totals = lambda range_start, range_end: edge_totals[(range_start, range_end)]
+                top_posts = await stored_ranked_post_keys(analysis_id, brand_name, start, end)
+                low_posts = await stored_ranked_post_keys(analysis_id, brand_name, start, end, lowest=True)
             
-            # Recalculate metrics
-            all_filtered_posts = filtered_instagram + filtered_facebook
-            engagement_metrics = analyzer.calculate_engagement_metrics(all_filtered_posts, original_keywords)
+            logger.debug(f"Filtered posts for {brand_name} - Instagram: {len(filtered_ids['instagram'])}, Facebook: {len(filtered_ids['facebook'])}")
             
-            print(f"DEBUG: Recalculated metrics: {engagement_metrics}")
+            # Metrics for the range come from the daily cube, not the raw posts
+            daily_cube = analyzer.get_daily_cube(brand_data, post_registry)
+            engagement_metrics = analyzer.query_daily_cube(daily_cube, time_filter, range_totals)
             
             filtered_results[brand_name] = {
                 "instagram": {
                     "profile": brand_data.get("instagram", {}).get("profile", {}),
-                    "posts": filtered_instagram,
+                    "post_ids": filtered_ids["instagram"],
                     "metrics": engagement_metrics.get("instagram", {})
                 },
                 "facebook": {
                     "profile": brand_data.get("facebook", {}).get("profile", {}),
-                    "posts": filtered_facebook,
+                    "post_ids": filtered_ids["facebook"],
                     "metrics": engagement_metrics.get("facebook", {})
                 },
                 "overall_metrics": engagement_metrics.get("overall", {}),
-                "top_posts": analyzer.get_top_performing_posts(all_filtered_posts, 5),
-                "low_posts": analyzer.get_low_performing_posts(all_filtered_posts, 5),
+                "top_posts": top_posts,
+                "low_posts": low_posts,
                 "keywords": original_keywords
             }
         
-        print(f"DEBUG: Returning filtered results for {len(filtered_results)} brands")
-        
-        return {
+        return FastJSONResponse({
             "filtered_results": filtered_results,
             "time_filter": {
                 "start_date": time_filter.start_date.isoformat(),
                 "end_date": time_filter.end_date.isoformat()
             }
-        }
+        })
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"DEBUG: Error in filter_results_by_time: {e}")
+        logger.error(f"Error in filter_results_by_time: {e}")
         raise HTTPException(status_code=500, detail=f"Filter failed: {str(e)}")
 
-@app.get("/api/download/{analysis_id}")
-async def download_results(analysis_id: str, time_filter: Optional[str] = None):
-    """Download analysis results as CSV"""
-    analysis_data = active_analysis.get(analysis_id) or db_service.get_analysis_result(analysis_id)
+@app.get("/api/analysis/{analysis_id}/ranked-posts")
+async def get_ranked_posts(analysis_id: str, brand: str, platform: Optional[str] = None,
+                           model: Optional[str] = None, limit: int = 5, lowest: bool = False):
+    """Get the top (or lowest) performing posts of a brand, optionally per platform and model"""
+    analysis_data = active_analysis.get(analysis_id)
+    if analysis_data is None:
+        analysis_data = await db_service.get_analysis_result(analysis_id, include_posts=False)
+        if not analysis_data:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+        if brand not in analysis_data.get("brands_data", {}):
+            raise HTTPException(status_code=404, detail=f"Brand {brand} not found in analysis")
+        
+        # Stored posts are ranked by the engagement index: only the selected posts are read
+        page = await db_service.query_posts(
+            analysis_id, sort="engagement", descending=not lowest, limit=limit,
+            brand=brand, platform=platform, model=model
+        )
+        if page["posts"] or not (analysis_data.get("post_registry") or has_embedded_posts(analysis_data)):
+            return {"brand": brand, "platform": platform, "model": model, "posts": page["posts"]}
+    
+    brand_data = analysis_data.get("brands_data", {}).get(brand)
+    if brand_data is None:
+        raise HTTPException(status_code=404, detail=f"Brand {brand} not found in analysis")
+    
+    # Running analyses (and analyses saved before the posts collection) rank from memory
+    analyzer = AnalysisService()
+    analyzer.ensure_post_registry(analysis_data)
+    post_registry = analysis_data["post_registry"]
+    
+    ranked_order = analyzer.get_ranked_order(brand_data, post_registry, platform=platform, model=model)
+    post_ids = analyzer.select_ranked_post_ids(ranked_order, post_registry, limit, lowest=lowest)
+    
+    return {
+        "brand": brand,
+        "platform": platform,
+        "model": model,
+        "posts": [post_registry[post_id] for post_id in post_ids]
+    }
+
+def has_embedded_posts(analysis_data: Dict[str, Any]) -> bool:
+    return any(
+        brand_data.get(platform, {}).get("posts")
+        for brand_data in analysis_data.get("brands_data", {}).values()
+        for platform in ("instagram", "facebook")
+    )
+
+@app.get("/api/analysis/{analysis_id}/posts")
+async def get_posts_page(analysis_id: str, sort: str = Query("timestamp", pattern="^(timestamp|engagement)$"),
+                         order: str = Query("desc", pattern="^(asc|desc)$"),
+                         limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None,
+                         brand: Optional[str] = None, platform: Optional[str] = None, model: Optional[str] = None,
+                         min_confidence: Optional[float] = None, max_confidence: Optional[float] = None,
+                         start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                         include_text: bool = True):
+    """Get a page of posts of an analysis (pass next_cursor to get the following page)
+    
+    Posts are sorted by timestamp or engagement and filtered by brand, platform,
+    model, classification confidence and date range; include_text=false leaves
+    out captions, texts and other bulky fields.
+    """
+    query = {
+        "sort": sort, "descending": order == "desc", "limit": limit, "cursor": cursor,
+        "brand": brand, "platform": platform, "model": model,
+        "min_confidence": min_confidence, "max_confidence": max_confidence,
+        "start": to_utc_epoch(start_date) if start_date else None,
+        "end": to_utc_epoch(end_date) if end_date else None
+    }
+    
+    try:
+        # Running analyses are read from memory: their last posts may not be written yet
+        analysis_data = active_analysis.get(analysis_id)
+        if analysis_data is None:
+            page = await db_service.query_posts(analysis_id, include_cold_fields=include_text, **query)
+            if page["posts"] or cursor:
+                return FastJSONResponse(page)
+            
+            analysis_data = await db_service.get_analysis_result(analysis_id, include_posts=False)
+            if not analysis_data:
+                raise HTTPException(status_code=404, detail="Analysis not found")
+            if not analysis_data.get("post_registry") and not has_embedded_posts(analysis_data):
+                return FastJSONResponse(page)
+        
+        # Analyses saved before the posts collection keep their posts in the document
+        analyzer = AnalysisService()
+        analyzer.ensure_post_registry(analysis_data)
+        page = analyzer.page_posts(analysis_data["post_registry"], **query)
+        if not include_text:
+            page["posts"] = [
+                {field: value for field, value in post.items() if field not in COLD_POST_FIELDS}
+                for post in page["posts"]
+            ]
+        return FastJSONResponse(page)
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/analysis/{analysis_id}/timeseries")
+async def get_engagement_timeseries(analysis_id: str, brand: str, granularity: str = "day",
+                                    platform: Optional[str] = None,
+                                    start_date: Optional[datetime] = None,
+                                    end_date: Optional[datetime] = None,
+                                    max_points: int = Query(200, ge=1, le=SERIES_MAX_POINTS)):
+    """Get per-model engagement over time for a brand"""
+    analysis_data = active_analysis.get(analysis_id) or await db_service.get_analysis_result(analysis_id, include_cold_fields=False)
     if not analysis_data:
         raise HTTPException(status_code=404, detail="Analysis not found")
     
-    analyzer = AnalysisService()
+    brand_data = analysis_data.get("brands_data", {}).get(brand)
+    if brand_data is None:
+        raise HTTPException(status_code=404, detail=f"Brand {brand} not found in analysis")
     
-    # Parse time filter if provided
-    filter_obj = None
-    if time_filter:
-        try:
-            filter_data = json.loads(time_filter)
-            filter_obj = TimeFilter(
-                start_date=datetime.fromisoformat(filter_data['start_date'].replace('Z', '+00:00')),
-                end_date=datetime.fromisoformat(filter_data['end_date'].replace('Z', '+00:00'))
-            )
-        except Exception as e:
-            logger.error(f"Error parsing time filter: {e}")
+    analyzer = AnalysisService()
+    analyzer.ensure_post_registry(analysis_data)
+    post_registry = analysis_data["post_registry"]
+    time_index = analyzer.get_time_index(brand_data, post_registry)
     
     try:
-        csv_path = analyzer.export_to_csv(
-            analysis_data["brands_data"], 
-            analysis_id, 
-            filter_obj
+        series = analyzer.build_engagement_series(
+            time_index, post_registry, granularity,
+            start=to_utc_epoch(start_date) if start_date else None,
+            end=to_utc_epoch(end_date) if end_date else None,
+            max_points=max_points,
+            platform=platform
         )
-        
-        if not os.path.exists(csv_path):
-            raise HTTPException(status_code=500, detail="Failed to generate CSV file")
-        
-        return FileResponse(
-            path=csv_path,
-            media_type='application/octet-stream',
-            filename=f"social_media_analysis_{analysis_id[:8]}.csv",
-            headers={"Content-Disposition": f"attachment; filename=social_media_analysis_{analysis_id[:8]}.csv"}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"brand": brand, "platform": platform, **series}
+
+@app.get("/api/analysis/{analysis_id}/engagement-distribution")
+async def get_engagement_distribution(analysis_id: str, brand: Optional[List[str]] = Query(None),
+                                      platform: Optional[str] = None, model: Optional[str] = None,
+                                      start_date: Optional[datetime] = None,
+                                      end_date: Optional[datetime] = None):
+    """Get engagement percentiles merged across brands, platforms, models and days"""
+    if (start_date is None) != (end_date is None):
+        raise HTTPException(status_code=400, detail="start_date and end_date must be given together")
+    time_filter = TimeFilter(start_date=start_date, end_date=end_date) if start_date else None
+    
+    analysis_data = active_analysis.get(analysis_id) or await db_service.get_analysis_result(analysis_id, include_cold_fields=False)
+    if not analysis_data:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    brands_data = analysis_data.get("brands_data", {})
+    brand_names = brand or list(brands_data.keys())
+    missing = [brand_name for brand_name in brand_names if brand_name not in brands_data]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Brands not found in analysis: {', '.join(missing)}")
+    
+    analyzer = AnalysisService()
+    analyzer.ensure_post_registry(analysis_data)
+    post_registry = analysis_data["post_registry"]
+    
+    # Whole days come from the per-day sketches, partial edge days from the posts themselves
+    merged = KLLSketch()
+    for brand_name in brand_names:
+        brand_data = brands_data[brand_name]
+        range_posts = None
+        if time_filter:
+            range_posts = analyzer.registry_range_totals(analyzer.get_time_index(brand_data, post_registry), post_registry)
+        merged.merge(analyzer.merge_engagement_sketches(
+            analyzer.get_engagement_sketches(brand_data, post_registry),
+            platform=platform, model=model, time_filter=time_filter, range_posts=range_posts
+        ))
+    
+    return {
+        "brands": brand_names,
+        "platform": platform,
+        "model": model,
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+        "count": merged.count,
+        "percentiles": merged.percentiles()
+    }
+
+# Posts read from the database per CSV chunk
+CSV_EXPORT_PAGE_SIZE = 500
+
+async def stream_csv_rows(analysis_id: str, analysis_data: Optional[Dict[str, Any]],
+                          time_filter: Optional[TimeFilter]):
+    """CSV text of an analysis' posts, a page at a time, header first"""
+    yield csv_header()
+    
+    if analysis_data is not None:
+        # Running analyses and analyses with embedded posts are already in memory
+        analyzer = AnalysisService()
+        analyzer.ensure_post_registry(analysis_data)
+        posts = analyzer.collect_export_posts(analysis_data["brands_data"], time_filter, analysis_data["post_registry"])
+        for start in range(0, len(posts), CSV_EXPORT_PAGE_SIZE):
+            yield format_csv_rows(posts[start:start + CSV_EXPORT_PAGE_SIZE])
+        return
+    
+    # Posts are read by keyset in time order, so memory stays one page
+    cursor = None
+    while True:
+        page = await db_service.query_posts(
+            analysis_id, sort="timestamp", descending=False, limit=CSV_EXPORT_PAGE_SIZE, cursor=cursor,
+            start=to_utc_epoch(time_filter.start_date) if time_filter else None,
+            end=to_utc_epoch(time_filter.end_date) if time_filter else None
         )
+        yield format_csv_rows(page["posts"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            return
+
+def export_version(analysis_id: str, analysis_data: Dict[str, Any]) -> Optional[str]:
+    """Cache version of a finished analysis; None while it runs, so its exports are not cached"""
+    if analysis_data.get("status") not in TERMINAL_EVENTS:
+        return None
+    source = "live" if analysis_id in active_analysis else "stored"
+    return f"{source}{analysis_data.get('version') or 0}"
+
+def export_filter_key(time_filter: Optional[TimeFilter]) -> str:
+    if not time_filter:
+        return "all"
+    return f"{to_utc_epoch(time_filter.start_date)}-{to_utc_epoch(time_filter.end_date)}"
+
+async def load_export_status(analysis_id: str) -> Dict[str, Any]:
+    """Status and version of an analysis, enough to look up its cached exports"""
+    analysis_data = active_analysis.get(analysis_id) or await db_service.get_analysis_result(
+        analysis_id, include_posts=False, fields=["status"]
+    )
+    if not analysis_data:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return analysis_data
+
+@app.get("/api/download/{analysis_id}")
+async def download_results(analysis_id: str, time_filter: Optional[str] = None):
+    """Download analysis results as CSV, streamed while the posts are read
+    
+    The CSV of a finished analysis is cached per version and filter, so
+    repeated downloads of the same report are served from the cached file.
+    """
+    filter_obj = parse_time_filter(time_filter)
+    filename = f"social_media_analysis_{analysis_id[:8]}.csv"
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Cache-Control": "no-cache",
+        "Access-Control-Expose-Headers": "Content-Disposition"
+    }
     
+    version = export_version(analysis_id, await load_export_status(analysis_id))
+    filter_key = export_filter_key(filter_obj)
+    if version:
+        pinned_path = private_export_path("csv")
+        if export_cache.get(analysis_id, version, filter_key, "csv", pinned_path):
+            return FileResponse(path=pinned_path, media_type="text/csv", headers=headers,
+                                background=BackgroundTask(remove_file, pinned_path))
+    
+    analysis_data = active_analysis.get(analysis_id) or await db_service.get_analysis_result(analysis_id, include_posts=False)
+    if not analysis_data:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    if not analysis_data.get("brands_data"):
+        raise HTTPException(status_code=400, detail="No analysis data available")
+    
+    in_memory = (analysis_id in active_analysis or bool(analysis_data.get("post_registry"))
+                 or has_embedded_posts(analysis_data))
+    rows = stream_csv_rows(analysis_id, analysis_data if in_memory else None, filter_obj)
+    if version:
+        # Written to the cache as it streams; kept only if the whole file got through
+        rows = export_cache.tee(rows, export_cache.path_for(analysis_id, version, filter_key, "csv"))
+    return StreamingResponse(rows, media_type="text/csv", headers=headers)
+
+def parse_time_filter(time_filter: Optional[str]) -> Optional[TimeFilter]:
+    """TimeFilter from a JSON query parameter; an unparsable filter means no filter"""
+    if not time_filter:
+        return None
+    try:
+        filter_data = json.loads(time_filter)
+        return TimeFilter(
+            start_date=datetime.fromisoformat(filter_data['start_date'].replace('Z', '+00:00')),
+            end_date=datetime.fromisoformat(filter_data['end_date'].replace('Z', '+00:00'))
+        )
     except Exception as e:
-        logger.error(f"Error generating download: {e}")
-        raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
+        logger.warning(f"Error parsing time filter, proceeding without it: {e}")
+        return None
+
+async def load_analysis_export_posts(analyzer: AnalysisService, analysis_id: str,
+                                     time_filter: Optional[TimeFilter]) -> Optional[List[Dict[str, Any]]]:
+    """Posts of one analysis for an export, or None if it does not exist"""
+    analysis_data = active_analysis.get(analysis_id) or await db_service.get_analysis_result(analysis_id, include_posts=False)
+    if not analysis_data:
+        return None
+    return analyzer.collect_export_posts(
+        analysis_data.get("brands_data", {}),
+        *(await load_export_posts(analysis_id, analysis_data, time_filter))
+    )
+
+async def analyses_in_range(since: Optional[datetime], until: Optional[datetime],
+                            brand: Optional[str]) -> List[str]:
+    """Ids of completed analyses last updated within [since, until], newest first"""
+    analysis_ids = []
+    cursor = None
+    while True:
+        page = await db_service.list_analysis_results(limit=100, cursor=cursor, brand=brand, status="completed")
+        for summary in page["analyses"]:
+            updated_at = to_utc_datetime(summary.get("updated_at"))
+            if since and updated_at and updated_at < since:
+                # Pages are newest first, nothing older can be in range
+                return analysis_ids
+            if until and updated_at and updated_at > until:
+                continue
+            analysis_ids.append(summary["analysis_id"])
+            if len(analysis_ids) > EXPORT_MAX_ANALYSES:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"More than {EXPORT_MAX_ANALYSES} analyses in range, narrow it down"
+                )
+        cursor = page["next_cursor"]
+        if not cursor:
+            return analysis_ids
+
+def private_export_path(extension: str) -> str:
+    """A file for one export response, deleted once it has been sent"""
+    return f"results/export_{uuid.uuid4().hex}.{extension}"
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def columnar_response(path: str, fmt: str, name: str) -> FileResponse:
+    """Send an export file that belongs to this response, deleting it once it has been sent"""
+    extension, media_type = COLUMNAR_FORMATS[fmt]
+    filename = f"{name}.{extension}"
+    return FileResponse(
+        path=path,
+        media_type=media_type,
+        filename=filename,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Access-Control-Expose-Headers": "Content-Disposition"
+        },
+        background=BackgroundTask(remove_file, path)
+    )
+
+def check_columnar_format(fmt: str):
+    if fmt not in COLUMNAR_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format {fmt}, use one of {list(COLUMNAR_FORMATS)}")
+    if not columnar_available():
+        raise HTTPException(status_code=501, detail="Columnar exports need pyarrow installed on the server")
+
+@app.get("/api/export/{analysis_id}")
+async def export_analysis(analysis_id: str, format: str = "parquet", time_filter: Optional[str] = None):
+    """Download the posts of an analysis as Parquet or Arrow IPC, with typed columns"""
+    check_columnar_format(format)
+    filter_obj = parse_time_filter(time_filter)
+    name = f"social_media_analysis_{analysis_id[:8]}"
+    extension = COLUMNAR_FORMATS[format][0]
+    
+    # Finished analyses are served from the export cache when this version was exported before;
+    # each response sends its own link to the file, so an eviction meanwhile cannot cut it off
+    path = private_export_path(extension)
+    version = export_version(analysis_id, await load_export_status(analysis_id))
+    if version and export_cache.get(analysis_id, version, export_filter_key(filter_obj), extension, path):
+        return columnar_response(path, format, name)
+    
+    analyzer = AnalysisService()
+    posts = await load_analysis_export_posts(analyzer, analysis_id, filter_obj)
+    if posts is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    if version:
+        cache_path = export_cache.path_for(analysis_id, version, export_filter_key(filter_obj), extension)
+        build_path = export_cache.temp_path(cache_path)
+    else:
+        # Running analyses change between requests and are not cached
+        build_path = path
+    try:
+        with ColumnarWriter(build_path, format) as writer:
+            writer.write(analysis_id, posts)
+        built = not version or export_cache.commit(build_path, cache_path, pin_path=path)
+    except Exception as e:
+        logger.error(f"Error generating {format} export of {analysis_id}: {e}", exc_info=True)
+        remove_file(build_path)
+        raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
+    if not built:
+        # Deleted while the export was being built
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    return columnar_response(path, format, name)
+
+@app.get("/api/export")
+async def export_analyses(format: str = "parquet", analysis_ids: Optional[str] = None,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          brand: Optional[str] = None, time_filter: Optional[str] = None):
+    """Download the posts of several analyses as one Parquet or Arrow IPC file
+    
+    Pass comma-separated analysis_ids, or since/until to export every completed
+    analysis last updated in that range (optionally only those with a brand).
+    """
+    check_columnar_format(format)
+    
+    if analysis_ids:
+        ids = [analysis_id.strip() for analysis_id in analysis_ids.split(',') if analysis_id.strip()]
+        if len(ids) > EXPORT_MAX_ANALYSES:
+            raise HTTPException(status_code=400, detail=f"At most {EXPORT_MAX_ANALYSES} analyses per export")
+    elif since or until:
+        ids = await analyses_in_range(to_utc_datetime(since), to_utc_datetime(until), brand)
+    else:
+        raise HTTPException(status_code=400, detail="Pass analysis_ids or a since/until range")
+    
+    analyzer = AnalysisService()
+    filter_obj = parse_time_filter(time_filter)
+    path = f"results/analyses_export_{uuid.uuid4().hex}.{COLUMNAR_FORMATS[format][0]}"
+    try:
+        # One record batch per analysis, so only one analysis' posts are in memory at a time
+        with ColumnarWriter(path, format) as writer:
+            for analysis_id in ids:
+                posts = await load_analysis_export_posts(analyzer, analysis_id, filter_obj)
+                if posts is None:
+                    logger.warning(f"Analysis {analysis_id} not found, left out of the export")
+                    continue
+                writer.write(analysis_id, posts)
+    except Exception as e:
+        logger.error(f"Error generating {format} export: {e}", exc_info=True)
+        remove_file(path)
+        raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
+    
+    return columnar_response(path, format, f"social_media_analyses_{datetime.now():%Y%m%d}")
 
 @app.delete("/api/analysis/{analysis_id}")
 async def delete_analysis(analysis_id: str):
@@ -440,27 +1196,14 @@ async def delete_analysis(analysis_id: str):
             logger.warning(f"Invalid analysis ID received for deletion: {analysis_id}")
             raise HTTPException(status_code=400, detail="Invalid analysis ID")
         
-        # Remove from active memory
-        if analysis_id in active_analysis:
-            del active_analysis[analysis_id]
+        # Remove from active memory (the retention sweep goes through the same cleanup)
+        await release_analysis(analysis_id)
         
         # Delete from database
-        success = db_service.delete_analysis_result(analysis_id)
+        success = await db_service.delete_analysis_result(analysis_id)
         
         if success:
-            # Clean up files
-            try:
-                import shutil
-                ref_dir = f"uploads/reference/{analysis_id}"
-                if os.path.exists(ref_dir):
-                    shutil.rmtree(ref_dir)
-                
-                csv_path = f"results/analysis_{analysis_id}_results.csv"
-                if os.path.exists(csv_path):
-                    os.remove(csv_path)
-            except Exception as e:
-                logger.warning(f"Error cleaning up files for {analysis_id}: {e}")
-            
+            remove_analysis_files(analysis_id)
             return {"message": "Analysis deleted successfully"}
         else:
             raise HTTPException(status_code=404, detail="Analysis not found")
@@ -470,86 +1213,8 @@ async def delete_analysis(analysis_id: str):
     except Exception as e:
         logger.error(f"Error deleting analysis {analysis_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
-    
 
-@app.get("/api/download/{analysis_id}")
-async def download_results(analysis_id: str, time_filter: Optional[str] = None):
-    """Download analysis results as CSV"""
-    try:
-        logger.info(f"Download request for analysis: {analysis_id}")
-        
-        # Get analysis data
-        analysis_data = active_analysis.get(analysis_id) or db_service.get_analysis_result(analysis_id)
-        if not analysis_data:
-            logger.error(f"Analysis {analysis_id} not found")
-            raise HTTPException(status_code=404, detail="Analysis not found")
-        
-        if not analysis_data.get('brands_data'):
-            logger.error(f"No brands data in analysis {analysis_id}")
-            raise HTTPException(status_code=400, detail="No analysis data available")
-        
-        analyzer = AnalysisService()
-        
-        # Parse time filter if provided
-        filter_obj = None
-        if time_filter:
-            try:
-                filter_data = json.loads(time_filter)
-                filter_obj = TimeFilter(
-                    start_date=datetime.fromisoformat(filter_data['start_date'].replace('Z', '+00:00')),
-                    end_date=datetime.fromisoformat(filter_data['end_date'].replace('Z', '+00:00'))
-                )
-                logger.info(f"Time filter applied: {filter_obj.start_date} to {filter_obj.end_date}")
-            except Exception as e:
-                logger.warning(f"Error parsing time filter, proceeding without it: {e}")
-                filter_obj = None
-        
-        # Generate CSV
-        try:
-            csv_path = analyzer.export_to_csv(
-                analysis_data["brands_data"], 
-                analysis_id, 
-                filter_obj
-            )
-            logger.info(f"CSV generated at: {csv_path}")
-        except Exception as e:
-            logger.error(f"Error generating CSV: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"Failed to generate CSV: {str(e)}")
-        
-        # Verify file exists
-        if not os.path.exists(csv_path):
-            logger.error(f"CSV file not found at: {csv_path}")
-            raise HTTPException(status_code=500, detail="CSV file not found after generation")
-        
-        # Verify file is not empty
-        file_size = os.path.getsize(csv_path)
-        if file_size == 0:
-            logger.error(f"Generated CSV file is empty")
-            raise HTTPException(status_code=500, detail="Generated CSV file is empty")
-        
-        logger.info(f"CSV file ready: {csv_path} ({file_size} bytes)")
-        
-        filename = f"social_media_analysis_{analysis_id[:8]}.csv"
-        
-        return FileResponse(
-            path=csv_path,
-            media_type='text/csv',
-            filename=filename,
-            headers={
-                "Content-Disposition": f'attachment; filename="{filename}"',
-                "Cache-Control": "no-cache",
-                "Access-Control-Expose-Headers": "Content-Disposition"
-            }
-        )
-    
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Unexpected error in download endpoint: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
-    
 
-    
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,13 +1,23 @@
 import os
 from openai import OpenAI
 import base64
+import bisect
+import hashlib
+import heapq
 import requests
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from datetime import datetime, timezone
 import pandas as pd
+import numpy as np
 import json
 import logging
 from data_models import TimeFilter
+from services.metrics_aggregator import (
+    ENGAGEMENT_MEASURES, SECONDS_PER_DAY, MetricsAggregator, add_to_scopes, display_name, metrics_from_groups
+)
+from utils.cursors import POST_SORTS, decode_post_cursor, encode_post_cursor
+from utils.quantile_sketch import KLLSketch
+from utils.time_utils import to_utc_epoch
 from dotenv import load_dotenv
 import asyncio
 from PIL import Image
@@ -19,6 +29,9 @@ load_dotenv(override=True)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)  # Only show warnings and errors
 
+SERIES_GRANULARITIES = {'hour': 3600, 'day': SECONDS_PER_DAY, 'week': 7 * SECONDS_PER_DAY}
+WEEK_ANCHOR = 4 * SECONDS_PER_DAY  # Epoch day 4 (1970-01-05) is a Monday
+
 class AnalysisService:
     def __init__(self):
         api_key = os.getenv('OPENAI_API_KEY')
@@ -30,7 +43,8 @@ class AnalysisService:
 
     async def classify_posts_with_vision(self, posts: List[Dict[str, Any]], keywords: List[str], 
                                        platform: str, brand_name: str, 
-                                       reference_images: Dict[str, List[str]] = None) -> List[Dict[str, Any]]:
+                                       reference_images: Dict[str, List[str]] = None,
+                                       on_classified: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
         """Classify posts using both text and vision analysis"""
         logger.info(f"Starting classification for {brand_name} on {platform}")
         logger.info(f"Posts to classify: {len(posts)}")
@@ -44,6 +58,8 @@ class AnalysisService:
                 post, keywords, platform, brand_name, reference_images
             )
             classified_posts.append(classified_post)
+            if on_classified:
+                on_classified(classified_post)
             await asyncio.sleep(0.5)  # Rate limiting
         
         return classified_posts
@@ -384,276 +400,551 @@ class AnalysisService:
             logger.error(f"Error encoding local image {image_path}: {e}")
             return None
 
-    def calculate_engagement_metrics(self, posts: List[Dict[str, Any]], 
-                                   keywords: List[str]) -> Dict[str, Any]:
-        """Calculate engagement metrics for posts"""
-        if not posts:
-            return {"instagram": {}, "facebook": {}, "overall": {}}
+    def _build_posts_frame(self, posts: List[Dict[str, Any]]) -> pd.DataFrame:
+        """Build a flat post table for grouped aggregation"""
+        models = [(post.get('model') or '').strip() for post in posts]
         
-        # Separate by platform
-        instagram_posts = [p for p in posts if p.get('platform') == 'instagram']
-        facebook_posts = [p for p in posts if p.get('platform') == 'facebook']
+        columns = {
+            'platform': [post.get('platform') or '' for post in posts],
+            'model': models,
+            'model_key': [model.lower() for model in models]
+        }
+        for measure in ENGAGEMENT_MEASURES:
+            columns[measure] = np.fromiter(
+                (post.get(measure) or 0 for post in posts), dtype=np.int64, count=len(posts)
+            )
         
-        # Calculate metrics for each platform
-        instagram_metrics = self._calculate_platform_metrics(instagram_posts, keywords)
-        facebook_metrics = self._calculate_platform_metrics(facebook_posts, keywords)
-        overall_metrics = self._calculate_platform_metrics(posts, keywords)
+        return pd.DataFrame(columns)
+
+    def _model_names(self, frame: pd.DataFrame) -> Dict[str, str]:
+        """Map each normalized model key to its display name, as MetricsAggregator names it"""
+        spellings = {}
+        for model, count in frame['model'].value_counts(sort=False).items():
+            spellings.setdefault(model.lower(), {})[model] = int(count)
+        return {model_key: display_name(model_spellings) for model_key, model_spellings in spellings.items()}
+
+    def build_daily_cube(self, posts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Aggregate posts into per-day prefix sums for each platform and model"""
+        dated_posts = [post for post in posts if post.get('timestamp_epoch') is not None]
+        if not dated_posts:
+            return {"days": [], "series": []}
         
-        return {
-            "instagram": instagram_metrics,
-            "facebook": facebook_metrics,
-            "overall": overall_metrics
-        }
+        frame = self._build_posts_frame(dated_posts)
+        post_days = np.fromiter(
+            (post['timestamp_epoch'] // SECONDS_PER_DAY for post in dated_posts),
+            dtype=np.int64, count=len(dated_posts)
+        )
+        days = np.unique(post_days)
+        frame['day_index'] = np.searchsorted(days, post_days)
+        frame['posts'] = 1
+        
+        measures = ['posts'] + ENGAGEMENT_MEASURES
+        daily = frame.groupby(['platform', 'model_key', 'day_index'], sort=False)[measures].sum()
+        model_names = self._model_names(frame)
+        
+        # One prefix-sum row per (platform, model): value[i] covers days[:i]
+        series = []
+        for (platform, model_key), rows in daily.groupby(level=[0, 1], sort=False):
+            day_index = rows.index.get_level_values('day_index').to_numpy()
+            entry = {"platform": platform, "model": model_names[model_key]}
+            for measure in measures:
+                values = np.zeros(len(days) + 1, dtype=np.int64)
+                values[day_index + 1] = rows[measure].to_numpy()
+                entry[measure] = np.cumsum(values).tolist()
+            series.append(entry)
+        
+        return {"days": days.tolist(), "series": series}
 
-    def _calculate_platform_metrics(self, posts: List[Dict[str, Any]], 
-                                  keywords: List[str]) -> Dict[str, Any]:
-        """Calculate metrics for a specific platform"""
-        if not posts:
-            return {
-                "total_posts": 0,
-                "total_engagement": 0,
-                "average_engagement": 0,
-                "model_breakdown": {}
-            }
+    def get_daily_cube(self, brand_data: Dict[str, Any], 
+                       post_registry: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Get the cached daily cube of a brand, building it for older analyses"""
+        if brand_data.get('daily_cube') is None:
+            brand_data['daily_cube'] = self.build_daily_cube(self.get_brand_posts(brand_data, post_registry))
+        return brand_data['daily_cube']
+
+    def query_daily_cube(self, daily_cube: Dict[str, Any], time_filter: TimeFilter,
+                         range_totals: Callable[[int, int], List[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Calculate engagement metrics for a time range from the daily cube
+
+        range_totals(start, end) returns per (platform, model) totals for the
+        partial days at the edges of the range, which the cube cannot answer.
+        """
+        first_day, last_day = self._cube_day_range(time_filter)
         
-        total_posts = len(posts)
-        total_engagement = sum(post.get('engagement', 0) for post in posts)
-        average_engagement = total_engagement / total_posts if total_posts > 0 else 0
-        
-        # Model breakdown
-        model_breakdown = {}
-        all_models = set(post.get('model', '').strip() for post in posts if post.get('model', '').strip())
-        
-        for model in all_models:
-            model_posts = [p for p in posts if p.get('model', '').strip().lower() == model.lower()]
-            if model_posts:
-                model_engagement = sum(post.get('engagement', 0) for post in model_posts)
-                model_breakdown[model] = {
-                    "posts_count": len(model_posts),
-                    "total_engagement": model_engagement,
-                    "average_engagement": model_engagement / len(model_posts),
-                    "engagement_rate": (model_engagement / total_engagement * 100) if total_engagement > 0 else 0,
-                    "posts": model_posts
+        scopes = {"instagram": {}, "facebook": {}, "overall": {}}
+        if first_day <= last_day:
+            days = daily_cube.get("days", [])
+            lo = bisect.bisect_left(days, first_day)
+            hi = bisect.bisect_right(days, last_day)
+            
+            for entry in daily_cube.get("series", []):
+                totals = {
+                    measure: entry[measure][hi] - entry[measure][lo]
+                    for measure in ['posts'] + ENGAGEMENT_MEASURES
                 }
+                if totals["posts"]:
+                    add_to_scopes(scopes, entry["platform"], entry["model"].lower(),
+                                  entry["model"], totals)
+        
+        for range_start, range_end in self.cube_edge_ranges(time_filter):
+            for row in range_totals(range_start, range_end):
+                add_to_scopes(scopes, row["platform"], row["model"].lower(), row["model"], row)
         
         return {
-            "total_posts": total_posts,
-            "total_engagement": total_engagement,
-            "average_engagement": average_engagement,
-            "model_breakdown": model_breakdown
+            scope: metrics_from_groups(groups)
+            for scope, groups in scopes.items()
         }
 
-    def get_top_performing_posts(self, posts: List[Dict[str, Any]], limit: int = 5) -> List[Dict[str, Any]]:
-        """Get top performing posts by engagement"""
-        if not posts:
-            return []
+    def _cube_day_range(self, time_filter: TimeFilter) -> Tuple[int, int]:
+        """First and last whole UTC day inside a time range"""
+        start = to_utc_epoch(time_filter.start_date)
+        end = to_utc_epoch(time_filter.end_date)
+        return -(-start // SECONDS_PER_DAY), (end + 1) // SECONDS_PER_DAY - 1
+
+    def cube_edge_ranges(self, time_filter: TimeFilter) -> List[Tuple[int, int]]:
+        """Epoch ranges of a time filter that the daily cube cannot answer"""
+        start = to_utc_epoch(time_filter.start_date)
+        end = to_utc_epoch(time_filter.end_date)
+        first_day, last_day = self._cube_day_range(time_filter)
         
-        sorted_posts = sorted(posts, key=lambda x: x.get('engagement', 0), reverse=True)
-        return sorted_posts[:limit]
+        if first_day > last_day:
+            edge_ranges = [(start, end)]
+        else:
+            edge_ranges = [
+                (start, first_day * SECONDS_PER_DAY - 1),
+                ((last_day + 1) * SECONDS_PER_DAY, end)
+            ]
+        return [(range_start, range_end) for range_start, range_end in edge_ranges if range_start <= range_end]
 
-    def get_low_performing_posts(self, posts: List[Dict[str, Any]], limit: int = 5) -> List[Dict[str, Any]]:
-        """Get low performing posts by engagement"""
-        if not posts:
-            return []
+    def registry_range_totals(self, time_index: Dict[str, Dict[str, List]], 
+                              post_registry: Dict[str, Dict[str, Any]]) -> Callable[[int, int], List[Dict[str, Any]]]:
+        """Range totals read from the time index and the in-memory post registry"""
+        def range_totals(range_start: int, range_end: int) -> List[Dict[str, Any]]:
+            rows = []
+            for platform_index in time_index.values():
+                timestamps = platform_index.get("timestamps", [])
+                lo = bisect.bisect_left(timestamps, range_start)
+                hi = bisect.bisect_right(timestamps, range_end)
+                for post_id in platform_index["post_ids"][lo:hi]:
+                    post = post_registry[post_id]
+                    row = {measure: post.get(measure) or 0 for measure in ENGAGEMENT_MEASURES}
+                    row.update({
+                        "platform": post.get('platform') or '',
+                        "model": (post.get('model') or '').strip(),
+                        "posts": 1
+                    })
+                    rows.append(row)
+            return rows
         
-        sorted_posts = sorted(posts, key=lambda x: x.get('engagement', 0))
-        return sorted_posts[:limit]
+        return range_totals
 
-    def filter_posts_by_time(self, posts: List[Dict[str, Any]], time_filter: TimeFilter) -> List[Dict[str, Any]]:
-        """Filter posts by time range"""
-        if not posts:
-            return []
+    def get_engagement_sketches(self, brand_data: Dict[str, Any], 
+                                post_registry: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Get the stored per-day engagement sketches of a brand, building them for older analyses"""
+        sketch_entries = brand_data.get('engagement_sketches')
+        # Sketches stored before they were kept per day cannot answer date ranges
+        if sketch_entries is None or any('day' not in entry for entry in sketch_entries):
+            aggregator = MetricsAggregator()
+            for post in self.get_brand_posts(brand_data, post_registry):
+                aggregator.add_post(self.get_post_key(post), post)
+            brand_data['engagement_sketches'] = aggregator.export_sketches()
+        return brand_data['engagement_sketches']
+
+    def merge_engagement_sketches(self, sketch_entries: List[Dict[str, Any]], platform: Optional[str] = None,
+                                  model: Optional[str] = None, time_filter: Optional[TimeFilter] = None,
+                                  range_posts: Optional[Callable[[int, int], List[Dict[str, Any]]]] = None) -> KLLSketch:
+        """Merge stored (platform, model, day) sketches into one distribution
         
-        from datetime import timezone
+        With a time filter only the sketches of whole days inside the range are
+        merged; range_posts(start, end) returns one row per post for the
+        partial days at the edges, whose engagement is added directly.
+        """
+        model_key = model.strip().lower() if model else None
+        first_day, last_day = self._cube_day_range(time_filter) if time_filter else (None, None)
         
-        filtered_posts = []
+        merged = KLLSketch()
+        for entry in sketch_entries:
+            if platform and entry["platform"] != platform:
+                continue
+            if model_key and entry["model"].lower() != model_key:
+                continue
+            if time_filter and (entry["day"] is None or not first_day <= entry["day"] <= last_day):
+                continue
+            merged.merge(KLLSketch.from_dict(entry["sketch"]))
         
-        # Ensure filter dates are timezone-aware (UTC)
-        start_date = time_filter.start_date
-        end_date = time_filter.end_date
+        if time_filter:
+            for range_start, range_end in self.cube_edge_ranges(time_filter):
+                merged.update_many(
+                    row["engagement"] for row in range_posts(range_start, range_end)
+                    if (not platform or row["platform"] == platform)
+                    and (not model_key or row["model"].lower() == model_key)
+                )
+        return merged
+
+    def get_post_key(self, post: Dict[str, Any]) -> str:
+        """Get the registry key of a post (brand, platform and platform post id)"""
+        if post.get('post_key'):
+            return post['post_key']
         
-        # Convert filter dates to UTC if they're naive
-        if start_date.tzinfo is None:
-            start_date = start_date.replace(tzinfo=timezone.utc)
-        else:
-            # Convert to UTC if it has a different timezone
-            start_date = start_date.astimezone(timezone.utc)
+        post_id = str(post.get('id') or '')
+        if not post_id:
+            # Some scraped posts have no id - fall back to a content fingerprint
+            fingerprint = f"{post.get('url', '')}|{post.get('timestamp', '')}|{post.get('caption') or post.get('text') or ''}"
+            post_id = hashlib.md5(fingerprint.encode('utf-8')).hexdigest()[:16]
         
-        if end_date.tzinfo is None:
-            end_date = end_date.replace(tzinfo=timezone.utc)
-        else:
-            # Convert to UTC if it has a different timezone
-            end_date = end_date.astimezone(timezone.utc)
+        post_key = f"{post.get('platform') or 'unknown'}:{post_id}"
+        # A post scraped for several brands is counted once per brand
+        return f"{post['brand']}/{post_key}" if post.get('brand') else post_key
+
+    def register_posts(self, post_registry: Dict[str, Dict[str, Any]], posts: List[Dict[str, Any]],
+                       brand_name: str) -> List[str]:
+        """Store posts once per brand in the analysis post registry and return their keys"""
+        post_ids = []
+        for post in posts:
+            if post.get('brand') not in (None, brand_name):
+                # Registered for another brand already - that entry keeps its own copy
+                post = {field: value for field, value in post.items() if field != 'post_key'}
+            post['brand'] = brand_name
+            post_key = self.get_post_key(post)
+            post['post_key'] = post_key
+            if 'timestamp_epoch' not in post:
+                post['timestamp_epoch'] = to_utc_epoch(post.get('timestamp'))
+            post_registry[post_key] = post
+            post_ids.append(post_key)
+        
+        return post_ids
+
+    def resolve_posts(self, platform_data: Dict[str, Any], 
+                      post_registry: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Get the posts of a platform section from the registry"""
+        if 'post_ids' in platform_data:
+            return [post_registry[post_id] for post_id in platform_data['post_ids'] if post_id in post_registry]
+        
+        # Analyses saved before the registry existed embed the posts directly
+        return platform_data.get('posts', [])
+
+    def ensure_post_registry(self, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Move posts embedded by older analyses into the post registry"""
+        post_registry = analysis_data.setdefault('post_registry', {})
         
-        print(f"DEBUG: Filter range (UTC): {start_date} to {end_date}")
+        for brand_name, brand_data in analysis_data.get('brands_data', {}).items():
+            for platform in ('instagram', 'facebook'):
+                platform_data = brand_data.get(platform, {})
+                if 'posts' in platform_data and 'post_ids' not in platform_data:
+                    platform_data['post_ids'] = self.register_posts(
+                        post_registry, platform_data.pop('posts'), brand_name
+                    )
         
-        for post in posts:
-            post_time = post.get('timestamp')
+        # Registries saved before timestamps were normalized at ingestion
+        for post in post_registry.values():
+            if 'timestamp_epoch' not in post:
+                post['timestamp_epoch'] = to_utc_epoch(post.get('timestamp'))
+        
+        return analysis_data
+
+    def has_cached_indexes(self, analysis_data: Dict[str, Any]) -> bool:
+        """Whether every brand carries the daily cube that lets range queries skip the posts"""
+        return all(
+            brand_data.get('daily_cube') is not None
+            for brand_data in analysis_data.get('brands_data', {}).values()
+        )
+
+    def get_brand_posts(self, brand_data: Dict[str, Any], 
+                        post_registry: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Get all posts of a brand across platforms"""
+        return (self.resolve_posts(brand_data.get('instagram', {}), post_registry) +
+                self.resolve_posts(brand_data.get('facebook', {}), post_registry))
+
+    def build_engagement_order(self, posts: List[Dict[str, Any]]) -> List[str]:
+        """Rank post keys by engagement, highest first"""
+        if not posts:
+            return []
+        
+        engagement = np.fromiter(
+            (post.get('engagement') or 0 for post in posts), dtype=np.int64, count=len(posts)
+        )
+        order = np.argsort(-engagement, kind='stable')
+        return [self.get_post_key(posts[i]) for i in order]
+
+    def select_ranked_post_ids(self, engagement_order: List[str], post_registry: Optional[Dict[str, Dict[str, Any]]],
+                               limit: int = 5, lowest: bool = False, platform: Optional[str] = None,
+                               model: Optional[str] = None, post_ids: Optional[set] = None) -> List[str]:
+        """Read the top (or lowest) posts from a cached engagement order"""
+        model_key = model.strip().lower() if model else None
+        if post_registry is None and (platform or model_key):
+            raise ValueError("Platform and model filters need the post registry")
+        ranked = reversed(engagement_order) if lowest else engagement_order
+        
+        # Walk the ranking until enough posts match - no sorting needed
+        selected = []
+        for post_id in ranked:
+            if len(selected) >= limit:
+                break
+            if post_ids is not None and post_id not in post_ids:
+                continue
+            if post_registry is None:
+                # Ranking by key only (posts are not loaded)
+                selected.append(post_id)
+                continue
             
-            if not post_time:
-                print(f"DEBUG: Post {post.get('id', 'unknown')} has no timestamp, skipping")
+            post = post_registry.get(post_id)
+            if post is None:
+                continue
+            if platform and post.get('platform') != platform:
+                continue
+            if model_key and (post.get('model') or '').strip().lower() != model_key:
                 continue
             
-            # Handle different timestamp formats
-            if isinstance(post_time, str):
-                try:
-                    # Try parsing ISO format with timezone
-                    if 'T' in post_time:
-                        # Handle both 'Z' and '+00:00' formats
-                        post_time_str = post_time.replace('Z', '+00:00')
-                        post_time = datetime.fromisoformat(post_time_str)
-                    else:
-                        # Parse date-only format and make it UTC aware (start of day)
-                        post_time = datetime.strptime(post_time, '%Y-%m-%d')
-                        post_time = post_time.replace(tzinfo=timezone.utc)
-                except ValueError as e:
-                    print(f"DEBUG: Failed to parse timestamp '{post_time}' for post {post.get('id', 'unknown')}: {e}")
-                    # Try alternative parsing
-                    try:
-                        # Try parsing with different formats
-                        for fmt in ['%Y-%m-%d %H:%M:%S', '%Y/%m/%d', '%d-%m-%Y']:
-                            try:
-                                post_time = datetime.strptime(post_time, fmt)
-                                post_time = post_time.replace(tzinfo=timezone.utc)
-                                break
-                            except ValueError:
-                                continue
-                        else:
-                            print(f"DEBUG: Could not parse timestamp with any known format")
-                            continue
-                    except Exception as parse_error:
-                        print(f"DEBUG: All parsing attempts failed: {parse_error}")
-                        continue
-            elif isinstance(post_time, datetime):
-                # It's already a datetime object
-                pass
-            else:
-                print(f"DEBUG: Invalid timestamp type for post {post.get('id', 'unknown')}: {type(post_time)}")
+            selected.append(post_id)
+        
+        return selected
+
+    def page_posts(self, post_registry: Dict[str, Dict[str, Any]], sort: str = 'timestamp',
+                   descending: bool = True, limit: int = 50, cursor: Optional[str] = None,
+                   brand: Optional[str] = None, platform: Optional[str] = None, model: Optional[str] = None,
+                   min_confidence: Optional[float] = None, max_confidence: Optional[float] = None,
+                   start: Optional[int] = None, end: Optional[int] = None) -> Dict[str, Any]:
+        """One page of registry posts, in the order and cursor format of the database posts query"""
+        if sort not in POST_SORTS:
+            raise ValueError(f"Unsupported sort: {sort}")
+        model_key = model.strip().lower() if model else None
+        
+        def sort_value(post: Dict[str, Any]):
+            if sort == 'engagement':
+                return post.get('engagement')
+            epoch = post.get('timestamp_epoch')
+            return epoch if epoch is not None else to_utc_epoch(post.get('timestamp'))
+        
+        def matches(post: Dict[str, Any], timestamp: Optional[int]) -> bool:
+            if brand and post.get('brand') != brand:
+                return False
+            if platform and post.get('platform') != platform:
+                return False
+            if model_key and (post.get('model') or '').strip().lower() != model_key:
+                return False
+            confidence = post.get('classification_confidence')
+            if min_confidence is not None and (confidence is None or confidence < min_confidence):
+                return False
+            if max_confidence is not None and (confidence is None or confidence > max_confidence):
+                return False
+            if start is not None and (timestamp is None or timestamp < start):
+                return False
+            if end is not None and (timestamp is None or timestamp > end):
+                return False
+            return True
+        
+        # Missing values sort lowest, as they do in the databases
+        def order_key(value, post_key: str):
+            return (value is not None, value if value is not None else 0, post_key)
+        
+        rows = []
+        for post_key, post in post_registry.items():
+            timestamp = post.get('timestamp_epoch')
+            if timestamp is None and (start is not None or end is not None):
+                timestamp = to_utc_epoch(post.get('timestamp'))
+            if matches(post, timestamp):
+                value = sort_value(post)
+                rows.append((order_key(value, post_key), value, post_key, post))
+        
+        if cursor:
+            position = order_key(*decode_post_cursor(cursor, sort))
+            rows = [row for row in rows if (row[0] < position if descending else row[0] > position)]
+        
+        page = heapq.nlargest(limit + 1, rows, key=lambda row: row[0]) if descending \
+            else heapq.nsmallest(limit + 1, rows, key=lambda row: row[0])
+        
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_post_cursor(sort, page[-1][1], page[-1][2])
+        return {"posts": [row[3] for row in page], "next_cursor": next_cursor}
+
+    def get_engagement_order(self, brand_data: Dict[str, Any], 
+                             post_registry: Dict[str, Dict[str, Any]]) -> List[str]:
+        """Get the cached engagement ranking of a brand, building it for older analyses"""
+        if brand_data.get('engagement_order') is None:
+            brand_data['engagement_order'] = self.build_engagement_order(
+                self.get_brand_posts(brand_data, post_registry)
+            )
+        return brand_data['engagement_order']
+
+    def build_ranked_orders(self, engagement_order: List[str],
+                            post_registry: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Split an engagement ranking per platform, per model and per (platform, model)
+        
+        Filtered top/low posts are then read from either end of one list
+        instead of walking the whole ranking and checking every post.
+        """
+        orders = {}
+        for post_id in engagement_order:
+            post = post_registry.get(post_id)
+            if post is None:
+                continue
+            platform = post.get('platform') or ''
+            model_key = (post.get('model') or '').strip().lower()
+            for order_key in ((platform, None), (None, model_key), (platform, model_key)):
+                orders.setdefault(order_key, []).append(post_id)
+        
+        return [
+            {"platform": platform, "model": model_key, "post_ids": post_ids}
+            for (platform, model_key), post_ids in orders.items()
+        ]
+    
+    def get_ranked_order(self, brand_data: Dict[str, Any], post_registry: Dict[str, Dict[str, Any]],
+                         platform: Optional[str] = None, model: Optional[str] = None) -> List[str]:
+        """Get the cached engagement ranking of a brand for a platform and/or model filter"""
+        engagement_order = self.get_engagement_order(brand_data, post_registry)
+        model_key = model.strip().lower() if model else None
+        if not platform and not model_key:
+            return engagement_order
+        
+        if brand_data.get('ranked_orders') is None:
+            brand_data['ranked_orders'] = self.build_ranked_orders(engagement_order, post_registry)
+        for entry in brand_data['ranked_orders']:
+            if entry["platform"] == (platform or None) and entry["model"] == model_key:
+                return entry["post_ids"]
+        return []
+    
+    def build_time_index(self, posts: List[Dict[str, Any]]) -> Dict[str, List]:
+        """Sort post keys by UTC epoch timestamp for range lookups"""
+        entries = sorted(
+            (post['timestamp_epoch'], self.get_post_key(post))
+            for post in posts if post.get('timestamp_epoch') is not None
+        )
+        return {
+            "timestamps": [timestamp for timestamp, _ in entries],
+            "post_ids": [post_id for _, post_id in entries]
+        }
+
+    def get_time_index(self, brand_data: Dict[str, Any], 
+                       post_registry: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, List]]:
+        """Get the cached per-platform time index of a brand, building it for older analyses"""
+        if brand_data.get('time_index') is None:
+            brand_data['time_index'] = {
+                platform: self.build_time_index(self.resolve_posts(brand_data.get(platform, {}), post_registry))
+                for platform in ('instagram', 'facebook')
+            }
+        return brand_data['time_index']
+
+    def select_post_ids_by_time(self, time_index: Dict[str, List], time_filter: TimeFilter) -> List[str]:
+        """Resolve a time range to a slice of the time index"""
+        timestamps = time_index.get('timestamps', [])
+        start = bisect.bisect_left(timestamps, to_utc_epoch(time_filter.start_date))
+        end = bisect.bisect_right(timestamps, to_utc_epoch(time_filter.end_date))
+        return time_index.get('post_ids', [])[start:end]
+
+    def build_engagement_series(self, time_index: Dict[str, Dict[str, List]], 
+                                post_registry: Dict[str, Dict[str, Any]], granularity: str = 'day',
+                                start: Optional[int] = None, end: Optional[int] = None,
+                                max_points: int = 200, platform: Optional[str] = None) -> Dict[str, Any]:
+        """Bin post engagement per model over time, downsampled to at most max_points buckets"""
+        if granularity not in SERIES_GRANULARITIES:
+            raise ValueError(f"Unsupported granularity: {granularity}")
+        
+        # Slice each platform's time index to the requested range
+        timestamp_slices = []
+        post_ids = []
+        for platform_name, platform_index in time_index.items():
+            if platform and platform_name != platform:
                 continue
             
-            # Ensure post_time is timezone-aware (UTC)
-            if post_time.tzinfo is None:
-                post_time = post_time.replace(tzinfo=timezone.utc)
-            else:
-                # Convert to UTC if it has a different timezone
-                post_time = post_time.astimezone(timezone.utc)
+            timestamps = np.asarray(platform_index.get('timestamps', []), dtype=np.int64)
+            lo = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+            hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side='right'))
+            timestamp_slices.append(timestamps[lo:hi])
+            post_ids.extend(platform_index.get('post_ids', [])[lo:hi])
+        
+        timestamps = np.concatenate(timestamp_slices) if timestamp_slices else np.array([], dtype=np.int64)
+        if start is None or end is None:
+            if not len(timestamps):
+                return {"granularity": granularity, "bucket_seconds": SERIES_GRANULARITIES[granularity],
+                        "buckets": [], "series": {}}
+            start = int(timestamps.min()) if start is None else start
+            end = int(timestamps.max()) if end is None else end
+        
+        if end < start:
+            raise ValueError("Start date must be before end date")
+        
+        # Align buckets to the granularity (weeks start on Monday)
+        bucket_seconds = SERIES_GRANULARITIES[granularity]
+        anchor = WEEK_ANCHOR if granularity == 'week' else 0
+        origin = start - (start - anchor) % bucket_seconds
+        bucket_count = (end - origin) // bucket_seconds + 1
+        
+        # Merge adjacent buckets when the range would exceed max_points
+        if bucket_count > max_points:
+            bucket_seconds *= -(-bucket_count // max_points)
+            bucket_count = (end - origin) // bucket_seconds + 1
+        
+        buckets = (timestamps - origin) // bucket_seconds
+        model_names = [(post_registry[post_id].get('model') or '').strip() for post_id in post_ids]
+        model_codes, model_keys = pd.factorize(np.asarray([name.lower() for name in model_names], dtype=object))
+        engagement = np.fromiter(
+            (post_registry[post_id].get('engagement') or 0 for post_id in post_ids),
+            dtype=np.int64, count=len(post_ids)
+        )
+        
+        post_counts = np.zeros((len(model_keys), bucket_count), dtype=np.int64)
+        engagement_sums = np.zeros((len(model_keys), bucket_count), dtype=np.int64)
+        np.add.at(post_counts, (model_codes, buckets), 1)
+        np.add.at(engagement_sums, (model_codes, buckets), engagement)
+        
+        # Series are named like model_breakdown: each model's most used spelling across the brand
+        spellings = {}
+        for platform_index in time_index.values():
+            for post_id in platform_index.get('post_ids', []):
+                model = (post_registry[post_id].get('model') or '').strip()
+                model_spellings = spellings.setdefault(model.lower(), {})
+                model_spellings[model] = model_spellings.get(model, 0) + 1
+        
+        series = {}
+        for code, model_key in enumerate(model_keys):
+            label = display_name(spellings[model_key]) or 'unclassified'
+            series[label] = {
+                "posts": post_counts[code].tolist(),
+                "engagement": engagement_sums[code].tolist()
+            }
+        
+        return {
+            "granularity": granularity,
+            "bucket_seconds": int(bucket_seconds),
+            "buckets": [
+                datetime.fromtimestamp(origin + i * bucket_seconds, tz=timezone.utc).isoformat()
+                for i in range(bucket_count)
+            ],
+            "series": series
+        }
+
+    def filter_posts_by_time(self, posts: List[Dict[str, Any]], time_filter: TimeFilter) -> List[Dict[str, Any]]:
+        """Filter posts by time range"""
+        if not posts:
+            return []
+        
+        start = to_utc_epoch(time_filter.start_date)
+        end = to_utc_epoch(time_filter.end_date)
+        
+        filtered_posts = []
+        for post in posts:
+            timestamp = post.get('timestamp_epoch')
+            if timestamp is None:
+                # Posts that were never ingested through the registry
+                timestamp = to_utc_epoch(post.get('timestamp'))
             
-            # Now both datetimes are timezone-aware and in UTC, safe to compare
-            if start_date <= post_time <= end_date:
+            # Posts without a usable timestamp are skipped
+            if timestamp is not None and start <= timestamp <= end:
                 filtered_posts.append(post)
-                print(f"DEBUG: Post {post.get('id', 'unknown')} included (timestamp: {post_time})")
-            else:
-                print(f"DEBUG: Post {post.get('id', 'unknown')} excluded (timestamp: {post_time}, range: {start_date} to {end_date})")
         
-        print(f"DEBUG: Filtered {len(posts)} posts down to {len(filtered_posts)}")
+        logger.debug(f"Filtered {len(posts)} posts down to {len(filtered_posts)}")
         return filtered_posts
-    def export_to_csv(self, brands_data: Dict[str, Any], analysis_id: str, 
-                    time_filter: Optional[TimeFilter] = None) -> str:
-        """Export analysis results to CSV"""
-        try:
-            from datetime import timezone
-            
-            all_posts = []
-            
-            logger.info(f"Exporting CSV for {len(brands_data)} brands")
-            
-            for brand_name, brand_data in brands_data.items():
-                # Collect all posts from both platforms
-                instagram_posts = brand_data.get("instagram", {}).get("posts", [])
-                facebook_posts = brand_data.get("facebook", {}).get("posts", [])
-                
-                logger.info(f"Brand {brand_name}: {len(instagram_posts)} Instagram, {len(facebook_posts)} Facebook posts")
-                
-                brand_posts = instagram_posts + facebook_posts
-                
-                # Apply time filter if provided
-                if time_filter:
-                    original_count = len(brand_posts)
-                    try:
-                        brand_posts = self.filter_posts_by_time(brand_posts, time_filter)
-                        logger.info(f"Filtered {brand_name}: {original_count} -> {len(brand_posts)} posts")
-                    except Exception as e:
-                        logger.error(f"Error filtering posts for {brand_name}: {e}")
-                        # Continue without filtering rather than failing
-                        logger.warning(f"Proceeding with unfiltered posts for {brand_name}")
-                
-                # Add brand information to each post
-                for post in brand_posts:
-                    post_data = post.copy()
-                    post_data['brand'] = brand_name
-                    
-                    # Ensure timestamp is string for CSV
-                    timestamp = post_data.get('timestamp')
-                    if isinstance(timestamp, datetime):
-                        # Convert to UTC and format as ISO string
-                        if timestamp.tzinfo is None:
-                            timestamp = timestamp.replace(tzinfo=timezone.utc)
-                        else:
-                            timestamp = timestamp.astimezone(timezone.utc)
-                        post_data['timestamp'] = timestamp.isoformat()
-                    elif isinstance(timestamp, str):
-                        # Already a string, keep it as is
-                        post_data['timestamp'] = timestamp
-                    elif timestamp is None:
-                        post_data['timestamp'] = ''
-                    else:
-                        # Unknown type, convert to string
-                        post_data['timestamp'] = str(timestamp)
-                    
-                    # Convert lists to comma-separated strings
-                    if isinstance(post_data.get('hashtags'), list):
-                        post_data['hashtags'] = ', '.join(post_data['hashtags'])
-                    
-                    if isinstance(post_data.get('thumbnails'), list):
-                        post_data['thumbnails'] = ', '.join(post_data['thumbnails'])
-                    
-                    all_posts.append(post_data)
-            
-            logger.info(f"Total posts to export: {len(all_posts)}")
-            
-            # Ensure results directory exists
-            os.makedirs("results", exist_ok=True)
-            
-            # Convert to DataFrame
-            if all_posts:
-                df = pd.DataFrame(all_posts)
-                
-                # Select and order columns
-                desired_columns = [
-                    'brand', 'platform', 'model', 'timestamp', 'engagement', 
-                    'likes', 'comments', 'shares', 'reactions', 'url', 
-                    'caption', 'text', 'hashtags', 'thumbnail', 
-                    'classification_reason', 'classification_confidence'
-                ]
-                
-                # Only include columns that exist in the dataframe
-                available_columns = [col for col in desired_columns if col in df.columns]
-                df = df[available_columns]
-                
-                logger.info(f"DataFrame created with {len(df)} rows and {len(df.columns)} columns")
-            else:
-                # Create empty DataFrame with expected columns
-                logger.warning("No posts to export, creating empty DataFrame")
-                columns = [
-                    'brand', 'platform', 'model', 'timestamp', 'engagement', 
-                    'likes', 'comments', 'shares', 'reactions', 'url', 
-                    'caption', 'text', 'hashtags'
-                ]
-                df = pd.DataFrame(columns=columns)
-            
-            # Save to CSV
-            csv_path = f"results/analysis_{analysis_id}_results.csv"
-            df.to_csv(csv_path, index=False, encoding='utf-8')
-            
-            # Verify file was created
-            if not os.path.exists(csv_path):
-                raise Exception(f"CSV file was not created at {csv_path}")
-            
-            file_size = os.path.getsize(csv_path)
-            logger.info(f"CSV saved successfully: {csv_path} ({file_size} bytes)")
-            
-            return csv_path
-            
-        except Exception as e:
-            logger.error(f"Error in export_to_csv: {e}", exc_info=True)
-            raise
\ No newline at end of file
+
+    def collect_export_posts(self, brands_data: Dict[str, Any], time_filter: Optional[TimeFilter] = None,
+                             post_registry: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """Posts of every brand of an analysis, time filtered and labelled with their brand"""
+        posts = []
+        for brand_name, brand_data in brands_data.items():
+            brand_posts = (self.resolve_posts(brand_data.get("instagram", {}), post_registry or {})
+                           + self.resolve_posts(brand_data.get("facebook", {}), post_registry or {}))
+            if time_filter:
+                brand_posts = self.filter_posts_by_time(brand_posts, time_filter)
+            posts.extend({**post, 'brand': brand_name} for post in brand_posts)
+        return posts
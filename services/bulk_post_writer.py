@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BulkPostWriter:
+    """Buffers classified posts of an analysis and writes them in batches
+
+    A batch is written as soon as it is full, or flush_interval seconds
+    after its first post arrived, whichever comes first.
+    """
+
+    def __init__(self, db_service, analysis_id: str, batch_size: int = 500, flush_interval: float = 2.0):
+        self.db_service = db_service
+        self.analysis_id = analysis_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self._buffer: Dict[str, Dict[str, Any]] = {}
+        self._timer: Optional[asyncio.Task] = None
+        self._flushes = set()
+        self._lock = asyncio.Lock()
+        self._error: Optional[Exception] = None
+        self.cancelled = False
+
+    def add(self, post_key: str, post: Dict[str, Any]):
+        """Queue a post; a later add of the same key replaces it"""
+        if self.cancelled:
+            return
+        self._buffer[post_key] = post
+        if len(self._buffer) >= self.batch_size:
+            self._cancel_timer()
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    def _start_flush(self):
+        task = asyncio.create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.flush_interval)
+        except asyncio.CancelledError:
+            return
+        self._timer = None
+        await self.flush()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def flush(self):
+        """Write everything buffered so far as one batch"""
+        # Batches are written one after another so a re-added post keeps its latest version
+        async with self._lock:
+            if self.cancelled or not self._buffer:
+                return
+            batch, self._buffer = self._buffer, {}
+
+            try:
+                await self.db_service.save_posts(self.analysis_id, batch, batch_size=self.batch_size)
+                self.written += len(batch)
+            except Exception as e:
+                logger.error(f"Error writing {len(batch)} posts of analysis {self.analysis_id}: {e}")
+                # Put the batch back (without overwriting newer versions) for the next flush
+                self._buffer = {**batch, **self._buffer}
+                self._error = e
+
+    async def close(self):
+        """Write what is left; raises if posts could not be written"""
+        if self.cancelled:
+            return
+        self._cancel_timer()
+        if self._flushes:
+            await asyncio.gather(*self._flushes)
+        self._error = None
+        await self.flush()
+        if self._error is not None:
+            raise self._error
+
+    async def cancel(self):
+        """Drop buffered posts and stop writing, e.g. because the analysis was deleted
+
+        Returns once a batch already being written has finished, so nothing
+        of the analysis is written after it.
+        """
+        self.cancelled = True
+        self._cancel_timer()
+        self._buffer = {}
+        async with self._lock:
+            self._buffer = {}
@@ -1,17 +1,60 @@
 import sqlite3
 import json
 import logging
-from datetime import datetime
-from typing import Dict, Any, Optional
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List
 import os
 
+from services.metrics_aggregator import summarize_brands
+from utils.compression import compress_cold_fields, decompress_cold_fields
+from utils.cursors import POST_SORTS, decode_post_cursor, encode_post_cursor
+from utils.post_fields import attach_post_ids, merge_post, split_post, strip_post_lists
+from utils.projection import wants_field
+
 logger = logging.getLogger(__name__)
 
+# Per-post counters stored as columns so they can be summed in SQL
+POST_MEASURES = ['engagement', 'likes', 'comments', 'shares', 'reactions']
+
+# Posts written per transaction, so a large save never holds the write lock for long
+POST_WRITE_BATCH_SIZE = 500
+
 class DatabaseService:
-    def __init__(self, db_path: str = "social_media_analytics.db"):
-        self.db_path = db_path
+    """SQLite backend with the same async interface as the MongoDB service
+    
+    Queries run on a small thread pool; each worker thread keeps one
+    connection open in WAL mode, so readers never wait for the writer.
+    """
+    
+    def __init__(self, db_path: Optional[str] = None, pool_size: int = 4):
+        self.db_path = db_path or os.getenv('SQLITE_DATABASE_PATH', 'social_media_analytics.db')
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='sqlite')
         self.init_database()
     
+    def _connection(self) -> sqlite3.Connection:
+        """Connection of the current worker thread, opened on first use"""
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    async def _run(self, func, *args):
+        """Run a blocking query on the connection pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+    
     def _serialize_datetime_objects(self, obj):
         """Recursively convert datetime objects to JSON serializable format"""
         if isinstance(obj, dict):
@@ -21,20 +64,19 @@ class DatabaseService:
         elif isinstance(obj, datetime):
             return obj.isoformat()
         elif hasattr(obj, 'model_dump'):  # Pydantic model
-            return obj.model_dump()
+            return self._serialize_datetime_objects(obj.model_dump())
         elif hasattr(obj, '__dict__'):  # Regular class with attributes
             return {key: self._serialize_datetime_objects(value) for key, value in obj.__dict__.items()}
         else:
             return obj
-
+    
     def init_database(self):
-        """Initialize the database with required tables"""
+        """Initialize the database with required tables and indexes"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Analysis results table
-                cursor.execute('''
+            conn = self._connection()
+            with conn:
+                # Analysis results table (brands_data only holds rows written before brand_results)
+                conn.execute('''
                     CREATE TABLE IF NOT EXISTS analysis_results (
                         analysis_id TEXT PRIMARY KEY,
                         status TEXT NOT NULL,
@@ -44,12 +86,69 @@ class DatabaseService:
                         universal_filter TEXT,  -- JSON string
                         reference_images TEXT,  -- JSON string
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        version INTEGER NOT NULL DEFAULT 0  -- bumped on every write
                     )
                 ''')
                 
+                # Analysis tables created before records were versioned
+                analysis_columns = [row['name'] for row in conn.execute('PRAGMA table_info(analysis_results)')]
+                if 'version' not in analysis_columns:
+                    conn.execute('ALTER TABLE analysis_results ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+                
+                # One row per completed brand
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS brand_results (
+                        analysis_id TEXT NOT NULL,
+                        brand_name TEXT NOT NULL,
+                        data TEXT NOT NULL,  -- JSON string
+                        PRIMARY KEY (analysis_id, brand_name)
+                    )
+                ''')
+                
+                # Post content shared by every analysis that saw the post, with its latest counts
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS post_store (
+                        post_key TEXT PRIMARY KEY,
+                        platform TEXT,
+                        data TEXT NOT NULL,  -- JSON string
+                        cold_fields BLOB,  -- compressed JSON of the bulky fields
+                        updated_at TEXT
+                    )
+                ''')
+                
+                # One row per post of an analysis, with the filtered and summed fields as columns
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS posts (
+                        analysis_id TEXT NOT NULL,
+                        post_key TEXT NOT NULL,
+                        brand TEXT,
+                        platform TEXT,
+                        model_key TEXT,
+                        timestamp_epoch INTEGER,
+                        engagement INTEGER DEFAULT 0,
+                        likes INTEGER DEFAULT 0,
+                        comments INTEGER DEFAULT 0,
+                        shares INTEGER DEFAULT 0,
+                        reactions INTEGER DEFAULT 0,
+                        confidence REAL,
+                        data TEXT NOT NULL,  -- JSON string
+                        cold_fields BLOB,  -- compressed JSON of the bulky fields
+                        PRIMARY KEY (analysis_id, post_key)
+                    )
+                ''')
+                
+                # Post tables created before cold fields were compressed
+                post_columns = [row['name'] for row in conn.execute('PRAGMA table_info(posts)')]
+                if 'cold_fields' not in post_columns:
+                    conn.execute('ALTER TABLE posts ADD COLUMN cold_fields BLOB')
+                if 'confidence' not in post_columns:
+                    # Filled from the stored reference of posts written before the column existed
+                    conn.execute('ALTER TABLE posts ADD COLUMN confidence REAL')
+                    conn.execute("UPDATE posts SET confidence = json_extract(data, '$.classification_confidence')")
+                
                 # Brand configurations table
-                cursor.execute('''
+                conn.execute('''
                     CREATE TABLE IF NOT EXISTS brand_configs (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         analysis_id TEXT,
@@ -62,204 +161,750 @@ class DatabaseService:
                     )
                 ''')
                 
-                conn.commit()
-                logger.info("Database initialized successfully")
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_analysis_results_updated_at ON analysis_results (updated_at DESC)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_posts_brand_platform_time ON posts (analysis_id, brand, platform, timestamp_epoch)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_posts_model ON posts (analysis_id, model_key)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_posts_post_key ON posts (post_key)')
+                # Orders of the paginated posts query, with post_key as tie-breaker
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_posts_time_order ON posts (analysis_id, timestamp_epoch, post_key)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_posts_engagement_order ON posts (analysis_id, engagement, post_key)')
+                # Per-brand rankings for the ranked posts query, filtered by platform or model
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_posts_platform_ranking ON posts (analysis_id, brand, platform, engagement, post_key)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_posts_model_ranking ON posts (analysis_id, brand, model_key, engagement, post_key)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_brand_configs_analysis ON brand_configs (analysis_id, brand_name)')
                 
+                # Compact per-analysis records for the history listing
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS analysis_summaries (
+                        analysis_id TEXT PRIMARY KEY,
+                        status TEXT,
+                        progress INTEGER DEFAULT 0,
+                        message TEXT,
+                        brands TEXT,  -- JSON list
+                        brand_summaries TEXT,  -- JSON string
+                        total_posts INTEGER DEFAULT 0,
+                        total_engagement INTEGER DEFAULT 0,
+                        duration_seconds REAL,
+                        created_at TEXT,
+                        updated_at TEXT,
+                        completed_at TEXT
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS analysis_summary_brands (
+                        analysis_id TEXT NOT NULL,
+                        brand_name TEXT NOT NULL,
+                        PRIMARY KEY (analysis_id, brand_name)
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_summaries_updated ON analysis_summaries (updated_at DESC, analysis_id DESC)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_summaries_status ON analysis_summaries (status, updated_at DESC, analysis_id DESC)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_summary_brands_brand ON analysis_summary_brands (brand_name, analysis_id)')
+            
+            self._backfill_summaries()
+            
+            logger.info("Database initialized successfully")
+        
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
             raise
     
-    def save_analysis_result(self, analysis_id: str, data: Dict[str, Any]):
+    def _backfill_summaries(self):
+        """Create summaries for analyses saved before the summary table existed"""
+        conn = self._connection()
+        missing = [row['analysis_id'] for row in conn.execute('''
+            SELECT analysis_id FROM analysis_results
+            WHERE analysis_id NOT IN (SELECT analysis_id FROM analysis_summaries)
+        ''')]
+        
+        for analysis_id in missing:
+            document = self._get_analysis_result(analysis_id, include_posts=False)
+            if document is None:
+                continue
+            summary = {
+                "status": document['status'],
+                "progress": document['progress'],
+                "message": document['message'],
+                **summarize_brands(document['brands_data'])
+            }
+            if document['status'] == 'completed' and document['created_at'] and document['updated_at']:
+                summary["duration_seconds"] = (
+                    datetime.fromisoformat(document['updated_at']) - datetime.fromisoformat(document['created_at'])
+                ).total_seconds()
+            with conn:
+                self._write_summary(conn, analysis_id, summary,
+                                    created_at=document['created_at'], updated_at=document['updated_at'])
+        
+        if missing:
+            logger.info(f"Backfilled {len(missing)} analysis summaries")
+    
+    def _write_summary(self, conn: sqlite3.Connection, analysis_id: str, fields: Dict[str, Any],
+                       created_at: Optional[str] = None, updated_at: Optional[str] = None):
+        """Upsert the given summary fields, leaving the others as they are"""
+        now = datetime.utcnow().isoformat()
+        fields = dict(fields)
+        brands = fields.get('brands')
+        for field in ('brands', 'brand_summaries'):
+            if field in fields:
+                fields[field] = json.dumps(fields[field])
+        fields['updated_at'] = updated_at or now
+        
+        columns = ['analysis_id', 'created_at'] + list(fields)
+        assignments = ', '.join(f'{column} = excluded.{column}' for column in fields)
+        conn.execute(f'''
+            INSERT INTO analysis_summaries ({', '.join(columns)})
+            VALUES ({', '.join('?' * len(columns))})
+            ON CONFLICT (analysis_id) DO UPDATE SET {assignments}
+        ''', [analysis_id, created_at or now] + list(fields.values()))
+        
+        if brands is not None:
+            conn.execute('DELETE FROM analysis_summary_brands WHERE analysis_id = ?', (analysis_id,))
+            conn.executemany(
+                'INSERT INTO analysis_summary_brands (analysis_id, brand_name) VALUES (?, ?)',
+                [(analysis_id, brand_name) for brand_name in brands]
+            )
+    
+    async def create_indexes(self):
+        """Create tables and indexes (idempotent)"""
+        await self._run(self.init_database)
+    
+    async def save_analysis_result(self, analysis_id: str, data: Dict[str, Any]):
         """Save or update analysis result"""
+        await self._run(self._save_analysis_result, analysis_id, data)
+    
+    def _save_analysis_result(self, analysis_id: str, data: Dict[str, Any]):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Convert datetime objects to strings
-                data_copy = self._serialize_datetime_objects(data)
-                
-                # Convert complex data to JSON strings
-                brands_data_json = json.dumps(data_copy.get('brands_data', {}))
-                universal_filter_json = json.dumps(data_copy.get('universal_filter', {}))
-                reference_images_json = json.dumps(data_copy.get('reference_images', {}))
-                
-                # Insert or update
-                cursor.execute('''
-                    INSERT OR REPLACE INTO analysis_results 
-                    (analysis_id, status, progress, message, brands_data, 
-                     universal_filter, reference_images, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            # Convert datetime objects to strings
+            data_copy = self._serialize_datetime_objects(data)
+            
+            conn = self._connection()
+            with conn:
+                now = datetime.utcnow().isoformat()
+                conn.execute('''
+                    INSERT INTO analysis_results
+                    (analysis_id, status, progress, message, brands_data,
+                     universal_filter, reference_images, created_at, updated_at, version)
+                    VALUES (?, ?, ?, ?, NULL, ?, ?, ?, ?, 1)
+                    ON CONFLICT (analysis_id) DO UPDATE SET
+                        status = excluded.status,
+                        progress = excluded.progress,
+                        message = excluded.message,
+                        brands_data = NULL,
+                        universal_filter = excluded.universal_filter,
+                        reference_images = excluded.reference_images,
+                        updated_at = excluded.updated_at,
+                        version = analysis_results.version + 1
                 ''', (
                     analysis_id,
                     data.get('status', 'unknown'),
                     data.get('progress', 0),
                     data.get('message', ''),
-                    brands_data_json,
-                    universal_filter_json,
-                    reference_images_json
+                    json.dumps(data_copy.get('universal_filter', {})),
+                    json.dumps(data_copy.get('reference_images', {})),
+                    now,
+                    now
                 ))
                 
-                conn.commit()
-                logger.info(f"Analysis {analysis_id} saved to database")
+                conn.execute('DELETE FROM brand_results WHERE analysis_id = ?', (analysis_id,))
+                conn.executemany('''
+                    INSERT INTO brand_results (analysis_id, brand_name, data) VALUES (?, ?, ?)
+                ''', [
+                    (analysis_id, brand_name, json.dumps(strip_post_lists(brand_data)))
+                    for brand_name, brand_data in data_copy.get('brands_data', {}).items()
+                ])
                 
+                self._write_posts(conn, analysis_id, data_copy.get('post_registry', {}))
+                self._write_summary(conn, analysis_id, {
+                    "status": data.get('status', 'unknown'),
+                    "progress": data.get('progress', 0),
+                    "message": data.get('message', ''),
+                    **summarize_brands(data_copy.get('brands_data', {}))
+                })
+            
+            logger.info(f"Analysis {analysis_id} saved to database")
+        
         except Exception as e:
             logger.error(f"Error saving analysis result: {e}")
             raise
     
-    def get_analysis_result(self, analysis_id: str) -> Optional[Dict[str, Any]]:
-        """Retrieve analysis result from database"""
+    async def update_analysis_status(self, analysis_id: str, status: str, progress: int, message: str):
+        """Update only the small status fields of an analysis"""
+        await self._run(self._update_analysis_status, analysis_id, status, progress, message)
+    
+    def _update_analysis_status(self, analysis_id: str, status: str, progress: int, message: str):
+        try:
+            conn = self._connection()
+            with conn:
+                now = datetime.utcnow().isoformat()
+                conn.execute('''
+                    INSERT INTO analysis_results (analysis_id, status, progress, message, created_at, updated_at, version)
+                    VALUES (?, ?, ?, ?, ?, ?, 1)
+                    ON CONFLICT (analysis_id) DO UPDATE SET
+                        status = excluded.status,
+                        progress = excluded.progress,
+                        message = excluded.message,
+                        updated_at = excluded.updated_at,
+                        version = analysis_results.version + 1
+                ''', (analysis_id, status, progress, message, now, now))
+                self._write_summary(conn, analysis_id, {"status": status, "progress": progress, "message": message})
+        
+        except Exception as e:
+            logger.error(f"Error updating analysis status: {e}")
+            raise
+    
+    async def save_analysis_summary(self, analysis_id: str, brands_data: Dict[str, Any],
+                                    duration_seconds: Optional[float] = None):
+        """Record the brands, post counts and totals of a finished analysis for listings"""
+        await self._run(self._save_analysis_summary, analysis_id, brands_data, duration_seconds)
+    
+    def _save_analysis_summary(self, analysis_id: str, brands_data: Dict[str, Any],
+                               duration_seconds: Optional[float] = None):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT status, progress, message, brands_data, 
-                           universal_filter, reference_images
-                    FROM analysis_results 
-                    WHERE analysis_id = ?
-                ''', (analysis_id,))
-                
-                result = cursor.fetchone()
-                if result:
-                    return {
-                        'analysis_id': analysis_id,
-                        'status': result[0],
-                        'progress': result[1],
-                        'message': result[2],
-                        'brands_data': json.loads(result[3]) if result[3] else {},
-                        'universal_filter': json.loads(result[4]) if result[4] else {},
-                        'reference_images': json.loads(result[5]) if result[5] else {}
-                    }
+            summary = summarize_brands(self._serialize_datetime_objects(brands_data))
+            summary["duration_seconds"] = duration_seconds
+            summary["completed_at"] = datetime.utcnow().isoformat()
+            
+            conn = self._connection()
+            with conn:
+                self._write_summary(conn, analysis_id, summary)
+        
+        except Exception as e:
+            logger.error(f"Error saving analysis summary: {e}")
+            raise
+    
+    async def save_brand_result(self, analysis_id: str, brand_name: str, brand_data: Dict[str, Any],
+                                posts: Optional[Dict[str, Dict[str, Any]]] = None):
+        """Write one completed brand and its posts without touching the rest of the analysis"""
+        await self._run(self._save_brand_result, analysis_id, brand_name, brand_data, posts)
+    
+    def _save_brand_result(self, analysis_id: str, brand_name: str, brand_data: Dict[str, Any],
+                           posts: Optional[Dict[str, Dict[str, Any]]] = None):
+        try:
+            conn = self._connection()
+            with conn:
+                self._write_posts(conn, analysis_id, self._serialize_datetime_objects(posts or {}))
+                conn.execute('''
+                    INSERT OR REPLACE INTO brand_results (analysis_id, brand_name, data) VALUES (?, ?, ?)
+                ''', (analysis_id, brand_name, json.dumps(strip_post_lists(self._serialize_datetime_objects(brand_data)))))
+                conn.execute('''
+                    UPDATE analysis_results SET updated_at = ?, version = version + 1 WHERE analysis_id = ?
+                ''', (datetime.utcnow().isoformat(), analysis_id))
+            
+            logger.info(f"Brand {brand_name} of analysis {analysis_id} saved to database")
+        
+        except Exception as e:
+            logger.error(f"Error saving brand result: {e}")
+            raise
+    
+    async def save_posts(self, analysis_id: str, posts: Dict[str, Dict[str, Any]],
+                         batch_size: int = POST_WRITE_BATCH_SIZE):
+        """Upsert registry posts into the posts table"""
+        await self._run(self._save_posts, analysis_id, posts, batch_size)
+    
+    def _save_posts(self, analysis_id: str, posts: Dict[str, Dict[str, Any]],
+                    batch_size: int = POST_WRITE_BATCH_SIZE):
+        try:
+            conn = self._connection()
+            items = list(self._serialize_datetime_objects(posts).items())
+            for start in range(0, len(items), batch_size):
+                with conn:
+                    self._write_posts(conn, analysis_id, dict(items[start:start + batch_size]))
+        
+        except Exception as e:
+            logger.error(f"Error saving posts: {e}")
+            raise
+    
+    def _write_posts(self, conn: sqlite3.Connection, analysis_id: str, posts: Dict[str, Dict[str, Any]]):
+        if not posts:
+            return
+        
+        now = datetime.utcnow().isoformat()
+        store_rows = []
+        reference_rows = []
+        for post_key, post in posts.items():
+            content, reference = split_post({**post, 'post_key': post_key})
+            hot_fields, cold_fields = compress_cold_fields(content)
+            store_rows.append((post_key, post.get('platform'), json.dumps(hot_fields), cold_fields, now))
+            reference_rows.append((
+                analysis_id,
+                post_key,
+                post.get('brand'),
+                post.get('platform'),
+                (post.get('model') or '').strip().lower(),
+                post.get('timestamp_epoch'),
+                *[post.get(measure) or 0 for measure in POST_MEASURES],
+                post.get('classification_confidence'),
+                json.dumps(reference)
+            ))
+        
+        # The latest content and counts replace what earlier analyses stored
+        conn.executemany('''
+            INSERT OR REPLACE INTO post_store (post_key, platform, data, cold_fields, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', store_rows)
+        conn.executemany('''
+            INSERT OR REPLACE INTO posts
+            (analysis_id, post_key, brand, platform, model_key, timestamp_epoch,
+             engagement, likes, comments, shares, reactions, confidence, data, cold_fields)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)
+        ''', reference_rows)
+        logger.info(f"Saved {len(posts)} posts for analysis {analysis_id}")
+    
+    def _posts_where(self, analysis_id: str, brand: Optional[str] = None, platform: Optional[str] = None,
+                     start: Optional[int] = None, end: Optional[int] = None, model: Optional[str] = None):
+        clauses = ['analysis_id = ?']
+        params = [analysis_id]
+        if brand:
+            clauses.append('brand = ?')
+            params.append(brand)
+        if platform:
+            clauses.append('platform = ?')
+            params.append(platform)
+        if start is not None:
+            clauses.append('timestamp_epoch >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('timestamp_epoch <= ?')
+            params.append(end)
+        if model:
+            clauses.append('model_key = ?')
+            params.append(model.strip().lower())
+        return ' AND '.join(clauses), params
+    
+    async def get_posts(self, analysis_id: str, brand: Optional[str] = None, platform: Optional[str] = None,
+                        start: Optional[int] = None, end: Optional[int] = None,
+                        model: Optional[str] = None, include_cold_fields: bool = True) -> List[Dict[str, Any]]:
+        """Get posts of an analysis, filtered in SQL (start/end are UTC epoch seconds)
+        
+        Compressed cold fields (captions, thumbnails...) are only read and
+        decompressed when include_cold_fields is set.
+        """
+        return await self._run(self._get_posts, analysis_id, brand, platform, start, end, model, include_cold_fields)
+    
+    def _get_posts(self, analysis_id: str, brand: Optional[str] = None, platform: Optional[str] = None,
+                   start: Optional[int] = None, end: Optional[int] = None,
+                   model: Optional[str] = None, include_cold_fields: bool = True) -> List[Dict[str, Any]]:
+        try:
+            where, params = self._posts_where(analysis_id, brand, platform, start, end, model)
+            rows = self._connection().execute(f'''
+                SELECT {self._post_columns(include_cold_fields)}
+                FROM (SELECT * FROM posts WHERE {where}) AS p
+                LEFT JOIN post_store AS s ON s.post_key = p.post_key
+                ORDER BY p.timestamp_epoch
+            ''', params).fetchall()
+            return [self._post_from_row(row, include_cold_fields) for row in rows]
+        
+        except Exception as e:
+            logger.error(f"Error retrieving posts: {e}")
+            return []
+    
+    async def get_post_keys(self, analysis_id: str, brand: Optional[str] = None, platform: Optional[str] = None,
+                            start: Optional[int] = None, end: Optional[int] = None) -> List[str]:
+        """Keys of the filtered posts of an analysis in time order, read from the posts index only"""
+        return await self._run(self._get_post_keys, analysis_id, brand, platform, start, end)
+    
+    def _get_post_keys(self, analysis_id: str, brand: Optional[str] = None, platform: Optional[str] = None,
+                       start: Optional[int] = None, end: Optional[int] = None) -> List[str]:
+        try:
+            where, params = self._posts_where(analysis_id, brand, platform, start, end)
+            rows = self._connection().execute(f'''
+                SELECT post_key FROM posts WHERE {where} ORDER BY timestamp_epoch, post_key
+            ''', params).fetchall()
+            return [row['post_key'] for row in rows]
+        
+        except Exception as e:
+            logger.error(f"Error retrieving post keys: {e}")
+            return []
+    
+    def _post_columns(self, include_cold_fields: bool) -> str:
+        columns = 'p.data, s.data AS content'
+        if include_cold_fields:
+            columns += ', p.cold_fields, s.cold_fields AS content_cold_fields'
+        return columns
+    
+    def _post_from_row(self, row: sqlite3.Row, include_cold_fields: bool) -> Dict[str, Any]:
+        # Rows saved before the post store keep the whole post themselves
+        content = json.loads(row['content']) if row['content'] else {}
+        reference = json.loads(row['data'])
+        if include_cold_fields:
+            content.update(decompress_cold_fields(row['content_cold_fields']))
+            reference.update(decompress_cold_fields(row['cold_fields']))
+        return merge_post(content, reference)
+    
+    async def query_posts(self, analysis_id: str, sort: str = 'timestamp', descending: bool = True,
+                          limit: int = 50, cursor: Optional[str] = None, brand: Optional[str] = None,
+                          platform: Optional[str] = None, model: Optional[str] = None,
+                          min_confidence: Optional[float] = None, max_confidence: Optional[float] = None,
+                          start: Optional[int] = None, end: Optional[int] = None,
+                          include_cold_fields: bool = True) -> Dict[str, Any]:
+        """Get one page of filtered posts ordered by timestamp or engagement
+        
+        Pages are read by keyset on (sort value, post_key): pass next_cursor of
+        the previous page. Posts without a sort value come last when descending.
+        """
+        return await self._run(
+            self._query_posts, analysis_id, sort, descending, limit, cursor, brand, platform, model,
+            min_confidence, max_confidence, start, end, include_cold_fields
+        )
+    
+    def _query_posts(self, analysis_id: str, sort: str = 'timestamp', descending: bool = True,
+                     limit: int = 50, cursor: Optional[str] = None, brand: Optional[str] = None,
+                     platform: Optional[str] = None, model: Optional[str] = None,
+                     min_confidence: Optional[float] = None, max_confidence: Optional[float] = None,
+                     start: Optional[int] = None, end: Optional[int] = None,
+                     include_cold_fields: bool = True) -> Dict[str, Any]:
+        if sort not in POST_SORTS:
+            raise ValueError(f"Unsupported sort: {sort}")
+        column = 'timestamp_epoch' if sort == 'timestamp' else 'engagement'
+        
+        where, params = self._posts_where(analysis_id, brand, platform, start, end, model)
+        clauses = [where]
+        if min_confidence is not None:
+            clauses.append('confidence >= ?')
+            params.append(min_confidence)
+        if max_confidence is not None:
+            clauses.append('confidence <= ?')
+            params.append(max_confidence)
+        if cursor:
+            value, post_key = decode_post_cursor(cursor, sort)
+            keyset, keyset_params = self._keyset_clause(column, value, post_key, descending)
+            clauses.append(keyset)
+            params.extend(keyset_params)
+        
+        direction = 'DESC' if descending else 'ASC'
+        try:
+            rows = self._connection().execute(f'''
+                SELECT {self._post_columns(include_cold_fields)}, p.post_key, p.{column} AS sort_value
+                FROM (
+                    SELECT * FROM posts WHERE {' AND '.join(clauses)}
+                    ORDER BY {column} {direction}, post_key {direction}
+                    LIMIT ?
+                ) AS p
+                LEFT JOIN post_store AS s ON s.post_key = p.post_key
+                ORDER BY p.{column} {direction}, p.post_key {direction}
+            ''', params + [limit + 1]).fetchall()
+        
+        except Exception as e:
+            logger.error(f"Error querying posts: {e}")
+            return {"posts": [], "next_cursor": None}
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_post_cursor(sort, rows[-1]['sort_value'], rows[-1]['post_key'])
+        
+        return {
+            "posts": [self._post_from_row(row, include_cold_fields) for row in rows],
+            "next_cursor": next_cursor
+        }
+    
+    def _keyset_clause(self, column: str, value: Optional[Any], post_key: str, descending: bool):
+        """Rows after (value, post_key) in the page order; NULL sorts lowest, as SQLite does"""
+        if descending:
+            if value is None:
+                return f'({column} IS NULL AND post_key < ?)', [post_key]
+            return f'({column} < ? OR ({column} = ? AND post_key < ?) OR {column} IS NULL)', [value, value, post_key]
+        if value is None:
+            return f'(({column} IS NULL AND post_key > ?) OR {column} IS NOT NULL)', [post_key]
+        return f'({column} > ? OR ({column} = ? AND post_key > ?))', [value, value, post_key]
+    
+    async def aggregate_post_totals(self, analysis_id: str, brand: Optional[str] = None,
+                                    start: Optional[int] = None, end: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Sum post counts and engagement per (platform, model) in SQL"""
+        return await self._run(self._aggregate_post_totals, analysis_id, brand, start, end)
+    
+    def _aggregate_post_totals(self, analysis_id: str, brand: Optional[str] = None,
+                               start: Optional[int] = None, end: Optional[int] = None) -> List[Dict[str, Any]]:
+        try:
+            where, params = self._posts_where(analysis_id, brand, start=start, end=end)
+            sums = ', '.join(f'SUM({measure}) AS {measure}' for measure in POST_MEASURES)
+            rows = self._connection().execute(f'''
+                SELECT COALESCE(platform, '') AS platform,
+                       MIN(TRIM(COALESCE(json_extract(data, '$.model'), ''))) AS model,
+                       COUNT(*) AS posts, {sums}
+                FROM posts
+                WHERE {where}
+                GROUP BY platform, model_key
+            ''', params).fetchall()
+            return [dict(row) for row in rows]
+        
+        except Exception as e:
+            logger.error(f"Error aggregating posts: {e}")
+            return []
+    
+    async def get_analysis_version(self, analysis_id: str) -> Optional[int]:
+        """Version of a stored analysis (bumped on every write), None if it does not exist"""
+        return await self._run(self._get_analysis_version, analysis_id)
+    
+    def _get_analysis_version(self, analysis_id: str) -> Optional[int]:
+        row = self._connection().execute(
+            'SELECT version FROM analysis_results WHERE analysis_id = ?', (analysis_id,)
+        ).fetchone()
+        return row['version'] if row else None
+    
+    async def get_analysis_result(self, analysis_id: str, include_posts: bool = True,
+                                  include_cold_fields: bool = True,
+                                  fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Retrieve analysis result from database
+        
+        With fields, brands and posts are only read when a path asks for them;
+        the caller projects the document down to the exact paths.
+        """
+        return await self._run(self._get_analysis_result, analysis_id, include_posts, include_cold_fields, fields)
+    
+    def _get_analysis_result(self, analysis_id: str, include_posts: bool = True,
+                             include_cold_fields: bool = True,
+                             fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        try:
+            conn = self._connection()
+            result = conn.execute('''
+                SELECT status, progress, message, brands_data,
+                       universal_filter, reference_images, created_at, updated_at, version
+                FROM analysis_results
+                WHERE analysis_id = ?
+            ''', (analysis_id,)).fetchone()
+            
+            if not result:
                 return None
-                
+            
+            if fields is not None:
+                include_posts = include_posts and wants_field(fields, 'post_registry')
+            
+            # Rows written before brand_results keep their brands in one JSON blob
+            brands_data = {}
+            if wants_field(fields, 'brands_data'):
+                brands_data = json.loads(result['brands_data']) if result['brands_data'] else {}
+                for row in conn.execute('''
+                    SELECT brand_name, data FROM brand_results WHERE analysis_id = ?
+                ''', (analysis_id,)):
+                    brands_data[row['brand_name']] = json.loads(row['data'])
+            
+            document = {
+                'analysis_id': analysis_id,
+                'status': result['status'],
+                'progress': result['progress'],
+                'message': result['message'],
+                'brands_data': brands_data,
+                'universal_filter': json.loads(result['universal_filter']) if result['universal_filter'] else {},
+                'reference_images': json.loads(result['reference_images']) if result['reference_images'] else {},
+                'created_at': result['created_at'],
+                'updated_at': result['updated_at'],
+                'version': result['version']
+            }
+            
+            if include_posts:
+                posts = self._get_posts(analysis_id, include_cold_fields=include_cold_fields)
+                document['post_registry'] = {post['post_key']: post for post in posts}
+                attach_post_ids(brands_data, posts)
+            
+            return document
+        
         except Exception as e:
             logger.error(f"Error retrieving analysis result: {e}")
             return None
     
-    def list_analysis_results(self, limit: int = 10) -> list:
-        """Get list of recent analysis results"""
+    async def list_analysis_results(self, limit: int = 20, cursor: Optional[str] = None,
+                                    brand: Optional[str] = None, status: Optional[str] = None) -> Dict[str, Any]:
+        """Get a page of analysis summaries, newest first
+        
+        cursor is the next_cursor of the previous page; pages are read by
+        keyset on (updated_at, analysis_id), so deep pages cost the same as the first.
+        """
+        return await self._run(self._list_analysis_results, limit, cursor, brand, status)
+    
+    def _list_analysis_results(self, limit: int = 20, cursor: Optional[str] = None,
+                               brand: Optional[str] = None, status: Optional[str] = None) -> Dict[str, Any]:
+        clauses, params = [], []
+        if brand:
+            clauses.append('analysis_id IN (SELECT analysis_id FROM analysis_summary_brands WHERE brand_name = ?)')
+            params.append(brand)
+        if status:
+            clauses.append('status = ?')
+            params.append(status)
+        if cursor:
+            try:
+                updated_at, analysis_id = cursor.rsplit('|', 1)
+            except ValueError:
+                raise ValueError(f"Invalid cursor: {cursor}")
+            clauses.append('(updated_at < ? OR (updated_at = ? AND analysis_id < ?))')
+            params.extend([updated_at, updated_at, analysis_id])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT analysis_id, status, progress, message, updated_at
-                    FROM analysis_results 
-                    ORDER BY updated_at DESC
-                    LIMIT ?
-                ''', (limit,))
-                
-                results = cursor.fetchall()
-                return [
-                    {
-                        'analysis_id': row[0],
-                        'status': row[1],
-                        'progress': row[2],
-                        'message': row[3],
-                        'updated_at': row[4]
-                    }
-                    for row in results
-                ]
-                
+            rows = self._connection().execute(f'''
+                SELECT * FROM analysis_summaries
+                {where}
+                ORDER BY updated_at DESC, analysis_id DESC
+                LIMIT ?
+            ''', params + [limit + 1]).fetchall()
+            
+            results = []
+            for row in rows:
+                summary = dict(row)
+                summary['brands'] = json.loads(summary['brands']) if summary['brands'] else []
+                summary['brand_summaries'] = json.loads(summary['brand_summaries']) if summary['brand_summaries'] else {}
+                results.append(summary)
+            
+            next_cursor = None
+            if len(results) > limit:
+                results = results[:limit]
+                next_cursor = f"{results[-1]['updated_at']}|{results[-1]['analysis_id']}"
+            
+            return {"analyses": results, "next_cursor": next_cursor}
+        
         except Exception as e:
             logger.error(f"Error listing analysis results: {e}")
-            return []
+            return {"analyses": [], "next_cursor": None}
     
-    def save_brand_configs(self, analysis_id: str, brands_config: Dict[str, Any]):
+    async def save_brand_configs(self, analysis_id: str, brands_config: Dict[str, Any]):
         """Save brand configurations"""
+        await self._run(self._save_brand_configs, analysis_id, brands_config)
+    
+    def _save_brand_configs(self, analysis_id: str, brands_config: Dict[str, Any]):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                for brand_name, config in brands_config.items():
-                    # Handle both BrandConfig objects and dictionaries
-                    if hasattr(config, 'instagram_url'):
-                        # It's a BrandConfig object
-                        instagram_url = config.instagram_url
-                        facebook_url = config.facebook_url
-                        keywords = config.keywords
-                    else:
-                        # It's a dictionary
-                        instagram_url = config.get('instagram_url', '')
-                        facebook_url = config.get('facebook_url', '')
-                        keywords = config.get('keywords', [])
-                    
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO brand_configs 
-                        (analysis_id, brand_name, instagram_url, facebook_url, keywords)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (
-                        analysis_id,
-                        brand_name,
-                        instagram_url,
-                        facebook_url,
-                        json.dumps(keywords)
-                    ))
-                
-                conn.commit()
+            rows = []
+            for brand_name, config in brands_config.items():
+                # Handle both BrandConfig objects and dictionaries
+                if hasattr(config, 'instagram_url'):
+                    instagram_url = config.instagram_url
+                    facebook_url = config.facebook_url
+                    keywords = config.keywords
+                else:
+                    instagram_url = config.get('instagram_url', '')
+                    facebook_url = config.get('facebook_url', '')
+                    keywords = config.get('keywords', [])
                 
+                rows.append((analysis_id, brand_name, instagram_url, facebook_url, json.dumps(keywords)))
+            
+            conn = self._connection()
+            with conn:
+                # Replace existing configs for this analysis_id
+                conn.execute('DELETE FROM brand_configs WHERE analysis_id = ?', (analysis_id,))
+                conn.executemany('''
+                    INSERT INTO brand_configs
+                    (analysis_id, brand_name, instagram_url, facebook_url, keywords)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', rows)
+            
+            logger.info(f"Saved {len(rows)} brand configs for analysis {analysis_id}")
+        
         except Exception as e:
             logger.error(f"Error saving brand configs: {e}")
             raise
     
-    def get_brand_configs(self, analysis_id: str) -> Dict[str, Any]:
+    async def get_brand_configs(self, analysis_id: str) -> Dict[str, Any]:
         """Get brand configurations for an analysis"""
+        return await self._run(self._get_brand_configs, analysis_id)
+    
+    def _get_brand_configs(self, analysis_id: str) -> Dict[str, Any]:
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT brand_name, instagram_url, facebook_url, keywords
-                    FROM brand_configs 
-                    WHERE analysis_id = ?
-                ''', (analysis_id,))
-                
-                results = cursor.fetchall()
-                brand_configs = {}
-                
-                for row in results:
-                    brand_configs[row[0]] = {
-                        'instagram_url': row[1],
-                        'facebook_url': row[2],
-                        'keywords': json.loads(row[3]) if row[3] else []
-                    }
-                
-                return brand_configs
-                
+            rows = self._connection().execute('''
+                SELECT brand_name, instagram_url, facebook_url, keywords
+                FROM brand_configs
+                WHERE analysis_id = ?
+            ''', (analysis_id,)).fetchall()
+            
+            return {
+                row['brand_name']: {
+                    'instagram_url': row['instagram_url'],
+                    'facebook_url': row['facebook_url'],
+                    'keywords': json.loads(row['keywords']) if row['keywords'] else []
+                }
+                for row in rows
+            }
+        
         except Exception as e:
             logger.error(f"Error retrieving brand configs: {e}")
             return {}
     
-    def delete_analysis_result(self, analysis_id: str) -> bool:
+    async def delete_analysis_result(self, analysis_id: str) -> bool:
         """Delete analysis result and associated data"""
+        return await self._run(self._delete_analysis_result, analysis_id)
+    
+    def _delete_analysis_result(self, analysis_id: str) -> bool:
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
+            conn = self._connection()
+            with conn:
                 # Delete from all related tables
-                cursor.execute('DELETE FROM brand_configs WHERE analysis_id = ?', (analysis_id,))
-                cursor.execute('DELETE FROM analysis_results WHERE analysis_id = ?', (analysis_id,))
-                
-                deleted_count = cursor.rowcount
-                conn.commit()
-                
-                logger.info(f"Deleted analysis {analysis_id}, affected rows: {deleted_count}")
-                return deleted_count > 0
-                
+                self._prune_post_store(conn, [analysis_id])
+                for table in ('brand_configs', 'posts', 'brand_results', 'analysis_summaries', 'analysis_summary_brands'):
+                    conn.execute(f'DELETE FROM {table} WHERE analysis_id = ?', (analysis_id,))
+                deleted_count = conn.execute(
+                    'DELETE FROM analysis_results WHERE analysis_id = ?', (analysis_id,)
+                ).rowcount
+            
+            logger.info(f"Deleted analysis {analysis_id}, affected rows: {deleted_count}")
+            return deleted_count > 0
+        
         except Exception as e:
             logger.error(f"Error deleting analysis {analysis_id}: {e}")
             return False
     
-    def cleanup_old_results(self, days_old: int = 7):
-        """Clean up analysis results older than specified days"""
+    def _prune_post_store(self, conn: sqlite3.Connection, analysis_ids: List[str]):
+        """Delete stored posts referenced only by the given analyses (before their references go)"""
+        placeholders = ', '.join('?' * len(analysis_ids))
+        conn.execute(f'''
+            DELETE FROM post_store
+            WHERE post_key IN (SELECT post_key FROM posts WHERE analysis_id IN ({placeholders}))
+              AND NOT EXISTS (
+                  SELECT 1 FROM posts AS other
+                  WHERE other.post_key = post_store.post_key AND other.analysis_id NOT IN ({placeholders})
+              )
+        ''', analysis_ids + analysis_ids)
+    
+    async def cleanup_old_results(self, days_old: int = 7, batch_size: int = 100) -> List[str]:
+        """Clean up analysis results older than specified days, in batches; returns the deleted ids"""
+        return await self._run(self._cleanup_old_results, days_old, batch_size)
+    
+    def _cleanup_old_results(self, days_old: int = 7, batch_size: int = 100) -> List[str]:
+        deleted_ids = []
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    DELETE FROM analysis_results 
-                    WHERE updated_at < datetime('now', '-{} days')
-                '''.format(days_old))
-                
-                deleted_count = cursor.rowcount
-                conn.commit()
-                logger.info(f"Cleaned up {deleted_count} old analysis results")
-                
+            cutoff_date = (datetime.utcnow() - timedelta(days=days_old)).isoformat()
+            
+            conn = self._connection()
+            while True:
+                # One short transaction per batch, so writers are not held up
+                with conn:
+                    old_analysis_ids = [row['analysis_id'] for row in conn.execute(
+                        'SELECT analysis_id FROM analysis_results WHERE updated_at < ? LIMIT ?',
+                        (cutoff_date, batch_size)
+                    )]
+                    if not old_analysis_ids:
+                        break
+                    
+                    placeholders = ', '.join('?' * len(old_analysis_ids))
+                    self._prune_post_store(conn, old_analysis_ids)
+                    for table in ('brand_configs', 'posts', 'brand_results', 'analysis_summaries',
+                                  'analysis_summary_brands', 'analysis_results'):
+                        conn.execute(f'DELETE FROM {table} WHERE analysis_id IN ({placeholders})', old_analysis_ids)
+                deleted_ids.extend(old_analysis_ids)
+            
+            logger.info(f"Cleaned up {len(deleted_ids)} old analysis results")
+        
+        except Exception as e:
+            logger.error(f"Error cleaning up old results: {e}")
+        
+        return deleted_ids
+    
+    async def get_reference_images(self) -> List[Dict[str, Any]]:
+        """Reference images ({brand: {model: [paths]}}) of every stored analysis that has some"""
+        return await self._run(self._get_reference_images)
+    
+    def _get_reference_images(self) -> List[Dict[str, Any]]:
+        rows = self._connection().execute('''
+            SELECT reference_images FROM analysis_results
+            WHERE reference_images IS NOT NULL AND reference_images NOT IN ('', '{}')
+        ''').fetchall()
+        return [json.loads(row['reference_images']) for row in rows]
+    
+    def close(self):
+        """Close all pooled connections"""
+        try:
+            self._executor.shutdown(wait=True)
+            with self._connections_lock:
+                for conn in self._connections:
+                    conn.close()
+                self._connections.clear()
+            logger.info("SQLite connections closed")
         except Exception as e:
-            logger.error(f"Error cleaning up old results: {e}")
\ No newline at end of file
+            logger.error(f"Error closing SQLite connections: {e}")
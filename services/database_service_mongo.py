@@ -1,44 +1,155 @@
 import os
 import logging
-from datetime import datetime
-from typing import Dict, Any, Optional, List
-from pymongo import MongoClient, DESCENDING
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, List, Tuple
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DESCENDING, ASCENDING, ReplaceOne, UpdateOne
 from dotenv import load_dotenv
+from services.metrics_aggregator import summarize_brands
+from utils.compression import compress_cold_fields, decompress_cold_fields
+from utils.cursors import POST_SORTS, decode_post_cursor, encode_post_cursor
+from utils.post_fields import attach_post_ids, merge_post, split_post, strip_post_lists
+from utils.projection import covering_paths, wants_field
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Operations sent per bulk_write call when saving posts
+POST_WRITE_BATCH_SIZE = 500
+
 class DatabaseService:
     def __init__(self):
         mongodb_url = os.getenv('MONGODB_CONNECTION_STRING')
         if not mongodb_url:
             raise ValueError("MONGODB_CONNECTION_STRING not found in .env file")
         
-        self.client = MongoClient(mongodb_url)
+        # Motor keeps the event loop free while MongoDB answers
+        self.client = AsyncIOMotorClient(mongodb_url)
         self.db = self.client['social_media_analytics']
         
         # Collections
         self.analysis_collection = self.db['analyses']
         self.brand_configs_collection = self.db['brand_configs']
-        
-        # Create indexes
-        self._create_indexes()
-        logger.info("MongoDB connection established successfully")
+        self.posts_collection = self.db['posts']  # per-analysis post references
+        self.post_store_collection = self.db['post_store']  # post content shared across analyses
+        self.summaries_collection = self.db['analysis_summaries']
+        logger.info("MongoDB client created")
     
-    def _create_indexes(self):
+    async def create_indexes(self):
         """Create indexes for better query performance"""
         try:
             # Index on analysis_id for faster lookups
-            self.analysis_collection.create_index("analysis_id", unique=True)
-            self.analysis_collection.create_index([("updated_at", DESCENDING)])
+            await self.analysis_collection.create_index("analysis_id", unique=True)
+            await self.analysis_collection.create_index([("updated_at", DESCENDING)])
             
             # Index on brand configs
-            self.brand_configs_collection.create_index("analysis_id")
-            self.brand_configs_collection.create_index([("analysis_id", 1), ("brand_name", 1)])
+            await self.brand_configs_collection.create_index("analysis_id")
+            await self.brand_configs_collection.create_index([("analysis_id", 1), ("brand_name", 1)])
+            
+            # Each analysis references its posts by registry key; content lives in post_store
+            await self.posts_collection.create_index([("analysis_id", ASCENDING), ("post_key", ASCENDING)], unique=True)
+            await self.posts_collection.create_index([
+                ("analysis_id", ASCENDING), ("brand", ASCENDING),
+                ("platform", ASCENDING), ("timestamp", ASCENDING)
+            ])
+            await self.posts_collection.create_index([("analysis_id", ASCENDING), ("model_key", ASCENDING)])
+            await self.posts_collection.create_index("post_key")
+            # Orders of the paginated posts query, with post_key as tie-breaker
+            await self.posts_collection.create_index([
+                ("analysis_id", ASCENDING), ("timestamp", ASCENDING), ("post_key", ASCENDING)
+            ])
+            await self.posts_collection.create_index([
+                ("analysis_id", ASCENDING), ("engagement", ASCENDING), ("post_key", ASCENDING)
+            ])
+            # Per-brand rankings for the ranked posts query, filtered by platform or model
+            await self.posts_collection.create_index([
+                ("analysis_id", ASCENDING), ("brand", ASCENDING), ("platform", ASCENDING),
+                ("engagement", ASCENDING), ("post_key", ASCENDING)
+            ])
+            await self.posts_collection.create_index([
+                ("analysis_id", ASCENDING), ("brand", ASCENDING), ("model_key", ASCENDING),
+                ("engagement", ASCENDING), ("post_key", ASCENDING)
+            ])
+            
+            # Listing pages walk (updated_at, analysis_id) downwards, optionally per brand or status
+            await self.summaries_collection.create_index("analysis_id", unique=True)
+            await self.summaries_collection.create_index([("updated_at", DESCENDING), ("analysis_id", DESCENDING)])
+            await self.summaries_collection.create_index([
+                ("brands", ASCENDING), ("updated_at", DESCENDING), ("analysis_id", DESCENDING)
+            ])
+            await self.summaries_collection.create_index([
+                ("status", ASCENDING), ("updated_at", DESCENDING), ("analysis_id", DESCENDING)
+            ])
             
             logger.info("MongoDB indexes created successfully")
         except Exception as e:
             logger.warning(f"Error creating indexes: {e}")
+        
+        await self._backfill_summaries()
+        await self._backfill_post_store_analyses()
+    
+    async def _backfill_summaries(self):
+        """Create summaries for analyses saved before the summary collection existed"""
+        try:
+            cursor = self.analysis_collection.aggregate([
+                {"$lookup": {
+                    "from": self.summaries_collection.name,
+                    "localField": "analysis_id",
+                    "foreignField": "analysis_id",
+                    "as": "summary"
+                }},
+                {"$match": {"summary": {"$size": 0}}},
+                {"$project": {
+                    "_id": 0, "analysis_id": 1, "status": 1, "progress": 1, "message": 1,
+                    "created_at": 1, "updated_at": 1, "brands_data": 1
+                }}
+            ])
+            
+            backfilled = 0
+            async for document in cursor:
+                summary = summarize_brands(document.pop('brands_data', {}))
+                created_at, updated_at = document.get('created_at'), document.get('updated_at')
+                if document.get('status') == 'completed' and created_at and updated_at:
+                    summary["duration_seconds"] = (updated_at - created_at).total_seconds()
+                document.update(summary)
+                await self.summaries_collection.update_one(
+                    {"analysis_id": document["analysis_id"]},
+                    {"$setOnInsert": document},
+                    upsert=True
+                )
+                backfilled += 1
+            
+            if backfilled:
+                logger.info(f"Backfilled {backfilled} analysis summaries")
+        except Exception as e:
+            logger.warning(f"Error backfilling analysis summaries: {e}")
+    
+    async def _backfill_post_store_analyses(self):
+        """Record the referencing analyses of posts stored before the post store tracked them"""
+        try:
+            if not await self.post_store_collection.find_one({"analyses": {"$exists": False}}, {"_id": 1}):
+                return
+            
+            cursor = self.posts_collection.aggregate([
+                {"$group": {"_id": "$post_key", "analyses": {"$addToSet": "$analysis_id"}}}
+            ])
+            operations = []
+            async for row in cursor:
+                operations.append(UpdateOne(
+                    {"_id": row["_id"], "analyses": {"$exists": False}},
+                    {"$set": {"analyses": row["analyses"]}}
+                ))
+                if len(operations) >= POST_WRITE_BATCH_SIZE:
+                    await self.post_store_collection.bulk_write(operations, ordered=False)
+                    operations = []
+            if operations:
+                await self.post_store_collection.bulk_write(operations, ordered=False)
+            
+            # Stored posts nothing refers to are left for the next prune
+            await self.post_store_collection.update_many({"analyses": {"$exists": False}}, {"$set": {"analyses": []}})
+            logger.info("Backfilled the analyses of stored posts")
+        except Exception as e:
+            logger.warning(f"Error backfilling the analyses of stored posts: {e}")
     
     def _serialize_datetime_objects(self, obj):
         """Recursively convert datetime objects to ISO format strings"""
@@ -55,7 +166,7 @@ class DatabaseService:
         else:
             return obj
     
-    def save_analysis_result(self, analysis_id: str, data: Dict[str, Any]):
+    async def save_analysis_result(self, analysis_id: str, data: Dict[str, Any]):
         """Save or update analysis result in MongoDB"""
         try:
             # Serialize datetime objects
@@ -67,35 +178,428 @@ class DatabaseService:
                 "status": data.get('status', 'unknown'),
                 "progress": data.get('progress', 0),
                 "message": data.get('message', ''),
-                "brands_data": data_copy.get('brands_data', {}),
+                "brands_data": {
+                    brand_name: strip_post_lists(brand_data)
+                    for brand_name, brand_data in data_copy.get('brands_data', {}).items()
+                },
                 "universal_filter": data_copy.get('universal_filter', {}),
                 "reference_images": data_copy.get('reference_images', {}),
                 "updated_at": datetime.utcnow()
             }
             
             # Upsert (update if exists, insert if not)
-            self.analysis_collection.update_one(
+            await self.analysis_collection.update_one(
                 {"analysis_id": analysis_id},
                 {
                     "$set": update_document,
-                    "$setOnInsert": {"created_at": datetime.utcnow()}
+                    "$setOnInsert": {"created_at": datetime.utcnow()},
+                    "$inc": {"version": 1}
                 },
                 upsert=True
             )
             
+            # Posts live in their own collection, not in the analysis document
+            await self.save_posts(analysis_id, data.get('post_registry', {}))
+            
+            await self._update_summary(analysis_id, {
+                "status": update_document["status"],
+                "progress": update_document["progress"],
+                "message": update_document["message"],
+                **summarize_brands(update_document["brands_data"])
+            })
+            
             logger.info(f"Analysis {analysis_id} saved to MongoDB")
             
         except Exception as e:
             logger.error(f"Error saving analysis result to MongoDB: {e}")
             raise
     
-    def get_analysis_result(self, analysis_id: str) -> Optional[Dict[str, Any]]:
-        """Retrieve analysis result from MongoDB"""
+    async def update_analysis_status(self, analysis_id: str, status: str, progress: int, message: str):
+        """Update only the small status fields of an analysis"""
         try:
-            document = self.analysis_collection.find_one(
+            await self.analysis_collection.update_one(
                 {"analysis_id": analysis_id},
-                {"_id": 0}  # Exclude MongoDB's _id field
+                {
+                    "$set": {
+                        "status": status,
+                        "progress": progress,
+                        "message": message,
+                        "updated_at": datetime.utcnow()
+                    },
+                    "$setOnInsert": {"created_at": datetime.utcnow()},
+                    "$inc": {"version": 1}
+                },
+                upsert=True
+            )
+            await self._update_summary(analysis_id, {"status": status, "progress": progress, "message": message})
+        except Exception as e:
+            logger.error(f"Error updating analysis status in MongoDB: {e}")
+            raise
+    
+    async def save_analysis_summary(self, analysis_id: str, brands_data: Dict[str, Any],
+                                    duration_seconds: Optional[float] = None):
+        """Record the brands, post counts and totals of a finished analysis for listings"""
+        try:
+            summary = summarize_brands(self._serialize_datetime_objects(brands_data))
+            summary["duration_seconds"] = duration_seconds
+            summary["completed_at"] = datetime.utcnow()
+            await self._update_summary(analysis_id, summary)
+        except Exception as e:
+            logger.error(f"Error saving analysis summary to MongoDB: {e}")
+            raise
+    
+    async def _update_summary(self, analysis_id: str, fields: Dict[str, Any]):
+        now = datetime.utcnow()
+        await self.summaries_collection.update_one(
+            {"analysis_id": analysis_id},
+            {
+                "$set": {**fields, "updated_at": now},
+                "$setOnInsert": {"created_at": now}
+            },
+            upsert=True
+        )
+    
+    async def save_brand_result(self, analysis_id: str, brand_name: str, brand_data: Dict[str, Any],
+                          posts: Optional[Dict[str, Dict[str, Any]]] = None):
+        """Write one completed brand and its posts without touching the rest of the analysis"""
+        try:
+            # Post key lists are read from the posts collection, not stored with the brand
+            brand_copy = strip_post_lists(self._serialize_datetime_objects(brand_data))
+            
+            # Posts first, so a saved brand never refers to missing posts
+            await self.save_posts(analysis_id, posts or {})
+            
+            if self._is_safe_field_name(brand_name):
+                await self.analysis_collection.update_one(
+                    {"analysis_id": analysis_id},
+                    {
+                        "$set": {f"brands_data.{brand_name}": brand_copy, "updated_at": datetime.utcnow()},
+                        "$inc": {"version": 1}
+                    }
+                )
+            else:
+                # Names with dots or a leading $ cannot be used in a field path
+                await self.analysis_collection.update_one(
+                    {"analysis_id": analysis_id},
+                    [{
+                        "$set": {
+                            "brands_data": self._set_field_expression("brands_data", brand_name, brand_copy),
+                            "updated_at": datetime.utcnow(),
+                            "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+                        }
+                    }]
+                )
+            
+            logger.info(f"Brand {brand_name} of analysis {analysis_id} saved to MongoDB")
+            
+        except Exception as e:
+            logger.error(f"Error saving brand result to MongoDB: {e}")
+            raise
+    
+    def _is_safe_field_name(self, name: str) -> bool:
+        return bool(name) and '.' not in name and not name.startswith('$')
+    
+    def _set_field_expression(self, field: str, name: str, value: Any) -> Dict[str, Any]:
+        return {
+            "$setField": {
+                "field": {"$literal": name},
+                "input": {"$ifNull": [f"${field}", {}]},
+                "value": {"$literal": value}
+            }
+        }
+    
+    async def save_posts(self, analysis_id: str, posts: Dict[str, Dict[str, Any]],
+                         batch_size: int = POST_WRITE_BATCH_SIZE):
+        """Upsert post content into the shared post store and the analysis' references to it"""
+        if not posts:
+            return
+        
+        try:
+            items = list(posts.items())
+            for start in range(0, len(items), batch_size):
+                await self._write_post_batch(analysis_id, items[start:start + batch_size])
+            logger.info(f"Saved {len(items)} posts for analysis {analysis_id}")
+            
+        except Exception as e:
+            logger.error(f"Error saving posts to MongoDB: {e}")
+            raise
+    
+    async def _write_post_batch(self, analysis_id: str, items: List[Tuple[str, Dict[str, Any]]]):
+        store_operations = []
+        reference_operations = []
+        for post_key, post in items:
+            content, reference = split_post(self._serialize_datetime_objects(post))
+            store_operations.append(UpdateOne(
+                {"_id": post_key},
+                self._post_store_update(analysis_id, post_key, content),
+                upsert=True
+            ))
+            reference_operations.append(ReplaceOne(
+                {"analysis_id": analysis_id, "post_key": post_key},
+                self._post_reference_document(analysis_id, post_key, reference),
+                upsert=True
+            ))
+        
+        # Every operation targets its own key, so the server may apply them in any order;
+        # content still goes first, so a reference never points at a missing post
+        await self.post_store_collection.bulk_write(store_operations, ordered=False)
+        await self.posts_collection.bulk_write(reference_operations, ordered=False)
+    
+    def _post_store_document(self, content: Dict[str, Any]) -> Dict[str, Any]:
+        """Shared content of a post with its latest engagement counts and classification"""
+        document, cold_fields = compress_cold_fields(content)
+        if cold_fields is not None:
+            document["cold_fields"] = cold_fields
+        document["updated_at"] = datetime.utcnow()
+        return document
+    
+    def _post_store_update(self, analysis_id: str, post_key: str, content: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Replace the stored content of a post, as SQLite does, keeping the analyses that use it
+        
+        The analysis is added in the same atomic update, so a concurrent prune
+        never sees the post unreferenced while it is being saved.
+        """
+        return [{"$replaceWith": {"$mergeObjects": [
+            {"$literal": {**self._post_store_document(content), "_id": post_key}},
+            {"analyses": {"$setUnion": [{"$ifNull": ["$analyses", []]}, [analysis_id]]}}
+        ]}}]
+    
+    def _post_reference_document(self, analysis_id: str, post_key: str, reference: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-analysis reference to a stored post, with its query fields and engagement snapshot"""
+        document = dict(reference)
+        epoch = reference.get('timestamp_epoch')
+        document.update({
+            "analysis_id": analysis_id,
+            "post_key": post_key,
+            "model_key": (reference.get('model') or '').strip().lower()
+        })
+        if epoch is not None:
+            # Stored as a date so range queries use the compound index
+            document["timestamp"] = datetime.fromtimestamp(epoch, tz=timezone.utc)
+        return document
+    
+    def _post_from_documents(self, reference: Dict[str, Any], content: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Turn a stored reference and its shared content back into a registry post"""
+        content = dict(content or {})
+        content.pop('_id', None)
+        content.pop('updated_at', None)
+        content.pop('analyses', None)
+        content.update(decompress_cold_fields(content.pop('cold_fields', None)))
+        
+        reference.pop('_id', None)
+        reference.pop('analysis_id', None)
+        reference.pop('model_key', None)
+        # References saved before the post store carry the full post
+        reference.update(decompress_cold_fields(reference.pop('cold_fields', None)))
+        
+        timestamp = reference.pop('timestamp', None)
+        post = merge_post(content, reference)
+        if 'timestamp' not in post and isinstance(timestamp, datetime):
+            post['timestamp'] = timestamp.replace(tzinfo=timezone.utc).isoformat()
+        elif 'timestamp' not in post and timestamp is not None:
+            post['timestamp'] = timestamp
+        return post
+    
+    async def _prune_post_store(self, analysis_ids: List[str], post_keys: List[str]):
+        """Drop the analyses from their stored posts and delete the posts no analysis uses any more
+        
+        Each step is a single atomic update or filtered delete, so a post saved
+        concurrently by another analysis is never deleted under it.
+        """
+        if not post_keys:
+            return
+        await self.post_store_collection.update_many(
+            {"_id": {"$in": post_keys}}, {"$pull": {"analyses": {"$in": analysis_ids}}}
+        )
+        await self.post_store_collection.delete_many({"_id": {"$in": post_keys}, "analyses": {"$size": 0}})
+    
+    def _posts_query(self, analysis_id: str, brand: Optional[str] = None, platform: Optional[str] = None,
+                     start: Optional[int] = None, end: Optional[int] = None,
+                     model: Optional[str] = None) -> Dict[str, Any]:
+        query = {"analysis_id": analysis_id}
+        if brand:
+            query["brand"] = brand
+        if platform:
+            query["platform"] = platform
+        if start is not None or end is not None:
+            query["timestamp"] = {}
+            if start is not None:
+                query["timestamp"]["$gte"] = datetime.fromtimestamp(start, tz=timezone.utc)
+            if end is not None:
+                query["timestamp"]["$lte"] = datetime.fromtimestamp(end, tz=timezone.utc)
+        if model:
+            query["model_key"] = model.strip().lower()
+        return query
+    
+    async def get_posts(self, analysis_id: str, brand: Optional[str] = None, platform: Optional[str] = None,
+                        start: Optional[int] = None, end: Optional[int] = None,
+                        model: Optional[str] = None, include_cold_fields: bool = True) -> List[Dict[str, Any]]:
+        """Get posts of an analysis, filtered in MongoDB (start/end are UTC epoch seconds)
+        
+        Compressed cold fields (captions, thumbnails...) are only read and
+        decompressed when include_cold_fields is set.
+        """
+        try:
+            projection = None if include_cold_fields else {"cold_fields": 0}
+            cursor = self.posts_collection.find(
+                self._posts_query(analysis_id, brand, platform, start, end, model), projection
+            ).sort("timestamp", ASCENDING)
+            references = [document async for document in cursor]
+            return await self._posts_from_references(references, projection)
+            
+        except Exception as e:
+            logger.error(f"Error retrieving posts from MongoDB: {e}")
+            return []
+    
+    async def get_post_keys(self, analysis_id: str, brand: Optional[str] = None, platform: Optional[str] = None,
+                            start: Optional[int] = None, end: Optional[int] = None) -> List[str]:
+        """Keys of the filtered posts of an analysis in time order, read from the posts index only"""
+        try:
+            cursor = self.posts_collection.find(
+                self._posts_query(analysis_id, brand, platform, start, end), {"_id": 0, "post_key": 1}
+            ).sort([("timestamp", ASCENDING), ("post_key", ASCENDING)])
+            return [document["post_key"] async for document in cursor]
+            
+        except Exception as e:
+            logger.error(f"Error retrieving post keys from MongoDB: {e}")
+            return []
+    
+    async def _posts_from_references(self, references: List[Dict[str, Any]],
+                                     projection: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Join references with their shared content, keeping the reference order"""
+        contents = {}
+        if references:
+            store_cursor = self.post_store_collection.find(
+                {"_id": {"$in": [reference["post_key"] for reference in references]}}, projection
             )
+            contents = {document["_id"]: document async for document in store_cursor}
+        
+        return [
+            self._post_from_documents(reference, contents.get(reference["post_key"]))
+            for reference in references
+        ]
+    
+    async def query_posts(self, analysis_id: str, sort: str = 'timestamp', descending: bool = True,
+                          limit: int = 50, cursor: Optional[str] = None, brand: Optional[str] = None,
+                          platform: Optional[str] = None, model: Optional[str] = None,
+                          min_confidence: Optional[float] = None, max_confidence: Optional[float] = None,
+                          start: Optional[int] = None, end: Optional[int] = None,
+                          include_cold_fields: bool = True) -> Dict[str, Any]:
+        """Get one page of filtered posts ordered by timestamp or engagement
+        
+        Pages are read by keyset on (sort value, post_key): pass next_cursor of
+        the previous page. Posts without a sort value come last when descending.
+        """
+        if sort not in POST_SORTS:
+            raise ValueError(f"Unsupported sort: {sort}")
+        field = "timestamp" if sort == "timestamp" else "engagement"
+        
+        query = self._posts_query(analysis_id, brand, platform, start, end, model)
+        if min_confidence is not None or max_confidence is not None:
+            query["classification_confidence"] = {}
+            if min_confidence is not None:
+                query["classification_confidence"]["$gte"] = min_confidence
+            if max_confidence is not None:
+                query["classification_confidence"]["$lte"] = max_confidence
+        if cursor:
+            value, post_key = decode_post_cursor(cursor, sort)
+            if sort == "timestamp" and value is not None:
+                value = datetime.fromtimestamp(value, tz=timezone.utc)
+            query = {"$and": [query, self._keyset_clause(field, value, post_key, descending)]}
+        
+        try:
+            projection = None if include_cold_fields else {"cold_fields": 0}
+            direction = DESCENDING if descending else ASCENDING
+            documents = self.posts_collection.find(query, projection).sort(
+                [(field, direction), ("post_key", direction)]
+            ).limit(limit + 1)
+            references = [document async for document in documents]
+            
+            next_cursor = None
+            if len(references) > limit:
+                references = references[:limit]
+                last = references[-1]
+                # Timestamps travel as epoch seconds, like the start/end filters
+                value = last.get("timestamp_epoch") if sort == "timestamp" else last.get("engagement")
+                next_cursor = encode_post_cursor(sort, value, last["post_key"])
+            
+            return {
+                "posts": await self._posts_from_references(references, projection),
+                "next_cursor": next_cursor
+            }
+            
+        except Exception as e:
+            logger.error(f"Error querying posts from MongoDB: {e}")
+            return {"posts": [], "next_cursor": None}
+    
+    def _keyset_clause(self, field: str, value: Optional[Any], post_key: str, descending: bool) -> Dict[str, Any]:
+        """Documents after (value, post_key) in the page order; missing values sort lowest, as MongoDB does"""
+        after = "$lt" if descending else "$gt"
+        if value is None:
+            if descending:
+                return {field: None, "post_key": {"$lt": post_key}}
+            return {"$or": [{field: None, "post_key": {"$gt": post_key}}, {field: {"$ne": None}}]}
+        
+        clauses = [{field: {after: value}}, {field: value, "post_key": {after: post_key}}]
+        if descending:
+            clauses.append({field: None})
+        return {"$or": clauses}
+    
+    async def aggregate_post_totals(self, analysis_id: str, brand: Optional[str] = None,
+                              start: Optional[int] = None, end: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Sum post counts and engagement per (platform, model) with an aggregation pipeline"""
+        try:
+            pipeline = [
+                {"$match": self._posts_query(analysis_id, brand, start=start, end=end)},
+                {"$group": {
+                    "_id": {"platform": "$platform", "model_key": "$model_key"},
+                    "model": {"$first": {"$trim": {"input": {"$ifNull": ["$model", ""]}}}},
+                    "posts": {"$sum": 1},
+                    "engagement": {"$sum": {"$ifNull": ["$engagement", 0]}},
+                    "likes": {"$sum": {"$ifNull": ["$likes", 0]}},
+                    "comments": {"$sum": {"$ifNull": ["$comments", 0]}},
+                    "shares": {"$sum": {"$ifNull": ["$shares", 0]}},
+                    "reactions": {"$sum": {"$ifNull": ["$reactions", 0]}}
+                }}
+            ]
+            
+            rows = []
+            async for row in self.posts_collection.aggregate(pipeline):
+                group = row.pop('_id')
+                row["platform"] = group.get("platform") or ''
+                rows.append(row)
+            return rows
+            
+        except Exception as e:
+            logger.error(f"Error aggregating posts in MongoDB: {e}")
+            return []
+    
+    async def get_analysis_version(self, analysis_id: str) -> Optional[int]:
+        """Version of a stored analysis (bumped on every write), None if it does not exist"""
+        document = await self.analysis_collection.find_one({"analysis_id": analysis_id}, {"_id": 0, "version": 1})
+        if document is None:
+            return None
+        return document.get("version", 0)
+    
+    async def get_analysis_result(self, analysis_id: str, include_posts: bool = True,
+                                  include_cold_fields: bool = True,
+                                  fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Retrieve analysis result from MongoDB
+        
+        fields limits the document to those dotted paths (plus version); posts
+        are only loaded when fields asks for post_registry.
+        """
+        try:
+            projection = {"_id": 0}  # Exclude MongoDB's _id field
+            if fields is not None:
+                # Overlapping paths are a projection error in MongoDB
+                projection.update({
+                    field: 1 for field in covering_paths(fields) if not wants_field([field], 'post_registry')
+                })
+                projection["version"] = 1
+                include_posts = include_posts and wants_field(fields, 'post_registry')
+            
+            document = await self.analysis_collection.find_one({"analysis_id": analysis_id}, projection)
             
             if document:
                 # Convert datetime objects back for compatibility
@@ -104,6 +608,14 @@ class DatabaseService:
                 if 'created_at' in document and isinstance(document['created_at'], datetime):
                     document['created_at'] = document['created_at'].isoformat()
                 
+                if include_posts:
+                    # Analyses saved before the posts collection keep an embedded registry
+                    post_registry = document.setdefault('post_registry', {})
+                    posts = await self.get_posts(analysis_id, include_cold_fields=include_cold_fields)
+                    for post in posts:
+                        post_registry[post['post_key']] = post
+                    attach_post_ids(document.get('brands_data', {}), posts)
+                
                 return document
             
             return None
@@ -112,35 +624,59 @@ class DatabaseService:
             logger.error(f"Error retrieving analysis result from MongoDB: {e}")
             return None
     
-    def list_analysis_results(self, limit: int = 20) -> List[Dict[str, Any]]:
-        """Get list of recent analysis results from MongoDB"""
+    async def list_analysis_results(self, limit: int = 20, cursor: Optional[str] = None,
+                                    brand: Optional[str] = None, status: Optional[str] = None) -> Dict[str, Any]:
+        """Get a page of analysis summaries, newest first
+        
+        cursor is the next_cursor of the previous page; pages are read by
+        keyset on (updated_at, analysis_id), so deep pages cost the same as the first.
+        """
         try:
-            cursor = self.analysis_collection.find(
-                {},
-                {
-                    "_id": 0,
-                    "analysis_id": 1,
-                    "status": 1,
-                    "progress": 1,
-                    "message": 1,
-                    "updated_at": 1
-                }
-            ).sort("updated_at", DESCENDING).limit(limit)
+            query = {}
+            if brand:
+                query["brands"] = brand
+            if status:
+                query["status"] = status
+            if cursor:
+                updated_at, analysis_id = self._decode_cursor(cursor)
+                query["$or"] = [
+                    {"updated_at": {"$lt": updated_at}},
+                    {"updated_at": updated_at, "analysis_id": {"$lt": analysis_id}}
+                ]
+            
+            documents = self.summaries_collection.find(query, {"_id": 0}).sort(
+                [("updated_at", DESCENDING), ("analysis_id", DESCENDING)]
+            ).limit(limit + 1)
             
             results = []
-            for doc in cursor:
+            async for doc in documents:
                 # Convert datetime to ISO string
-                if 'updated_at' in doc and isinstance(doc['updated_at'], datetime):
-                    doc['updated_at'] = doc['updated_at'].isoformat()
+                for field in ('updated_at', 'created_at', 'completed_at'):
+                    if isinstance(doc.get(field), datetime):
+                        doc[field] = doc[field].isoformat()
                 results.append(doc)
             
-            return results
+            next_cursor = None
+            if len(results) > limit:
+                results = results[:limit]
+                next_cursor = f"{results[-1]['updated_at']}|{results[-1]['analysis_id']}"
             
+            return {"analyses": results, "next_cursor": next_cursor}
+            
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error listing analysis results from MongoDB: {e}")
-            return []
+            return {"analyses": [], "next_cursor": None}
+    
+    def _decode_cursor(self, cursor: str):
+        try:
+            updated_at, analysis_id = cursor.rsplit('|', 1)
+            return datetime.fromisoformat(updated_at), analysis_id
+        except ValueError:
+            raise ValueError(f"Invalid cursor: {cursor}")
     
-    def save_brand_configs(self, analysis_id: str, brands_config: Dict[str, Any]):
+    async def save_brand_configs(self, analysis_id: str, brands_config: Dict[str, Any]):
         """Save brand configurations to MongoDB"""
         try:
             documents = []
@@ -168,16 +704,16 @@ class DatabaseService:
             
             if documents:
                 # Delete existing configs for this analysis_id
-                self.brand_configs_collection.delete_many({"analysis_id": analysis_id})
+                await self.brand_configs_collection.delete_many({"analysis_id": analysis_id})
                 # Insert new configs
-                self.brand_configs_collection.insert_many(documents)
+                await self.brand_configs_collection.insert_many(documents)
                 logger.info(f"Saved {len(documents)} brand configs for analysis {analysis_id}")
             
         except Exception as e:
             logger.error(f"Error saving brand configs to MongoDB: {e}")
             raise
     
-    def get_brand_configs(self, analysis_id: str) -> Dict[str, Any]:
+    async def get_brand_configs(self, analysis_id: str) -> Dict[str, Any]:
         """Get brand configurations for an analysis from MongoDB"""
         try:
             cursor = self.brand_configs_collection.find(
@@ -186,9 +722,8 @@ class DatabaseService:
             )
             
             brand_configs = {}
-            for doc in cursor:
-                brand_name = doc.pop('analysis_id', None)  # Remove analysis_id from doc
-                doc.pop('analysis_id', None)  # Ensure it's removed
+            async for doc in cursor:
+                doc.pop('analysis_id', None)
                 brand_configs[doc['brand_name']] = {
                     'instagram_url': doc['instagram_url'],
                     'facebook_url': doc['facebook_url'],
@@ -201,14 +736,20 @@ class DatabaseService:
             logger.error(f"Error retrieving brand configs from MongoDB: {e}")
             return {}
     
-    def delete_analysis_result(self, analysis_id: str) -> bool:
+    async def delete_analysis_result(self, analysis_id: str) -> bool:
         """Delete analysis result and associated data from MongoDB"""
         try:
             # Delete brand configs
-            brand_result = self.brand_configs_collection.delete_many({"analysis_id": analysis_id})
+            await self.brand_configs_collection.delete_many({"analysis_id": analysis_id})
+            
+            # Delete post references (and posts no other analysis uses) and the listing summary
+            post_keys = await self.posts_collection.distinct("post_key", {"analysis_id": analysis_id})
+            await self.posts_collection.delete_many({"analysis_id": analysis_id})
+            await self._prune_post_store([analysis_id], post_keys)
+            await self.summaries_collection.delete_one({"analysis_id": analysis_id})
             
             # Delete analysis
-            analysis_result = self.analysis_collection.delete_one({"analysis_id": analysis_id})
+            analysis_result = await self.analysis_collection.delete_one({"analysis_id": analysis_id})
             
             deleted_count = analysis_result.deleted_count
             logger.info(f"Deleted analysis {analysis_id} from MongoDB. Affected documents: {deleted_count}")
@@ -219,37 +760,58 @@ class DatabaseService:
             logger.error(f"Error deleting analysis {analysis_id} from MongoDB: {e}")
             return False
     
-    def cleanup_old_results(self, days_old: int = 7):
-        """Clean up analysis results older than specified days"""
+    async def cleanup_old_results(self, days_old: int = 7, batch_size: int = 100) -> List[str]:
+        """Clean up analysis results older than specified days, in batches; returns the deleted ids"""
+        deleted_ids = []
         try:
             cutoff_date = datetime.utcnow() - timedelta(days=days_old)
             
-            # Find old analyses
-            old_analyses = self.analysis_collection.find(
-                {"updated_at": {"$lt": cutoff_date}},
-                {"analysis_id": 1}
-            )
-            
-            old_analysis_ids = [doc['analysis_id'] for doc in old_analyses]
-            
-            if old_analysis_ids:
-                # Delete old brand configs
-                self.brand_configs_collection.delete_many(
+            while True:
+                # Find a batch of old analyses
+                old_analyses = self.analysis_collection.find(
+                    {"updated_at": {"$lt": cutoff_date}},
+                    {"analysis_id": 1}
+                ).limit(batch_size)
+                
+                old_analysis_ids = [doc['analysis_id'] async for doc in old_analyses]
+                if not old_analysis_ids:
+                    break
+                
+                # Delete old brand configs and posts before their analyses
+                await self.brand_configs_collection.delete_many(
                     {"analysis_id": {"$in": old_analysis_ids}}
                 )
-                
-                # Delete old analyses
-                result = self.analysis_collection.delete_many(
-                    {"updated_at": {"$lt": cutoff_date}}
+                post_keys = await self.posts_collection.distinct(
+                    "post_key", {"analysis_id": {"$in": old_analysis_ids}}
                 )
-                
-                deleted_count = result.deleted_count
-                logger.info(f"Cleaned up {deleted_count} old analysis results from MongoDB")
+                await self.posts_collection.delete_many(
+                    {"analysis_id": {"$in": old_analysis_ids}}
+                )
+                await self._prune_post_store(old_analysis_ids, post_keys)
+                await self.summaries_collection.delete_many(
+                    {"analysis_id": {"$in": old_analysis_ids}}
+                )
+                await self.analysis_collection.delete_many(
+                    {"analysis_id": {"$in": old_analysis_ids}}
+                )
+                deleted_ids.extend(old_analysis_ids)
+            
+            if deleted_ids:
+                logger.info(f"Cleaned up {len(deleted_ids)} old analysis results from MongoDB")
             else:
                 logger.info("No old analysis results to clean up")
-                
+        
         except Exception as e:
             logger.error(f"Error cleaning up old results from MongoDB: {e}")
+        
+        return deleted_ids
+    
+    async def get_reference_images(self) -> List[Dict[str, Any]]:
+        """Reference images ({brand: {model: [paths]}}) of every stored analysis that has some"""
+        cursor = self.analysis_collection.find(
+            {"reference_images": {"$nin": [None, {}]}}, {"_id": 0, "reference_images": 1}
+        )
+        return [document["reference_images"] async for document in cursor]
     
     def close(self):
         """Close MongoDB connection"""
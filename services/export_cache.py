@@ -0,0 +1,140 @@
+import glob
+import hashlib
+import logging
+import os
+import re
+import shutil
+import uuid
+from typing import AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Separates the analysis, version and filter parts of a cached file name
+SEPARATOR = '--'
+
+
+class ExportCache:
+    """Generated export files keyed by (analysis, version, filter, format)
+
+    An entry is only ever hit for the exact analysis version it was built
+    from, and older versions are dropped as soon as a newer one is cached.
+    The least recently used files go first once max_bytes is exceeded.
+    """
+
+    def __init__(self, directory: str = "results/cache", max_bytes: int = 500 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _analysis_prefix(self, analysis_id: str) -> str:
+        # Ids come from the URL, so anything unusual is hashed rather than used in a path
+        if not re.fullmatch(r'[A-Za-z0-9_]+(-[A-Za-z0-9_]+)*', analysis_id):
+            analysis_id = hashlib.sha1(analysis_id.encode('utf-8')).hexdigest()
+        return analysis_id + SEPARATOR
+
+    def path_for(self, analysis_id: str, version: str, filter_key: str, fmt: str) -> str:
+        digest = hashlib.sha1(f"{filter_key}|{fmt}".encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, f"{self._analysis_prefix(analysis_id)}{version}{SEPARATOR}{digest}.{fmt}")
+
+    def get(self, analysis_id: str, version: str, filter_key: str, fmt: str, pin_path: str) -> bool:
+        """Link a cached export to pin_path and mark it as recently used; False if it is not cached
+
+        The caller sends pin_path and deletes it afterwards - the link keeps the
+        file readable even if the entry is evicted or invalidated meanwhile.
+        """
+        if not self._pin(self.path_for(analysis_id, version, filter_key, fmt), pin_path):
+            return False
+        try:
+            # Same file as the entry, so this refreshes the entry's LRU time
+            os.utime(pin_path)
+        except OSError:
+            pass
+        return True
+
+    def temp_path(self, path: str) -> str:
+        """Where to build an entry, so readers never see a partial file"""
+        return f"{path}.{uuid.uuid4().hex}.tmp"
+
+    def commit(self, temp_path: str, path: str, pin_path: Optional[str] = None) -> bool:
+        """Publish a built entry and drop the analysis' entries of other versions
+
+        With pin_path the built file is also linked there, as get() does.
+        False if the analysis was invalidated before the file could be kept.
+        """
+        if pin_path is not None and not self._pin(temp_path, pin_path):
+            return False
+        try:
+            os.replace(temp_path, path)
+        except FileNotFoundError:
+            # Invalidated while it was being built
+            return pin_path is not None
+        version_prefix = path[:path.rindex(SEPARATOR)]
+        prefix = os.path.join(self.directory, os.path.basename(path).split(SEPARATOR, 1)[0] + SEPARATOR)
+        for other in glob.glob(glob.escape(prefix) + '*'):
+            if not other.startswith(version_prefix + SEPARATOR) and not other.endswith('.tmp'):
+                self._remove(other)
+        self._evict(keep=path)
+        return True
+
+    def discard(self, temp_path: str):
+        self._remove(temp_path)
+
+    async def tee(self, chunks: AsyncIterator[str], path: str) -> AsyncIterator[str]:
+        """Pass text chunks through while writing them to the cache; only complete files are kept"""
+        temp_path = self.temp_path(path)
+        complete = False
+        try:
+            with open(temp_path, 'w', encoding='utf-8', newline='') as file:
+                async for chunk in chunks:
+                    file.write(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if complete:
+                self.commit(temp_path, path)
+            else:
+                # The client went away or the export failed
+                self.discard(temp_path)
+
+    def invalidate(self, analysis_id: str):
+        """Drop every cached export of an analysis"""
+        prefix = os.path.join(self.directory, self._analysis_prefix(analysis_id))
+        for path in glob.glob(glob.escape(prefix) + '*'):
+            self._remove(path)
+
+    def _evict(self, keep: Optional[str] = None):
+        """Remove least recently used entries until the cache fits, never the one just added"""
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if (entry.is_file(follow_symlinks=False) and not entry.name.endswith('.tmp')
+                        and entry.path != keep):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries) + (os.path.getsize(keep) if keep else 0)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            logger.info(f"Evicted cached export {path}")
+
+    def _pin(self, path: str, pin_path: str) -> bool:
+        try:
+            os.link(path, pin_path)
+        except FileNotFoundError:
+            return False
+        except OSError:
+            # No hard links on this filesystem - a copy pins it just as well
+            try:
+                shutil.copyfile(path, pin_path)
+            except FileNotFoundError:
+                return False
+        return True
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,248 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.quantile_sketch import KLLSketch
+
+# Per-post counters aggregated into metrics
+ENGAGEMENT_MEASURES = ['engagement', 'likes', 'comments', 'shares', 'reactions']
+PLATFORMS = ('instagram', 'facebook')
+SECONDS_PER_DAY = 86400
+
+
+def display_name(spellings: Dict[str, int]) -> str:
+    """Name shown for a model: its most used spelling, the first in sort order on a tie"""
+    return max(sorted(spellings), key=spellings.get)
+
+
+def add_to_scopes(scopes: Dict[str, Dict[str, Any]], platform: str, model_key: str,
+                  model_name: str, totals: Dict[str, Any], post_ids: Optional[List[str]] = None,
+                  engagement_values: Optional[Iterable[int]] = None):
+    """Add one (platform, model) aggregate to its platform and to the overall scope"""
+    targets = [scopes["overall"]]
+    if platform in PLATFORMS:
+        targets.append(scopes[platform])
+
+    for groups in targets:
+        entry = groups.get(model_key)
+        if entry is None:
+            entry = {"model": model_name, "posts": 0}
+            entry.update({measure: 0 for measure in ENGAGEMENT_MEASURES})
+            groups[model_key] = entry
+
+        entry["posts"] += int(totals.get("posts", 0))
+        for measure in ENGAGEMENT_MEASURES:
+            entry[measure] += int(totals.get(measure, 0))
+        if post_ids is not None:
+            entry.setdefault("post_ids", []).extend(post_ids)
+        if engagement_values is not None:
+            entry.setdefault("sketch", KLLSketch()).update_many(engagement_values)
+
+
+def metrics_from_groups(groups: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the metrics payload for one platform from its model groups"""
+    total_posts = sum(entry["posts"] for entry in groups.values())
+    totals = {
+        measure: sum(entry[measure] for entry in groups.values())
+        for measure in ENGAGEMENT_MEASURES
+    }
+    total_engagement = totals["engagement"]
+
+    metrics = {
+        "total_posts": total_posts,
+        "total_engagement": total_engagement,
+        "average_engagement": total_engagement / total_posts if total_posts > 0 else 0,
+        "total_likes": totals["likes"],
+        "total_comments": totals["comments"],
+        "total_shares": totals["shares"],
+        "total_reactions": totals["reactions"],
+        "model_breakdown": {}
+    }
+    
+    # Percentiles are only available when the groups carry engagement sketches
+    sketches = [entry["sketch"] for entry in groups.values() if entry["posts"] and "sketch" in entry]
+    if sketches:
+        merged = KLLSketch()
+        for sketch in sketches:
+            merged.merge(sketch)
+        metrics["engagement_percentiles"] = merged.percentiles()
+
+    # Model breakdown (posts without a model only count towards totals)
+    for model_key, entry in groups.items():
+        if not model_key or not entry["posts"]:
+            continue
+
+        model_engagement = entry["engagement"]
+        breakdown = {
+            "posts_count": entry["posts"],
+            "total_engagement": model_engagement,
+            "average_engagement": model_engagement / entry["posts"],
+            "engagement_rate": (model_engagement / total_engagement * 100) if total_engagement > 0 else 0
+        }
+        if "post_ids" in entry:
+            breakdown["post_ids"] = entry["post_ids"]
+        if "sketch" in entry:
+            breakdown["engagement_percentiles"] = entry["sketch"].percentiles()
+
+        metrics["model_breakdown"][entry["model"]] = breakdown
+
+    return metrics
+
+
+class MetricsAggregator:
+    """Keeps per-platform and per-model metrics current as posts are classified
+
+    Engagement sketches are also kept per (platform, model, UTC day) bucket, so
+    date ranges can be answered by merging buckets and a reclassified post only
+    rebuilds the bucket it left.
+    """
+
+    def __init__(self):
+        self.scopes = {"instagram": {}, "facebook": {}, "overall": {}}
+        # What each post added, so a reclassified post can be taken back out
+        self.contributions = {}
+        # (platform, model_key, day) -> model name, post keys and engagement sketch
+        self.buckets = {}
+        # model_key -> spelling -> posts, so every scope shows the same model name
+        self.spellings = {}
+        self._stale_buckets = set()
+        self._stale_sketches = set()
+
+    def add_post(self, post_key: str, post: Dict[str, Any]):
+        """Count a classified post, replacing its previous classification if any"""
+        if post_key in self.contributions:
+            self.remove_post(post_key)
+
+        model = (post.get('model') or '').strip()
+        totals = {measure: post.get(measure) or 0 for measure in ENGAGEMENT_MEASURES}
+        totals["posts"] = 1
+        epoch = post.get('timestamp_epoch')
+        day = epoch // SECONDS_PER_DAY if epoch is not None else None
+
+        contribution = (post.get('platform') or '', model.lower(), model, totals, day)
+        self.contributions[post_key] = contribution
+        spellings = self.spellings.setdefault(model.lower(), {})
+        spellings[model] = spellings.get(model, 0) + 1
+        add_to_scopes(self.scopes, *contribution[:4], engagement_values=[totals["engagement"]])
+
+        bucket_key = (contribution[0], contribution[1], day)
+        bucket = self.buckets.get(bucket_key)
+        if bucket is None:
+            bucket = {"model": model, "post_keys": set(), "sketch": KLLSketch()}
+            self.buckets[bucket_key] = bucket
+        bucket["post_keys"].add(post_key)
+        if bucket_key not in self._stale_buckets:
+            bucket["sketch"].update(totals["engagement"])
+
+    def remove_post(self, post_key: str):
+        """Take a post back out of the aggregates"""
+        contribution = self.contributions.pop(post_key, None)
+        if contribution is None:
+            return
+
+        platform, model_key, model_name, totals, day = contribution
+        add_to_scopes(self.scopes, platform, model_key, model_name,
+                      {measure: -value for measure, value in totals.items()})
+        spellings = self.spellings[model_key]
+        spellings[model_name] -= 1
+        if not spellings[model_name]:
+            del spellings[model_name]
+        
+        # Sketches cannot forget a value - only the post's own day bucket is
+        # rebuilt, and the scope sketches are re-merged from the buckets
+        bucket_key = (platform, model_key, day)
+        bucket = self.buckets[bucket_key]
+        bucket["post_keys"].discard(post_key)
+        if bucket["post_keys"]:
+            self._stale_buckets.add(bucket_key)
+        else:
+            del self.buckets[bucket_key]
+            self._stale_buckets.discard(bucket_key)
+        
+        for scope in ("overall", platform):
+            entry = self.scopes.get(scope, {}).get(model_key)
+            if entry is not None and entry.pop("sketch", None) is not None:
+                self._stale_sketches.add((scope, model_key))
+
+    def _refresh_sketches(self):
+        """Rebuild the sketches invalidated by reclassified posts"""
+        for bucket_key in self._stale_buckets:
+            bucket = self.buckets[bucket_key]
+            sketch = KLLSketch()
+            sketch.update_many(self.contributions[post_key][3]["engagement"] for post_key in bucket["post_keys"])
+            bucket["sketch"] = sketch
+        self._stale_buckets.clear()
+        
+        for scope, model_key in self._stale_sketches:
+            entry = self.scopes[scope].get(model_key)
+            if entry is None:
+                continue
+            
+            sketch = KLLSketch()
+            for (platform, bucket_model_key, _), bucket in self.buckets.items():
+                if bucket_model_key == model_key and scope in ("overall", platform):
+                    sketch.merge(bucket["sketch"])
+            entry["sketch"] = sketch
+        
+        self._stale_sketches.clear()
+
+    def snapshot(self, include_post_ids: bool = False) -> Dict[str, Any]:
+        """Current metrics per scope (instagram, facebook, overall), as stored with each brand
+
+        include_post_ids adds the post keys of each model breakdown, which
+        costs a pass over every post - the final result of a brand wants them,
+        live progress does not.
+        """
+        self._refresh_sketches()
+        post_ids = {}
+        if include_post_ids:
+            for post_key, (platform, model_key, *_) in self.contributions.items():
+                post_ids.setdefault(("overall", model_key), []).append(post_key)
+                if platform in PLATFORMS:
+                    post_ids.setdefault((platform, model_key), []).append(post_key)
+        
+        snapshot = {}
+        for scope, groups in self.scopes.items():
+            named_groups = {}
+            for model_key, entry in groups.items():
+                named_entry = {**entry, "model": self.model_name(model_key, entry["model"])}
+                if include_post_ids:
+                    named_entry["post_ids"] = post_ids.get((scope, model_key), [])
+                named_groups[model_key] = named_entry
+            snapshot[scope] = metrics_from_groups(named_groups)
+        return snapshot
+
+    def model_name(self, model_key: str, default: str = '') -> str:
+        """Display name of a model across all scopes"""
+        spellings = self.spellings.get(model_key)
+        return display_name(spellings) if spellings else default
+
+    def export_sketches(self) -> List[Dict[str, Any]]:
+        """Per (platform, model, day) engagement sketches for storing with the analysis"""
+        self._refresh_sketches()
+        return [
+            {
+                "platform": platform, "model": self.model_name(model_key, bucket["model"]),
+                "day": day, "sketch": bucket["sketch"].to_dict()
+            }
+            for (platform, model_key, day), bucket in self.buckets.items()
+            if platform in PLATFORMS
+        ]
+
+
+def summarize_brands(brands_data: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Compact per-analysis summary (brands, post counts, engagement) for listings"""
+    brand_summaries = {}
+    for brand_name, brand_data in (brands_data or {}).items():
+        overall = brand_data.get('overall_metrics') or {}
+        brand_summaries[brand_name] = {
+            "posts": overall.get('total_posts', 0),
+            "instagram_posts": (brand_data.get('instagram', {}).get('metrics') or {}).get('total_posts', 0),
+            "facebook_posts": (brand_data.get('facebook', {}).get('metrics') or {}).get('total_posts', 0),
+            "engagement": overall.get('total_engagement', 0)
+        }
+
+    return {
+        "brands": list(brand_summaries),
+        "brand_summaries": brand_summaries,
+        "total_posts": sum(summary["posts"] for summary in brand_summaries.values()),
+        "total_engagement": sum(summary["engagement"] for summary in brand_summaries.values())
+    }
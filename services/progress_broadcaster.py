@@ -0,0 +1,58 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Set
+
+logger = logging.getLogger(__name__)
+
+# Events after which an analysis sends nothing more
+TERMINAL_EVENTS = ('completed', 'error', 'deleted')
+
+
+def format_event(event: str, data: Dict[str, Any]) -> str:
+    """Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class ProgressBroadcaster:
+    """Fans progress events of running analyses out to their stream subscribers
+
+    Each event is serialized once, however many dashboards watch the analysis.
+    A subscriber that falls behind loses its oldest events rather than
+    holding up the analysis.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, analysis_id: str) -> asyncio.Queue:
+        """Queue that receives (event, message) pairs of the analysis"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(analysis_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, analysis_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(analysis_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[analysis_id]
+
+    def publish(self, analysis_id: str, event: str, data: Dict[str, Any]):
+        """Queue an event for every subscriber of the analysis"""
+        subscribers = self._subscribers.get(analysis_id)
+        if not subscribers:
+            return
+
+        message = format_event(event, data)
+        for queue in list(subscribers):
+            if queue.full():
+                # Later progress supersedes earlier progress
+                queue.get_nowait()
+            queue.put_nowait((event, message))
+
+        if event in TERMINAL_EVENTS:
+            # Subscribers stop once they read the terminal event
+            del self._subscribers[analysis_id]
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How many deleted analyses are remembered, so a late update cannot bring their progress back
+DISCARDED_MEMORY = 1000
+
+
+class ProgressPersister:
+    """Write-behind persistence of analysis progress
+
+    Updates arriving within the flush window are coalesced into a single
+    write of the latest values. Status transitions are written immediately,
+    so a restart never sees an analysis in an older state than it reached.
+    """
+
+    def __init__(self, db_service, window: float = 0.5):
+        self.db_service = db_service
+        self.window = window
+        self._pending: Dict[str, Tuple[str, int, str]] = {}
+        self._persisted_status: Dict[str, str] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Recently deleted analyses, whose progress must never be written again; the
+        # oldest are forgotten first, long after their last update could have arrived
+        self._discarded: 'OrderedDict[str, None]' = OrderedDict()
+
+    async def update(self, analysis_id: str, status: str, progress: int, message: str):
+        """Record the latest progress, writing now on a status change or later otherwise"""
+        if analysis_id in self._discarded:
+            return
+        self._pending[analysis_id] = (status, progress, message)
+
+        if status != self._persisted_status.get(analysis_id):
+            await self.flush(analysis_id)
+        elif analysis_id not in self._timers:
+            self._timers[analysis_id] = asyncio.create_task(self._flush_later(analysis_id))
+
+    async def _flush_later(self, analysis_id: str):
+        try:
+            await asyncio.sleep(self.window)
+        except asyncio.CancelledError:
+            return
+        self._timers.pop(analysis_id, None)
+        await self.flush(analysis_id)
+
+    async def flush(self, analysis_id: str):
+        """Write the pending progress of an analysis, if any"""
+        lock = self._locks.setdefault(analysis_id, asyncio.Lock())
+        async with lock:
+            pending = self._pending.pop(analysis_id, None)
+            if pending is None or analysis_id in self._discarded:
+                return
+
+            try:
+                await self.db_service.update_analysis_status(analysis_id, *pending)
+                self._persisted_status[analysis_id] = pending[0]
+            except Exception as e:
+                logger.error(f"Failed to save progress for {analysis_id}: {e}")
+                # Keep it for the next flush unless a newer update arrived meanwhile
+                self._pending.setdefault(analysis_id, pending)
+
+    async def close(self, analysis_id: str):
+        """Flush everything pending for a finished analysis and forget it"""
+        self._cancel_timer(analysis_id)
+        await self.flush(analysis_id)
+        self._forget(analysis_id)
+
+    async def discard(self, analysis_id: str):
+        """Drop pending progress without writing it (e.g. the analysis was deleted)
+
+        Returns once a write already in flight has finished; later updates of
+        the analysis are ignored, so its status row is never re-created.
+        """
+        self._discarded[analysis_id] = None
+        self._discarded.move_to_end(analysis_id)
+        while len(self._discarded) > DISCARDED_MEMORY:
+            self._discarded.popitem(last=False)
+        self._cancel_timer(analysis_id)
+        self._pending.pop(analysis_id, None)
+        lock = self._locks.get(analysis_id)
+        if lock is not None:
+            async with lock:
+                pass
+        self._forget(analysis_id)
+
+    def _cancel_timer(self, analysis_id: str):
+        timer: Optional[asyncio.Task] = self._timers.pop(analysis_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _forget(self, analysis_id: str):
+        self._persisted_status.pop(analysis_id, None)
+        self._locks.pop(analysis_id, None)
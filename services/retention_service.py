@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Reference image uploads made before an analysis id exists
+UPLOAD_DIR_PREFIXES = ('temp-', 'ref-')
+
+# Files generated by the download and export endpoints
+EXPORT_EXTENSIONS = ('.csv', '.parquet', '.arrow')
+
+
+class RetentionService:
+    """Periodically deletes expired analyses, orphaned uploads and stale exports
+
+    Disabled unless retention_days is positive. on_expired is awaited with the
+    id of every analysis a sweep deleted, to drop what the server still holds
+    for it outside the database.
+    """
+
+    def __init__(self, db_service, active_analysis: Dict[str, Dict[str, Any]],
+                 retention_days: int = 0, upload_max_age_hours: float = 24,
+                 export_max_age_hours: float = 24, interval_hours: float = 6,
+                 batch_size: int = 100, upload_root: str = "uploads/reference",
+                 results_dir: str = "results",
+                 on_expired: Optional[Callable[[str], Awaitable[None]]] = None):
+        self.db_service = db_service
+        self.active_analysis = active_analysis
+        self.retention_days = retention_days
+        self.on_expired = on_expired
+        self.upload_max_age = upload_max_age_hours * 3600
+        self.export_max_age = export_max_age_hours * 3600
+        self.interval = interval_hours * 3600
+        self.batch_size = batch_size
+        self.upload_root = upload_root
+        self.results_dir = results_dir
+        self.last_report: Optional[Dict[str, int]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.retention_days > 0
+
+    def start(self):
+        """Run sweeps in the background until stopped"""
+        if not self.enabled:
+            logger.info("Retention sweep disabled (RETENTION_DAYS is not set)")
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self) -> Dict[str, int]:
+        """Delete everything past retention once and report what was reclaimed"""
+        expired = await self.db_service.cleanup_old_results(self.retention_days, self.batch_size)
+        for analysis_id in expired:
+            if self.on_expired is not None:
+                await self.on_expired(analysis_id)
+
+        now = time.time()
+        upload_dirs = await self._orphaned_upload_dirs(now)
+        uploads_deleted, upload_bytes = await self._delete_in_batches(upload_dirs)
+
+        exports = self._stale_exports(now)
+        exports_deleted, export_bytes = await self._delete_in_batches(exports)
+
+        self.last_report = {
+            "analyses_deleted": len(expired),
+            "upload_dirs_deleted": uploads_deleted,
+            "exports_deleted": exports_deleted,
+            "bytes_reclaimed": upload_bytes + export_bytes
+        }
+        logger.info(f"Retention sweep: {self.last_report}")
+        return self.last_report
+
+    async def _referenced_upload_dirs(self) -> Set[str]:
+        """Upload directories used by running or stored analyses"""
+        # A failed read raises, so nothing is deleted without knowing what is referenced
+        stored = await self.db_service.get_reference_images()
+        running = [analysis.get("reference_images") for analysis in list(self.active_analysis.values())]
+
+        referenced = set()
+        for reference_images in running + stored:
+            for models in (reference_images or {}).values():
+                for paths in (models or {}).values():
+                    for path in paths or []:
+                        relative = os.path.relpath(os.path.normpath(path), self.upload_root)
+                        referenced.add(relative.split(os.sep, 1)[0])
+        return referenced
+
+    async def _orphaned_upload_dirs(self, now: float) -> List[str]:
+        if not os.path.isdir(self.upload_root):
+            return []
+
+        with os.scandir(self.upload_root) as entries:
+            candidates = [
+                entry for entry in entries
+                if entry.is_dir(follow_symlinks=False) and entry.name.startswith(UPLOAD_DIR_PREFIXES)
+                and now - self._last_modified(entry.path) > self.upload_max_age
+            ]
+        if not candidates:
+            return []
+
+        referenced = await self._referenced_upload_dirs()
+        return [entry.path for entry in candidates if entry.name not in referenced]
+
+    def _stale_exports(self, now: float) -> List[str]:
+        """Generated exports are rebuilt on the next download, so old ones can go"""
+        if not os.path.isdir(self.results_dir):
+            return []
+
+        with os.scandir(self.results_dir) as entries:
+            return [
+                entry.path for entry in entries
+                if entry.is_file(follow_symlinks=False) and entry.name.endswith(EXPORT_EXTENSIONS)
+                and now - entry.stat().st_mtime > self.export_max_age
+            ]
+
+    def _last_modified(self, path: str) -> float:
+        """Newest modification time of a directory tree"""
+        latest = os.path.getmtime(path)
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    latest = max(latest, os.path.getmtime(os.path.join(root, name)))
+                except OSError:
+                    continue
+        return latest
+
+    async def _delete_in_batches(self, paths: List[str]) -> Tuple[int, int]:
+        """Delete paths a batch at a time off the event loop; returns (count, bytes)"""
+        loop = asyncio.get_running_loop()
+        deleted = reclaimed = 0
+        for start in range(0, len(paths), self.batch_size):
+            batch_deleted, batch_bytes = await loop.run_in_executor(
+                None, self._delete_paths, paths[start:start + self.batch_size]
+            )
+            deleted += batch_deleted
+            reclaimed += batch_bytes
+        return deleted, reclaimed
+
+    def _delete_paths(self, paths: Iterable[str]) -> Tuple[int, int]:
+        deleted = reclaimed = 0
+        for path in paths:
+            try:
+                size = self._size_of(path)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                deleted += 1
+                reclaimed += size
+            except OSError as e:
+                logger.warning(f"Could not delete {path}: {e}")
+        return deleted, reclaimed
+
+    def _size_of(self, path: str) -> int:
+        if not os.path.isdir(path):
+            return os.path.getsize(path)
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, files in os.walk(path)
+            for name in files
+        )
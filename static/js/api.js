@@ -33,8 +33,9 @@ class API {
         }
     }
     
-    static async getRecentAnalyses() {
-        return await this.request('/api/recent-analyses');
+    static async getRecentAnalyses(cursor = null) {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        return await this.request(`/api/recent-analyses${query}`);
     }
     
     static async startAnalysis(data) {
@@ -44,8 +45,14 @@ class API {
         });
     }
     
-    static async getAnalysisStatus(analysisId) {
-        return await this.request(`/api/analysis/${analysisId}`);
+    static async getAnalysisStatus(analysisId, fields = null) {
+        // The browser revalidates with the ETag, so unchanged polls are 304s
+        const query = fields ? `?fields=${encodeURIComponent(fields)}` : '';
+        return await this.request(`/api/analysis/${analysisId}${query}`);
+    }
+    
+    static analysisEventsUrl(analysisId) {
+        return `/api/analysis/${analysisId}/events`;
     }
     
     static async uploadReferenceImages(formData) {
@@ -92,65 +99,22 @@ class API {
 
             console.log('Downloading from:', downloadUrl);
 
-            // Fetch the file
-            const response = await fetch(downloadUrl, {
-                method: 'GET',
-                credentials: 'same-origin'
-            });
-
-            if (!response.ok) {
-                const contentType = response.headers.get('content-type');
-                let errorMessage = `Download failed: HTTP ${response.status}`;
-                
-                if (contentType && contentType.includes('application/json')) {
-                    try {
-                        const errorData = await response.json();
-                        errorMessage = errorData.detail || errorMessage;
-                    } catch (e) {
-                        console.error('Failed to parse error response:', e);
-                    }
-                }
-                
-                throw new Error(errorMessage);
-            }
-
-            // Get the blob from response
-            const blob = await response.blob();
-            
-            // Verify blob is not empty
-            if (blob.size === 0) {
-                throw new Error('Downloaded file is empty');
-            }
-            
-            console.log('Download successful, file size:', blob.size, 'bytes');
-            
-            // Get filename from Content-Disposition header or use default
-            let filename = `social_media_analysis_${analysisId.substring(0, 8)}.csv`;
-            const contentDisposition = response.headers.get('Content-Disposition');
-            if (contentDisposition) {
-                const filenameMatch = contentDisposition.match(/filename[^;=\\n]*=((['"]).*?\\2|[^;\\n]*)/);
-                if (filenameMatch && filenameMatch[1]) {
-                    filename = filenameMatch[1].replace(/['"]/g, '');
-                }
-            }
+            // Fails fast if the analysis is gone - the download itself is a plain navigation
+            await this.getAnalysisStatus(analysisId, 'status');
 
-            // Create download link and trigger download
-            const url = window.URL.createObjectURL(blob);
+            // The CSV is streamed, so let the browser write it to disk as it arrives
+            // instead of collecting the whole file in a blob first
+            const filename = `social_media_analysis_${analysisId.substring(0, 8)}.csv`;
             const link = document.createElement('a');
-            link.href = url;
+            link.href = downloadUrl;
             link.download = filename;
             link.style.display = 'none';
             
             document.body.appendChild(link);
             link.click();
-            
-            // Cleanup
-            setTimeout(() => {
-                document.body.removeChild(link);
-                window.URL.revokeObjectURL(url);
-            }, 100);
+            document.body.removeChild(link);
 
-            return { success: true, filename, size: blob.size };
+            return { success: true, filename };
             
         } catch (error) {
             console.error('Download error:', error);
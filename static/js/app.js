@@ -6,6 +6,7 @@ class SocialMediaAnalytics {
         this.referenceImages = {};
         this.pollRetryCount = 0; // Add this
         this.maxRetries = 50; // Add this (50 retries = ~10 minutes with exponential backoff)
+        this.eventSource = null;
         
         this.init();
     }
@@ -34,6 +35,7 @@ class SocialMediaAnalytics {
         $(document).on('click', '.remove-brand', (e) => this.removeBrandConfig(e));
         $(document).on('click', '.load-analysis', (e) => this.loadPreviousAnalysis(e));
         $(document).on('click', '.delete-analysis', (e) => this.deleteAnalysis(e));
+        $(document).on('click', '.load-more-analyses', (e) => this.loadRecentAnalyses($(e.currentTarget).data('cursor')));
         $(document).on('click', '.post-thumbnail', (e) => this.openPostUrl(e));
         $(document).on('input', '.brand-name, .keywords', () => this.updateReferenceImagesSection());
         $(document).on('change', '.reference-image-input', (e) => this.handleReferenceImageUpload(e));
@@ -221,8 +223,8 @@ class SocialMediaAnalytics {
             this.pollRetryCount = 0; // Reset retry counter
             console.log('Analysis started:', this.currentAnalysisId);
             
-            // Start polling
-            setTimeout(() => this.pollAnalysisStatus(), 1000);
+            // Follow progress as the server pushes it
+            this.watchAnalysis();
             
         } catch (error) {
             console.error('Error starting analysis:', error);
@@ -328,6 +330,57 @@ class SocialMediaAnalytics {
     }
         
 
+    watchAnalysis() {
+        // Browsers without EventSource poll instead
+        if (!window.EventSource) {
+            setTimeout(() => this.pollAnalysisStatus(), 1000);
+            return;
+        }
+        
+        const analysisId = this.currentAnalysisId;
+        this.closeEventSource();
+        this.eventSource = new EventSource(API.analysisEventsUrl(analysisId));
+        
+        this.eventSource.addEventListener('progress', (event) => {
+            const data = JSON.parse(event.data);
+            UI.updateLoadingStatus({
+                message: data.message,
+                progress: data.progress
+            });
+        });
+        
+        this.eventSource.addEventListener('brand_completed', (event) => {
+            const data = JSON.parse(event.data);
+            UI.showToast(`${data.brand} analyzed (${data.posts} posts)`, 'info');
+        });
+        
+        // The full results are fetched once the stream ends. The analysis' own
+        // "error" event and a dropped connection both arrive as "error"; either
+        // way polling takes over and shows whatever state the analysis is in.
+        const finish = () => {
+            this.closeEventSource();
+            if (this.currentAnalysisId === analysisId) {
+                this.pollAnalysisStatus();
+            }
+        };
+        this.eventSource.addEventListener('completed', finish);
+        this.eventSource.addEventListener('error', finish);
+        this.eventSource.addEventListener('deleted', () => {
+            this.closeEventSource();
+            if (this.currentAnalysisId === analysisId) {
+                UI.showToast('This analysis was deleted', 'warning');
+                this.hideLoadingSection();
+            }
+        });
+    }
+    
+    closeEventSource() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+    }
+    
     async pollAnalysisStatus() {
         if (!this.currentAnalysisId) return;
         
@@ -338,7 +391,11 @@ class SocialMediaAnalytics {
         }
 
         try {
-            const data = await API.getAnalysisStatus(this.currentAnalysisId);
+            // Only the status fields while it runs; the full results once it has finished
+            let data = await API.getAnalysisStatus(this.currentAnalysisId, 'status,progress,message');
+            if (data.status === 'completed' || data.status === 'error') {
+                data = await API.getAnalysisStatus(this.currentAnalysisId);
+            }
             
             // Reset retry count on successful request
             this.pollRetryCount = 0;
@@ -413,7 +470,7 @@ class SocialMediaAnalytics {
         $('#downloadBtn').removeClass('hidden');
         $('#homeBtn').removeClass('hidden');
         
-        UI.renderBrandResults(data.brands_data);
+        UI.renderBrandResults(data.brands_data, data.post_registry || {});
         
         if (data.universal_filter) {
             const startDate = new Date(data.universal_filter.start_date);
@@ -425,6 +482,7 @@ class SocialMediaAnalytics {
     }
     
     goToHome() {
+        this.closeEventSource();
         this.currentAnalysisId = null;
         this.analysisData = null;
         this.referenceImages = {};
@@ -443,10 +501,10 @@ class SocialMediaAnalytics {
         this.updateReferenceImagesSection();
     }
     
-    async loadRecentAnalyses() {
+    async loadRecentAnalyses(cursor = null) {
         try {
-            const analyses = await API.getRecentAnalyses();
-            UI.displayAnalysesHistory(analyses);
+            const page = await API.getRecentAnalyses(cursor);
+            UI.displayAnalysesHistory(page.analyses, page.next_cursor, Boolean(cursor));
         } catch (error) {
             console.error('Error loading recent analyses:', error);
             $('#historyList').html('<p class="text-red-500 text-sm p-4">Error loading analyses</p>');
@@ -573,7 +631,7 @@ class SocialMediaAnalytics {
             if (response.filtered_results) {
                 // Clear and rebuild the results with filtered data
                 $('#brandResults').empty();
-                UI.renderBrandResults(response.filtered_results);
+                UI.renderBrandResults(response.filtered_results, this.analysisData?.post_registry || {});
                 UI.showToast('Time filter applied successfully', 'success');
             } else {
                 console.error('No filtered_results in response:', response);
@@ -69,11 +69,14 @@ class UI {
         }, 5000);
     }
     
-    static displayAnalysesHistory(analyses) {
+    static displayAnalysesHistory(analyses, nextCursor = null, append = false) {
         const container = $('#historyList');
-        container.empty();
+        container.find('.load-more-analyses').remove();
+        if (!append) {
+            container.empty();
+        }
         
-        if (analyses.length === 0) {
+        if (analyses.length === 0 && !append) {
             container.html('<p class="text-gray-500 text-sm p-4">No analyses found</p>');
             return;
         }
@@ -97,6 +100,9 @@ class UI {
                         </div>
                         <span class="text-xs text-gray-500">${date} ${time}</span>
                     </div>
+                    ${analysis.brands && analysis.brands.length ? `
+                        <p class="text-xs text-gray-700 mb-1">${analysis.brands.join(', ')} &middot; ${analysis.total_posts || 0} posts</p>
+                    ` : ''}
                     <p class="text-xs text-gray-600 mb-3 line-clamp-2">${analysis.message || 'No message'}</p>
                     <div class="flex items-center justify-between">
                         <span class="text-xs ${statusColor} font-medium">${analysis.status} (${analysis.progress || 0}%)</span>
@@ -119,9 +125,17 @@ class UI {
             `;
             container.append(analysisHtml);
         });
+        
+        if (nextCursor) {
+            container.append(`
+                <button class="load-more-analyses w-full text-xs text-blue-600 hover:text-blue-800 p-3" data-cursor="${nextCursor}">
+                    Load more
+                </button>
+            `);
+        }
     }
     
-    static renderBrandResults(brandsData) {
+    static renderBrandResults(brandsData, postRegistry = {}) {
         console.log('Rendering brand results:', brandsData);
         const container = $('#brandResults');
         container.empty(); // Always clear and rebuild for consistency
@@ -133,7 +147,7 @@ class UI {
 
         Object.entries(brandsData).forEach(([brandName, brandData]) => {
             console.log(`Creating card for brand: ${brandName}`, brandData);
-            const brandCard = this.createBrandCard(brandName, brandData);
+            const brandCard = this.createBrandCard(brandName, brandData, postRegistry);
             container.append(brandCard);
         });
         
@@ -144,7 +158,14 @@ class UI {
     // Remove the complex updateBrandMetrics function as it was causing issues
     // The simple rebuild approach is more reliable
     
-    static createBrandCard(brandName, brandData) {
+    // Results refer to posts by key; older analyses still embed the posts
+    static resolvePosts(posts, postRegistry) {
+        return (posts || []).map(post => typeof post === 'string' ? postRegistry[post] : post).filter(Boolean);
+    }
+    
+    static createBrandCard(brandName, brandData, postRegistry = {}) {
+        const instagramPosts = this.resolvePosts(brandData.instagram?.post_ids || brandData.instagram?.posts, postRegistry);
+        const facebookPosts = this.resolvePosts(brandData.facebook?.post_ids || brandData.facebook?.posts, postRegistry);
         const overallMetrics = brandData.overall_metrics || {};
         const modelBreakdown = overallMetrics.model_breakdown || {};
         
@@ -175,11 +196,11 @@ class UI {
         });
 
         // Create top and low performing posts
-        const topPosts = this.createPostsList(brandData.top_posts || [], 'Top Performing Posts', 'fa-trophy text-yellow-500');
-        const lowPosts = this.createPostsList(brandData.low_posts || [], 'Low Performing Posts', 'fa-chart-line-down text-red-500');
+        const topPosts = this.createPostsList(this.resolvePosts(brandData.top_posts, postRegistry), 'Top Performing Posts', 'fa-trophy text-yellow-500');
+        const lowPosts = this.createPostsList(this.resolvePosts(brandData.low_posts, postRegistry), 'Low Performing Posts', 'fa-chart-line-down text-red-500');
         
         // Create all posts breakdown by model
-        const allPosts = [...(brandData.instagram?.posts || []), ...(brandData.facebook?.posts || [])];
+        const allPosts = [...instagramPosts, ...facebookPosts];
         const postsByModel = this.createPostsByModel(allPosts, Object.keys(modelBreakdown));
 
         return `
@@ -203,7 +224,7 @@ class UI {
                         <h4>Instagram</h4>
                         <div class="metric-value">${(brandData.instagram?.profile?.followers || 0).toLocaleString()}</div>
                         <div class="metric-change">
-                            ${brandData.instagram?.posts?.length || 0} posts • 
+                            ${instagramPosts.length} posts • 
                             ${(brandData.instagram?.metrics?.total_engagement || 0).toLocaleString()} engagement
                         </div>
                     </div>
@@ -211,7 +232,7 @@ class UI {
                         <h4>Facebook</h4>
                         <div class="metric-value">${(brandData.facebook?.profile?.followers || 0).toLocaleString()}</div>
                         <div class="metric-change">
-                            ${brandData.facebook?.posts?.length || 0} posts • 
+                            ${facebookPosts.length} posts • 
                             ${(brandData.facebook?.metrics?.total_engagement || 0).toLocaleString()} engagement
                         </div>
                     </div>
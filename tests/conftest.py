@@ -0,0 +1,71 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DAY = 86400
+START = int(datetime(2024, 3, 4, tzinfo=timezone.utc).timestamp())
+
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    pytest.importorskip("httpx")
+    # main picks its backend and API key up at import time
+    os.environ["DATABASE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_DATABASE_PATH"] = str(tmp_path_factory.mktemp("db") / "analytics.db")
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    os.chdir(ROOT)
+    import main
+    return main
+
+
+@pytest.fixture(scope="session")
+def client(app_module):
+    from fastapi.testclient import TestClient
+    return TestClient(app_module.app)
+
+
+def make_posts():
+    """Three days of BYD posts: instagram Seal and Atto 3, facebook seal"""
+    posts = []
+    for day in range(3):
+        for index, (platform, model, engagement) in enumerate([
+            ("instagram", "Seal", 100), ("instagram", "Atto 3", 40), ("facebook", "seal", 10)
+        ]):
+            posts.append({
+                "id": f"{day}-{index}",
+                "platform": platform,
+                "model": model,
+                "engagement": engagement * (day + 1),
+                "likes": engagement,
+                "timestamp": datetime.fromtimestamp(START + day * DAY + 3600, tz=timezone.utc).isoformat()
+            })
+    return posts
+
+
+@pytest.fixture
+def analysis_document(app_module):
+    def build(status="completed"):
+        analyzer = app_module.AnalysisService()
+        post_registry = {}
+        posts = make_posts()
+        brand_data = {
+            platform: {"post_ids": analyzer.register_posts(
+                post_registry, [post for post in posts if post["platform"] == platform], "BYD"
+            )}
+            for platform in ("instagram", "facebook")
+        }
+        return {
+            "status": status,
+            "progress": 100,
+            "message": "",
+            "brands_data": {"BYD": brand_data},
+            "post_registry": post_registry,
+            "universal_filter": {},
+            "reference_images": {}
+        }
+    return build
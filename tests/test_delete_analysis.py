@@ -0,0 +1,167 @@
+import asyncio
+
+from services.bulk_post_writer import BulkPostWriter
+from services.progress_persister import ProgressPersister
+
+
+class SlowPostStore:
+    """Stands in for the database: each batch takes a moment to write"""
+
+    def __init__(self):
+        self.started = []
+        self.written = []
+
+    async def save_posts(self, analysis_id, posts, batch_size=500):
+        self.started.append(sorted(posts))
+        await asyncio.sleep(0.05)
+        self.written.append(sorted(posts))
+
+
+def test_cancelled_writer_drains_the_batch_in_flight_and_writes_nothing_else():
+    async def scenario():
+        store = SlowPostStore()
+        writer = BulkPostWriter(store, "analysis", batch_size=2, flush_interval=0.01)
+        writer.add("a", {})
+        writer.add("b", {})
+        await asyncio.sleep(0)
+        writer.add("c", {})
+
+        await writer.cancel()
+        assert store.written == [["a", "b"]]
+
+        writer.add("d", {})
+        await writer.flush()
+        await writer.close()
+        await asyncio.sleep(0.05)
+        assert store.started == [["a", "b"]]
+
+    asyncio.run(scenario())
+
+
+def test_release_stops_a_running_analysis_before_its_rows_go(app_module):
+    async def scenario():
+        store = SlowPostStore()
+        writer = BulkPostWriter(store, "running", batch_size=2, flush_interval=60)
+        app_module.post_writers["running"] = writer
+        app_module.active_analysis["running"] = {"status": "processing"}
+
+        async def classify():
+            for index in range(100):
+                writer.add(f"post-{index}", {})
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(classify())
+        app_module.analysis_tasks["running"] = task
+        await asyncio.sleep(0.015)
+
+        await app_module.release_analysis("running")
+        assert task.cancelled()
+        assert store.written == store.started == [["post-0", "post-1"]]
+        assert "running" not in app_module.active_analysis
+        assert "running" not in app_module.post_writers
+
+    asyncio.run(scenario())
+
+
+class SlowStatusStore:
+    def __init__(self):
+        self.statuses = []
+
+    async def update_analysis_status(self, analysis_id, status, progress, message):
+        await asyncio.sleep(0.05)
+        self.statuses.append((analysis_id, status, progress))
+
+
+def test_discarded_progress_is_never_written():
+    async def scenario():
+        store = SlowStatusStore()
+        persister = ProgressPersister(store, window=0.01)
+
+        # A coalesced write already in flight is waited for
+        await persister.update("writing", "processing", 10, "")
+        await persister.update("writing", "processing", 20, "")
+        await asyncio.sleep(0.02)
+        await persister.discard("writing")
+        assert store.statuses == [("writing", "processing", 10), ("writing", "processing", 20)]
+
+        # A pending one is dropped, and later updates are ignored
+        await persister.update("pending", "processing", 10, "")
+        await persister.update("pending", "processing", 20, "")
+        await persister.discard("pending")
+        await persister.update("pending", "error", 30, "")
+        await asyncio.sleep(0.1)
+        assert [status for status in store.statuses if status[0] == "pending"] == [("pending", "processing", 10)]
+
+    asyncio.run(scenario())
+
+
+class OnePostScraper:
+    async def scrape_instagram_posts(self, url, time_filter):
+        return [{"id": "1", "platform": "instagram", "engagement": 10, "timestamp": "2024-03-04T10:00:00+00:00"}]
+
+    async def scrape_facebook_posts(self, url, time_filter):
+        return []
+
+    async def scrape_instagram_profile(self, url):
+        return {}
+
+    async def scrape_facebook_profile(self, url):
+        return {}
+
+
+def test_delete_after_an_error_writes_none_of_the_failed_brands_posts(app_module, monkeypatch):
+    from data_models import BrandConfig, TimeFilter
+
+    class FailingAnalyzer(app_module.AnalysisService):
+        async def classify_posts_with_vision(self, posts, keywords, platform, brand_name,
+                                             reference_images=None, on_classified=None):
+            for post in posts:
+                on_classified({**post, "model": "Seal"})
+            raise RuntimeError("vision API down")
+
+    monkeypatch.setattr(app_module, "POST_WRITE_FLUSH_INTERVAL", 0.2)
+
+    async def scenario():
+        analysis_id = "failed-brand"
+        app_module.active_analysis[analysis_id] = {"status": "starting", "brands_data": {}, "universal_filter": {}}
+        brands_config = {"BYD": BrandConfig(instagram_url="i", facebook_url="f", keywords=["Seal"])}
+        time_filter = TimeFilter(start_date="2024-03-01T00:00:00+00:00", end_date="2024-03-31T00:00:00+00:00")
+
+        await app_module.process_analysis(analysis_id, brands_config, OnePostScraper(), FailingAnalyzer(),
+                                          time_filter, {})
+        assert app_module.active_analysis[analysis_id]["status"] == "error"
+        assert analysis_id not in app_module.post_writers
+
+        await app_module.release_analysis(analysis_id)
+        await app_module.db_service.delete_analysis_result(analysis_id)
+        await asyncio.sleep(0.3)
+        assert await app_module.db_service.get_posts(analysis_id) == []
+
+    asyncio.run(scenario())
+
+
+def test_deleting_a_running_analysis_ends_its_event_streams(app_module):
+    async def scenario():
+        app_module.active_analysis["streamed"] = {"status": "processing"}
+        queue = app_module.progress_broadcaster.subscribe("streamed")
+
+        await app_module.release_analysis("streamed")
+        event, message = queue.get_nowait()
+        assert event == "deleted" and '"status": "deleted"' in message
+        assert "streamed" not in app_module.progress_broadcaster._subscribers
+
+    asyncio.run(scenario())
+
+
+def test_persister_remembers_a_bounded_number_of_discarded_analyses(monkeypatch):
+    from services import progress_persister
+
+    monkeypatch.setattr(progress_persister, "DISCARDED_MEMORY", 3)
+
+    async def scenario():
+        persister = ProgressPersister(SlowStatusStore(), window=0.01)
+        for index in range(10):
+            await persister.discard(f"deleted-{index}")
+        assert list(persister._discarded) == ["deleted-7", "deleted-8", "deleted-9"]
+
+    asyncio.run(scenario())
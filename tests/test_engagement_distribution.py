@@ -0,0 +1,64 @@
+import uuid
+from datetime import datetime, timezone
+
+from conftest import DAY, START
+from services.metrics_aggregator import MetricsAggregator
+
+
+def iso(epoch):
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat()
+
+
+def test_reclassification_only_rebuilds_its_day_bucket():
+    aggregator = MetricsAggregator()
+    for day in range(3):
+        for index in range(4):
+            aggregator.add_post(f"instagram:{day}-{index}", {
+                "platform": "instagram", "model": "Seal", "engagement": 10 * (index + 1),
+                "timestamp_epoch": START + day * DAY
+            })
+    untouched = {key: bucket["sketch"] for key, bucket in aggregator.buckets.items()}
+
+    aggregator.add_post("instagram:1-0", {
+        "platform": "instagram", "model": "Dolphin", "engagement": 500, "timestamp_epoch": START + DAY
+    })
+    metrics = aggregator.snapshot()
+
+    changed = [key for key, sketch in untouched.items() if aggregator.buckets[key]["sketch"] is not sketch]
+    assert changed == [("instagram", "seal", START // DAY + 1)]
+    assert metrics["instagram"]["model_breakdown"]["Seal"]["posts_count"] == 11
+    assert metrics["instagram"]["model_breakdown"]["Dolphin"]["engagement_percentiles"]["p50"] == 500
+
+    entries = aggregator.export_sketches()
+    assert sorted(entry["sketch"]["count"] for entry in entries if entry["model"] == "Seal") == [3, 4, 4]
+
+
+def test_distribution_for_date_range(app_module, client, analysis_document):
+    analysis_id = str(uuid.uuid4())
+    app_module.active_analysis[analysis_id] = analysis_document(status="processing")
+    url = f"/api/analysis/{analysis_id}/engagement-distribution"
+    try:
+        body = client.get(url).json()
+        assert body["count"] == 9
+
+        # Day 1 only: instagram Seal 200, Atto 3 80, facebook seal 20
+        body = client.get(url, params={"start_date": iso(START + DAY), "end_date": iso(START + 2 * DAY - 1)}).json()
+        assert body["count"] == 3
+        assert body["percentiles"]["p50"] == 80
+
+        # A partial first day is answered from the posts, whole days from the sketches
+        body = client.get(url, params={
+            "start_date": iso(START + 1800), "end_date": iso(START + 3 * DAY - 1), "model": "seal"
+        }).json()
+        assert body["count"] == 6
+
+        body = client.get(url, params={
+            "start_date": iso(START + 7200), "end_date": iso(START + 2 * DAY + 1800), "platform": "facebook"
+        }).json()
+        assert body["count"] == 1
+        assert body["percentiles"]["p99"] == 20
+
+        response = client.get(url, params={"start_date": iso(START)})
+        assert response.status_code == 400
+    finally:
+        app_module.active_analysis.pop(analysis_id, None)
@@ -0,0 +1,69 @@
+import asyncio
+import io
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from conftest import DAY, START
+
+
+def test_columnar_export_of_stored_analysis_has_its_posts(app_module, client, analysis_document,
+                                                          monkeypatch, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    ipc = pytest.importorskip("pyarrow.ipc")
+    monkeypatch.setattr(app_module.export_cache, "directory", str(tmp_path))
+    analysis_id = str(uuid.uuid4())
+    asyncio.run(app_module.db_service.save_analysis_result(analysis_id, analysis_document()))
+
+    table = pq.read_table(io.BytesIO(client.get(f"/api/export/{analysis_id}?format=parquet").content))
+    assert table.num_rows == 9
+    assert set(table.column("brand").to_pylist()) == {"BYD"}
+
+    arrow = ipc.open_file(io.BytesIO(client.get(f"/api/export/{analysis_id}?format=arrow").content)).read_all()
+    assert arrow.num_rows == 9
+
+    time_filter = json.dumps({
+        "start_date": datetime.fromtimestamp(START + DAY + 1800, tz=timezone.utc).isoformat(),
+        "end_date": datetime.fromtimestamp(START + 3 * DAY - 1, tz=timezone.utc).isoformat()
+    })
+    filtered = client.get("/api/export", params={
+        "analysis_ids": analysis_id, "format": "parquet", "time_filter": time_filter
+    })
+    assert pq.read_table(io.BytesIO(filtered.content)).num_rows == 6
+
+
+def test_cached_export_stays_readable_after_eviction(tmp_path):
+    from services.export_cache import ExportCache
+
+    cache = ExportCache(str(tmp_path / "cache"))
+    path = cache.path_for("analysis", "v1", "all", "csv")
+    build_path = cache.temp_path(path)
+    with open(build_path, "w") as file:
+        file.write("id\n1\n")
+    assert cache.commit(build_path, path, pin_path=str(tmp_path / "first.csv"))
+
+    pinned = str(tmp_path / "second.csv")
+    assert cache.get("analysis", "v1", "all", "csv", pinned)
+    cache.invalidate("analysis")
+    assert not cache.get("analysis", "v1", "all", "csv", str(tmp_path / "third.csv"))
+    with open(pinned) as file:
+        assert file.read() == "id\n1\n"
+
+
+def test_cached_exports_are_sent_from_their_own_files(app_module, client, analysis_document,
+                                                      monkeypatch, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setattr(app_module.export_cache, "directory", str(tmp_path))
+    analysis_id = str(uuid.uuid4())
+    asyncio.run(app_module.db_service.save_analysis_result(analysis_id, analysis_document()))
+    before = set(os.listdir("results"))
+
+    for _ in range(2):
+        response = client.get(f"/api/export/{analysis_id}?format=parquet")
+        assert pq.read_table(io.BytesIO(response.content)).num_rows == 9
+        assert client.get(f"/api/download/{analysis_id}").text.count("\n") == 10
+    assert len(os.listdir(tmp_path)) == 2
+    assert set(os.listdir("results")) == before
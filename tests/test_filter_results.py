@@ -0,0 +1,134 @@
+import asyncio
+import copy
+import json
+import uuid
+
+from conftest import DAY, START
+from services.metrics_aggregator import MetricsAggregator
+
+
+def add_brand_caches(analyzer, brand_data, post_registry):
+    """The caches process_analysis stores for each brand"""
+    posts = analyzer.get_brand_posts(brand_data, post_registry)
+    aggregator = MetricsAggregator()
+    for post in posts:
+        aggregator.add_post(post["post_key"], post)
+    metrics = aggregator.snapshot(include_post_ids=True)
+    for platform in ("instagram", "facebook"):
+        brand_data[platform]["metrics"] = metrics[platform]
+    brand_data.update({
+        "overall_metrics": metrics["overall"],
+        "engagement_order": analyzer.build_engagement_order(posts),
+        "time_index": {
+            platform: analyzer.build_time_index([post for post in posts if post["platform"] == platform])
+            for platform in ("instagram", "facebook")
+        },
+        "daily_cube": analyzer.build_daily_cube(posts),
+        "keywords": []
+    })
+
+
+def completed_document(app_module, analysis_document):
+    """An analysis document with the caches process_analysis stores for each brand"""
+    document = analysis_document()
+    add_brand_caches(app_module.AnalysisService(), document["brands_data"]["BYD"], document["post_registry"])
+    return document
+
+
+def test_stored_brands_leave_post_lists_to_the_posts_table(app_module, client, analysis_document):
+    analysis_id = str(uuid.uuid4())
+    document = completed_document(app_module, analysis_document)
+    asyncio.run(app_module.db_service.save_analysis_result(analysis_id, document))
+
+    db_service = app_module.db_service
+    if hasattr(db_service, "_connection"):
+        row = db_service._connection().execute(
+            "SELECT data FROM brand_results WHERE analysis_id = ?", (analysis_id,)
+        ).fetchone()
+        stored = json.loads(row["data"])
+        assert "engagement_order" not in stored and "time_index" not in stored
+        assert "post_ids" not in stored["instagram"]
+        assert "post_ids" not in stored["overall_metrics"]["model_breakdown"]["Seal"]
+        assert stored["daily_cube"] == document["brands_data"]["BYD"]["daily_cube"]
+
+    body = client.get(f"/api/analysis/{analysis_id}").json()
+    brand_data = body["brands_data"]["BYD"]
+    assert sorted(brand_data["instagram"]["post_ids"]) == sorted(document["brands_data"]["BYD"]["instagram"]["post_ids"])
+    assert len(brand_data["facebook"]["post_ids"]) == 3
+
+
+def test_filter_results_of_stored_analysis_match_running(app_module, client, analysis_document):
+    document = completed_document(app_module, analysis_document)
+    stored_id, running_id = str(uuid.uuid4()), str(uuid.uuid4())
+    asyncio.run(app_module.db_service.save_analysis_result(stored_id, copy.deepcopy(document)))
+    app_module.active_analysis[running_id] = document
+
+    time_filter = {
+        "start_date": f"{START + DAY + 1800}",
+        "end_date": f"{START + 3 * DAY - 1}"
+    }
+    try:
+        running = client.post(f"/api/filter-results/{running_id}", json=time_filter).json()
+    finally:
+        app_module.active_analysis.pop(running_id, None)
+    stored = client.post(f"/api/filter-results/{stored_id}", json=time_filter).json()
+
+    assert stored == running
+    brand_result = stored["filtered_results"]["BYD"]
+    assert len(brand_result["instagram"]["post_ids"]) == 4
+    assert brand_result["overall_metrics"]["total_posts"] == 6
+    assert brand_result["top_posts"][0] == "BYD/instagram:2-0"
+    assert brand_result["low_posts"][0] == "BYD/facebook:1-2"
+
+
+def test_posts_scraped_for_two_brands_count_for_both(app_module, client, analysis_document):
+    document = analysis_document()
+    analyzer = app_module.AnalysisService()
+    # The same scraped posts (same ids, even the same dicts) under a second brand
+    posts = [post for post in document["post_registry"].values()]
+    document["brands_data"]["Tesla"] = {
+        platform: {"post_ids": analyzer.register_posts(
+            document["post_registry"], [post for post in posts if post["platform"] == platform], "Tesla"
+        )}
+        for platform in ("instagram", "facebook")
+    }
+    for brand_data in document["brands_data"].values():
+        add_brand_caches(analyzer, brand_data, document["post_registry"])
+    assert len(document["post_registry"]) == 18
+
+    stored_id, running_id = str(uuid.uuid4()), str(uuid.uuid4())
+    asyncio.run(app_module.db_service.save_analysis_result(stored_id, copy.deepcopy(document)))
+    assert len(asyncio.run(app_module.db_service.get_posts(stored_id))) == 18
+    app_module.active_analysis[running_id] = document
+
+    time_filter = {"start_date": f"{START}", "end_date": f"{START + 3 * DAY}"}
+    try:
+        running = client.post(f"/api/filter-results/{running_id}", json=time_filter).json()
+    finally:
+        app_module.active_analysis.pop(running_id, None)
+    stored = client.post(f"/api/filter-results/{stored_id}", json=time_filter).json()
+
+    assert stored == running
+    for brand_name in ("BYD", "Tesla"):
+        brand_result = stored["filtered_results"][brand_name]
+        assert brand_result["overall_metrics"]["total_posts"] == 9
+        assert brand_result["top_posts"][0] == f"{brand_name}/instagram:2-0"
+
+
+def test_analysis_response_leaves_brand_indexes_out_unless_asked(app_module, client, analysis_document):
+    document = completed_document(app_module, analysis_document)
+    stored_id, running_id = str(uuid.uuid4()), str(uuid.uuid4())
+    asyncio.run(app_module.db_service.save_analysis_result(stored_id, copy.deepcopy(document)))
+    app_module.active_analysis[running_id] = document
+    try:
+        for analysis_id in (running_id, stored_id):
+            brand_data = client.get(f"/api/analysis/{analysis_id}").json()["brands_data"]["BYD"]
+            assert not {"engagement_order", "time_index", "daily_cube"} & set(brand_data)
+            assert "post_ids" not in brand_data["overall_metrics"]["model_breakdown"]["Seal"]
+            assert len(brand_data["instagram"]["post_ids"]) == 6
+
+            asked = client.get(f"/api/analysis/{analysis_id}?fields=brands_data.BYD.daily_cube").json()
+            assert asked["brands_data"]["BYD"]["daily_cube"] == document["brands_data"]["BYD"]["daily_cube"]
+    finally:
+        app_module.active_analysis.pop(running_id, None)
+    assert "daily_cube" in document["brands_data"]["BYD"]
@@ -0,0 +1,70 @@
+import os
+import random
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from conftest import DAY, START
+from services.analysis_service import AnalysisService
+from services.metrics_aggregator import MetricsAggregator, add_to_scopes, display_name, metrics_from_groups
+
+SPELLINGS = ["Seal", "SEAL", "seal", "Atto 3", "atto 3", "Dolphin", ""]
+
+
+def make_post(index, rng):
+    return {
+        "id": str(index),
+        "platform": rng.choice(["instagram", "facebook"]),
+        "model": rng.choice(SPELLINGS),
+        "engagement": rng.randint(0, 500),
+        "likes": rng.randint(0, 50),
+        "comments": rng.randint(0, 5),
+        "timestamp_epoch": START + rng.randint(0, 5 * DAY)
+    }
+
+
+def expected_metrics(posts):
+    """Metrics of keyed posts computed in one batch, to check the incremental bookkeeping against"""
+    spellings = {}
+    for post in posts.values():
+        model = (post.get("model") or "").strip()
+        model_spellings = spellings.setdefault(model.lower(), {})
+        model_spellings[model] = model_spellings.get(model, 0) + 1
+
+    scopes = {"instagram": {}, "facebook": {}, "overall": {}}
+    for post_key, post in posts.items():
+        model_key = (post.get("model") or "").strip().lower()
+        add_to_scopes(scopes, post["platform"], model_key, display_name(spellings[model_key]),
+                      {**post, "posts": 1}, [post_key], [post["engagement"]])
+    return {scope: metrics_from_groups(groups) for scope, groups in scopes.items()}
+
+
+def sorted_post_ids(metrics):
+    for scope in metrics.values():
+        for breakdown in scope.get("model_breakdown", {}).values():
+            breakdown["post_ids"] = sorted(breakdown["post_ids"])
+    return metrics
+
+
+def test_live_snapshot_matches_batch_metrics():
+    rng = random.Random(7)
+    analyzer = AnalysisService()
+    posts = {}
+    aggregator = MetricsAggregator()
+    for index in range(150):
+        post = make_post(index, rng)
+        post_key = analyzer.get_post_key(post)
+        posts[post_key] = post
+        aggregator.add_post(post_key, post)
+
+    # Reclassified posts replace their earlier classification
+    for post_key in rng.sample(sorted(posts), 30):
+        posts[post_key] = {**posts[post_key], "model": rng.choice(SPELLINGS)}
+        aggregator.add_post(post_key, posts[post_key])
+
+    live = aggregator.snapshot(include_post_ids=True)
+    assert sorted_post_ids(live) == sorted_post_ids(expected_metrics(posts))
+
+    # One display name per model, whichever platform saw which spelling first
+    names = {scope: set(metrics["model_breakdown"]) for scope, metrics in live.items()}
+    assert names["instagram"] | names["facebook"] == names["overall"]
+    assert "post_ids" not in aggregator.snapshot()["overall"]["model_breakdown"]["Seal"]
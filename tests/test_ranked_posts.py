@@ -0,0 +1,54 @@
+import asyncio
+import uuid
+
+import pytest
+
+
+def ranked(client, analysis_id, **params):
+    response = client.get(f"/api/analysis/{analysis_id}/ranked-posts", params={"brand": "BYD", **params})
+    assert response.status_code == 200
+    return [(post["platform"], post["model"], post["engagement"]) for post in response.json()["posts"]]
+
+
+def check_rankings(client, analysis_id):
+    assert ranked(client, analysis_id, limit=2) == [("instagram", "Seal", 300), ("instagram", "Seal", 200)]
+    assert ranked(client, analysis_id, limit=2, lowest=True) == [("facebook", "seal", 10), ("facebook", "seal", 20)]
+    assert ranked(client, analysis_id, model="SEAL", lowest=True, limit=1) == [("facebook", "seal", 10)]
+    assert ranked(client, analysis_id, platform="instagram", model="atto 3", limit=1) == [("instagram", "Atto 3", 120)]
+    assert ranked(client, analysis_id, platform="facebook") == [
+        ("facebook", "seal", 30), ("facebook", "seal", 20), ("facebook", "seal", 10)
+    ]
+    assert ranked(client, analysis_id, platform="tiktok") == []
+
+
+def test_ranked_posts_of_running_analysis(app_module, client, analysis_document):
+    analysis_id = str(uuid.uuid4())
+    app_module.active_analysis[analysis_id] = analysis_document(status="processing")
+    try:
+        check_rankings(client, analysis_id)
+    finally:
+        app_module.active_analysis.pop(analysis_id, None)
+
+
+def test_ranked_posts_of_stored_analysis(app_module, client, analysis_document):
+    analysis_id = str(uuid.uuid4())
+    asyncio.run(app_module.db_service.save_analysis_result(analysis_id, analysis_document()))
+
+    check_rankings(client, analysis_id)
+    response = client.get(f"/api/analysis/{analysis_id}/ranked-posts", params={"brand": "Tesla"})
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("platform, model", [("instagram", None), (None, "seal"), ("facebook", "seal")])
+def test_sqlite_ranking_uses_an_index(app_module, platform, model):
+    db_service = app_module.db_service
+    if not hasattr(db_service, "_posts_where"):
+        pytest.skip("SQLite backend only")
+
+    where, params = db_service._posts_where("analysis", "BYD", platform, model=model)
+    plan = db_service._connection().execute(f'''
+        EXPLAIN QUERY PLAN SELECT post_key FROM posts WHERE {where}
+        ORDER BY engagement DESC, post_key DESC LIMIT 5
+    ''', params).fetchall()
+    details = " ".join(row["detail"] for row in plan)
+    assert "_ranking" in details and "TEMP B-TREE" not in details
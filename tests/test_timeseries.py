@@ -0,0 +1,63 @@
+import asyncio
+import uuid
+
+from conftest import DAY
+
+
+def check_series(body):
+    assert body["granularity"] == "day"
+    assert len(body["buckets"]) == 3
+    assert body["buckets"][0].startswith("2024-03-04T00:00:00")
+    # Model spellings differing only in case are one series
+    assert set(body["series"]) == {"Seal", "Atto 3"}
+    assert body["series"]["Seal"]["posts"] == [2, 2, 2]
+    assert body["series"]["Seal"]["engagement"] == [110, 220, 330]
+    assert body["series"]["Atto 3"]["engagement"] == [40, 80, 120]
+
+
+def test_timeseries_of_running_analysis(app_module, client, analysis_document):
+    analysis_id = str(uuid.uuid4())
+    app_module.active_analysis[analysis_id] = analysis_document(status="processing")
+    try:
+        response = client.get(f"/api/analysis/{analysis_id}/timeseries", params={"brand": "BYD"})
+    finally:
+        app_module.active_analysis.pop(analysis_id, None)
+
+    assert response.status_code == 200
+    check_series(response.json())
+
+
+def test_timeseries_of_stored_analysis(app_module, client, analysis_document):
+    analysis_id = str(uuid.uuid4())
+    asyncio.run(app_module.db_service.save_analysis_result(analysis_id, analysis_document()))
+
+    response = client.get(f"/api/analysis/{analysis_id}/timeseries", params={"brand": "BYD"})
+    assert response.status_code == 200
+    check_series(response.json())
+
+    response = client.get(f"/api/analysis/{analysis_id}/timeseries",
+                          params={"brand": "BYD", "platform": "facebook", "max_points": 2})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["bucket_seconds"] == 2 * DAY
+    # Named like model_breakdown, not by the facebook spelling
+    assert body["series"]["Seal"]["engagement"] == [30, 30]
+
+
+def test_timeseries_errors(app_module, client, analysis_document):
+    assert client.get("/api/analysis/missing/timeseries", params={"brand": "BYD"}).status_code == 404
+
+    analysis_id = str(uuid.uuid4())
+    app_module.active_analysis[analysis_id] = analysis_document(status="processing")
+    try:
+        response = client.get(f"/api/analysis/{analysis_id}/timeseries",
+                              params={"brand": "BYD", "granularity": "minute"})
+        assert response.status_code == 400
+        response = client.get(f"/api/analysis/{analysis_id}/timeseries", params={"brand": "Tesla"})
+        assert response.status_code == 404
+        for max_points in (0, app_module.SERIES_MAX_POINTS + 1):
+            response = client.get(f"/api/analysis/{analysis_id}/timeseries",
+                                  params={"brand": "BYD", "granularity": "hour", "max_points": max_points})
+            assert response.status_code == 422
+    finally:
+        app_module.active_analysis.pop(analysis_id, None)
@@ -0,0 +1,130 @@
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.time_utils import to_utc_datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # columnar exports are optional - CSV is always available
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# format -> (file extension, media type)
+COLUMNAR_FORMATS = {
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.file'),
+}
+
+COUNT_COLUMNS = ('engagement', 'likes', 'comments', 'shares', 'reactions')
+TEXT_COLUMNS = ('url', 'caption', 'text', 'classification_reason')
+LIST_COLUMNS = ('hashtags', 'thumbnails')
+
+
+def columnar_available() -> bool:
+    return pa is not None
+
+
+def post_schema() -> 'pa.Schema':
+    """One row per post, with typed counts and UTC timestamps"""
+    return pa.schema(
+        [
+            ('analysis_id', pa.string()),
+            ('brand', pa.string()),
+            ('platform', pa.string()),
+            ('model', pa.string()),
+            ('post_key', pa.string()),
+            ('timestamp', pa.timestamp('us', tz='UTC')),
+        ]
+        + [(column, pa.int64()) for column in COUNT_COLUMNS]
+        + [('classification_confidence', pa.float64())]
+        + [(column, pa.string()) for column in TEXT_COLUMNS]
+        + [(column, pa.list_(pa.string())) for column in LIST_COLUMNS]
+    )
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_list(value: Any) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    return [str(item) for item in value]
+
+
+def _post_time(post: Dict[str, Any]):
+    epoch = post.get('timestamp_epoch')
+    return to_utc_datetime(epoch if epoch is not None else post.get('timestamp'))
+
+
+def posts_to_batch(analysis_id: str, posts: Iterable[Dict[str, Any]]) -> 'pa.RecordBatch':
+    """Build a record batch of posts, column by column"""
+    posts = list(posts)
+    columns = {
+        'analysis_id': [analysis_id] * len(posts),
+        'brand': [post.get('brand') for post in posts],
+        'platform': [post.get('platform') for post in posts],
+        'model': [post.get('model') for post in posts],
+        'post_key': [post.get('post_key') for post in posts],
+        'timestamp': [_post_time(post) for post in posts],
+        'classification_confidence': [_as_float(post.get('classification_confidence')) for post in posts],
+    }
+    for column in COUNT_COLUMNS:
+        columns[column] = [_as_int(post.get(column)) for post in posts]
+    for column in TEXT_COLUMNS:
+        columns[column] = [None if post.get(column) is None else str(post[column]) for post in posts]
+    for column in LIST_COLUMNS:
+        columns[column] = [_as_list(post.get(column)) for post in posts]
+
+    schema = post_schema()
+    return pa.RecordBatch.from_arrays([pa.array(columns[field.name], type=field.type) for field in schema],
+                                      schema=schema)
+
+
+class ColumnarWriter:
+    """Writes posts of one or more analyses to a Parquet or Arrow IPC file, a batch at a time"""
+
+    def __init__(self, path: str, fmt: str = 'parquet'):
+        if pa is None:
+            raise RuntimeError("Columnar exports need pyarrow, which is not installed")
+        if fmt not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+
+        self.path = path
+        self.rows = 0
+        schema = post_schema()
+        if fmt == 'parquet':
+            self._writer = pq.ParquetWriter(path, schema, compression='zstd')
+        else:
+            self._writer = ipc.new_file(path, schema, options=ipc.IpcWriteOptions(compression='zstd'))
+
+    def write(self, analysis_id: str, posts: Iterable[Dict[str, Any]]):
+        batch = posts_to_batch(analysis_id, posts)
+        if batch.num_rows:
+            self._writer.write_batch(batch)
+            self.rows += batch.num_rows
+
+    def close(self):
+        self._writer.close()
+        logger.info(f"Columnar export saved: {self.path} ({self.rows} rows)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
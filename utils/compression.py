@@ -0,0 +1,60 @@
+import json
+import logging
+import os
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional - zlib is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Bulky post fields that are only needed when posts are displayed or exported
+COLD_POST_FIELDS = ('caption', 'text', 'classification_reason', 'thumbnails', 'hashtags')
+
+# First byte of a compressed blob names its codec
+ZLIB_CODEC = b'z'
+ZSTD_CODEC = b's'
+
+
+def _configured_codec() -> Optional[str]:
+    """Codec from POST_COMPRESSION: 'zlib' (default), 'zstd' or 'none'"""
+    codec = os.getenv('POST_COMPRESSION', 'zlib').lower()
+    if codec == 'none':
+        return None
+    if codec == 'zstd' and zstandard is None:
+        logger.warning("POST_COMPRESSION=zstd but zstandard is not installed, using zlib")
+        return 'zlib'
+    return codec if codec in ('zlib', 'zstd') else 'zlib'
+
+
+def compress_cold_fields(post: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[bytes]]:
+    """Split a post into its hot fields and a compressed blob of its cold fields"""
+    codec = _configured_codec()
+    cold = {field: post[field] for field in COLD_POST_FIELDS if field in post}
+    if codec is None or not cold:
+        return post, None
+
+    hot = {field: value for field, value in post.items() if field not in cold}
+    payload = json.dumps(cold, separators=(',', ':')).encode('utf-8')
+    if codec == 'zstd':
+        return hot, ZSTD_CODEC + zstandard.ZstdCompressor(level=3).compress(payload)
+    return hot, ZLIB_CODEC + zlib.compress(payload, 6)
+
+
+def decompress_cold_fields(blob: Optional[bytes]) -> Dict[str, Any]:
+    """Restore the cold fields stored by compress_cold_fields"""
+    if not blob:
+        return {}
+
+    blob = bytes(blob)
+    codec, data = blob[:1], blob[1:]
+    if codec == ZSTD_CODEC:
+        if zstandard is None:
+            raise RuntimeError("Post fields were stored with zstd but zstandard is not installed")
+        payload = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        payload = zlib.decompress(data)
+    return json.loads(payload)
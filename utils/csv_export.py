@@ -0,0 +1,39 @@
+import csv
+import io
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable
+
+CSV_COLUMNS = [
+    'brand', 'platform', 'model', 'timestamp', 'engagement',
+    'likes', 'comments', 'shares', 'reactions', 'url',
+    'caption', 'text', 'hashtags', 'thumbnail',
+    'classification_reason', 'classification_confidence'
+]
+
+
+def _csv_value(post: Dict[str, Any], column: str) -> Any:
+    value = post.get(column)
+    if value is None:
+        return ''
+    if column == 'timestamp' and isinstance(value, datetime):
+        # Naive timestamps are UTC
+        value = value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return ', '.join(str(item) for item in value)
+    return value
+
+
+def csv_header() -> str:
+    return format_csv_rows([], header=True)
+
+
+def format_csv_rows(posts: Iterable[Dict[str, Any]], header: bool = False) -> str:
+    """CSV text of a batch of posts, one row per post in CSV_COLUMNS order"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    for post in posts:
+        writer.writerow([_csv_value(post, column) for column in CSV_COLUMNS])
+    return buffer.getvalue()
@@ -0,0 +1,23 @@
+import base64
+import json
+from typing import Any, Optional, Tuple
+
+# Post orders supported by the paginated posts query: sort -> numeric sort value of a post
+POST_SORTS = ('timestamp', 'engagement')
+
+
+def encode_post_cursor(sort: str, value: Optional[Any], post_key: str) -> str:
+    """Opaque cursor for the position after a post in a (value, post_key) ordering"""
+    payload = json.dumps([sort, value, post_key], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+
+def decode_post_cursor(cursor: str, sort: str) -> Tuple[Optional[Any], str]:
+    """(value, post_key) of a cursor; raises ValueError if it is malformed or from another sort"""
+    try:
+        cursor_sort, value, post_key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if cursor_sort != sort or not isinstance(post_key, str):
+        raise ValueError(f"Cursor does not belong to sort '{sort}'")
+    return value, post_key
@@ -0,0 +1,118 @@
+import gzip
+from typing import List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli is optional - gzip is always available
+    brotli = None
+
+# Only these are worth compressing; streams are never buffered
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/html', 'text/css',
+                      'text/plain')
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best encoding the client accepts: br (when installed), then gzip"""
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    wildcard = accepted.get('*', 0.0)
+    for encoding in (('br', 'gzip') if brotli is not None else ('gzip',)):
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        # Low qualities are nearly as small as the maximum at a fraction of the CPU
+        return brotli.compress(body, quality=4)
+    return gzip.compress(body, compresslevel=5)
+
+
+class CompressionMiddleware:
+    """Compresses complete responses above minimum_size with br or gzip, as negotiated
+
+    Responses without a Content-Length (streams, Server-Sent Events), already
+    encoded ones and non-text types pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope.get('method') == 'HEAD':
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope.get('headers') or [])
+        encoding = choose_encoding(request_headers.get(b'accept-encoding', b'').decode('latin-1'))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message['type'] == 'http.response.start':
+                if not self._should_compress(message['headers']):
+                    passthrough = True
+                    await send(message)
+                    return
+                start_message = message
+                return
+
+            if message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+                if message.get('more_body', False):
+                    return
+                await self._send_compressed(send, start_message, b''.join(chunks), encoding)
+                return
+
+            await send(message)
+
+        await self.app(scope, receive, compressing_send)
+
+    def _should_compress(self, headers: List[Tuple[bytes, bytes]]) -> bool:
+        values = {name.lower(): value for name, value in headers}
+        if b'content-encoding' in values or b'content-length' not in values:
+            return False
+        try:
+            if int(values[b'content-length']) < self.minimum_size:
+                return False
+        except ValueError:
+            return False
+        content_type = values.get(b'content-type', b'').decode('latin-1').split(';')[0].strip().lower()
+        return content_type in COMPRESSIBLE_TYPES
+
+    async def _send_compressed(self, send, start_message, body: bytes, encoding: str):
+        compressed = compress(body, encoding)
+        headers = [
+            (name, value) for name, value in start_message['headers']
+            if name.lower() not in (b'content-length', b'vary')
+        ]
+        vary = [value for name, value in start_message['headers'] if name.lower() == b'vary']
+        headers += [
+            (b'content-encoding', encoding.encode('latin-1')),
+            (b'content-length', str(len(compressed)).encode('latin-1')),
+            (b'vary', b', '.join(vary + [b'Accept-Encoding'])),
+        ]
+        await send({**start_message, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': compressed})
@@ -0,0 +1,44 @@
+import json
+from datetime import date, datetime
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson is optional - the standard json module is the fallback
+    orjson = None
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+def _default(value: Any) -> Any:
+    """Types neither serializer knows: pydantic models, sets and anything else as a string"""
+    if isinstance(value, (datetime, date)):
+        # Only reached by the json fallback; ISO-8601 like orjson
+        return value.isoformat()
+    if hasattr(value, 'model_dump'):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(content, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response serialized in one pass by orjson
+
+    Endpoints returning large documents should return this directly: a plain
+    dict first goes through FastAPI's jsonable_encoder, which costs more
+    than the serialization itself.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
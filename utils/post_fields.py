@@ -0,0 +1,104 @@
+from typing import Any, Dict, List, Tuple
+
+# Fields that belong to one analysis: its brand label, its classification
+# and the engagement snapshot taken when it ran
+REFERENCE_FIELDS = (
+    'post_key', 'brand', 'platform', 'model', 'classification_confidence', 'timestamp_epoch',
+    'engagement', 'likes', 'comments', 'shares', 'reactions'
+)
+
+# Fields that only make sense within one analysis and are kept out of the shared store
+ANALYSIS_ONLY_FIELDS = ('post_key', 'brand')
+
+
+def split_post(post: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Split a post into its shared content (with latest counts) and its per-analysis reference"""
+    content = {field: value for field, value in post.items() if field not in ANALYSIS_ONLY_FIELDS}
+    reference = {field: post[field] for field in REFERENCE_FIELDS if field in post}
+    return content, reference
+
+
+def merge_post(content: Dict[str, Any], reference: Dict[str, Any]) -> Dict[str, Any]:
+    """Rebuild a post as seen by one analysis from the shared content and its reference"""
+    return {**content, **reference}
+
+
+# Per-post key lists of a brand result; they grow with the posts, so stored
+# analyses leave them out and read the posts collection through its indexes
+POST_LIST_FIELDS = ('engagement_order', 'time_index', 'ranked_orders')
+BRAND_PLATFORMS = ('instagram', 'facebook')
+
+
+def _without_breakdown_post_ids(metrics: Dict[str, Any]) -> Dict[str, Any]:
+    breakdown = metrics.get('model_breakdown')
+    if not isinstance(breakdown, dict):
+        return metrics
+    return {
+        **metrics,
+        'model_breakdown': {
+            model: {field: value for field, value in entry.items() if field != 'post_ids'}
+            for model, entry in breakdown.items()
+        }
+    }
+
+
+def strip_post_lists(brand_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a brand result without the post key lists that are rebuilt from the stored posts"""
+    stripped = {field: value for field, value in brand_data.items() if field not in POST_LIST_FIELDS}
+    for platform in BRAND_PLATFORMS:
+        platform_data = stripped.get(platform)
+        # Analyses saved before the posts collection only have their embedded posts
+        if not isinstance(platform_data, dict) or 'posts' in platform_data:
+            continue
+        platform_data = {field: value for field, value in platform_data.items() if field != 'post_ids'}
+        if isinstance(platform_data.get('metrics'), dict):
+            platform_data['metrics'] = _without_breakdown_post_ids(platform_data['metrics'])
+        stripped[platform] = platform_data
+    if isinstance(stripped.get('overall_metrics'), dict):
+        stripped['overall_metrics'] = _without_breakdown_post_ids(stripped['overall_metrics'])
+    return stripped
+
+
+def attach_post_ids(brands_data: Dict[str, Dict[str, Any]], posts: List[Dict[str, Any]]):
+    """Give stored brand results back their per-platform post keys, in the order of posts"""
+    post_ids = {}
+    for post in posts:
+        post_ids.setdefault((post.get('brand'), post.get('platform')), []).append(post['post_key'])
+
+    for brand_name, brand_data in brands_data.items():
+        for platform in BRAND_PLATFORMS:
+            platform_data = brand_data.get(platform)
+            if isinstance(platform_data, dict) and 'post_ids' not in platform_data and 'posts' not in platform_data:
+                platform_data['post_ids'] = post_ids.get((brand_name, platform), [])
+
+
+# Indexes a brand result carries for the server's own range and ranking queries
+BRAND_INDEX_FIELDS = POST_LIST_FIELDS + ('daily_cube', 'engagement_sketches')
+
+
+def strip_brand_indexes(brands_data: Dict[str, Dict[str, Any]], keep: Tuple[str, ...] = ()) -> Dict[str, Dict[str, Any]]:
+    """Copy of brand results for API responses, without the indexes not named in keep
+
+    Per-model post_ids are kept only when 'post_ids' is in keep; the
+    per-platform post_ids that clients render posts from always stay.
+    """
+    stripped = {}
+    for brand_name, brand_data in brands_data.items():
+        if not isinstance(brand_data, dict):
+            stripped[brand_name] = brand_data
+            continue
+        brand_data = {
+            field: value for field, value in brand_data.items()
+            if field not in BRAND_INDEX_FIELDS or field in keep
+        }
+        if 'post_ids' not in keep:
+            for platform in BRAND_PLATFORMS:
+                platform_data = brand_data.get(platform)
+                if isinstance(platform_data, dict) and isinstance(platform_data.get('metrics'), dict):
+                    brand_data[platform] = {
+                        **platform_data, 'metrics': _without_breakdown_post_ids(platform_data['metrics'])
+                    }
+            if isinstance(brand_data.get('overall_metrics'), dict):
+                brand_data['overall_metrics'] = _without_breakdown_post_ids(brand_data['overall_metrics'])
+        stripped[brand_name] = brand_data
+    return stripped
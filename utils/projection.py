@@ -0,0 +1,43 @@
+from typing import Any, Dict, List, Optional
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Dotted field paths from a comma-separated fields parameter, None for all fields"""
+    if not fields:
+        return None
+    paths = [path.strip() for path in fields.split(',') if path.strip()]
+    return paths or None
+
+
+def wants_field(paths: Optional[List[str]], field: str) -> bool:
+    """Whether a projection needs a top-level field at all"""
+    return paths is None or any(path.split('.', 1)[0] == field for path in paths)
+
+
+def covering_paths(paths: List[str]) -> List[str]:
+    """Paths without those already covered by a shorter requested path"""
+    return [
+        path for path in paths
+        if not any(other != path and path.startswith(other + '.') for other in paths)
+    ]
+
+
+def project(document: Dict[str, Any], paths: Optional[List[str]]) -> Dict[str, Any]:
+    """Copy of document with only the given dotted paths; missing paths are left out"""
+    if paths is None:
+        return document
+
+    projected: Dict[str, Any] = {}
+    for path in covering_paths(paths):
+        keys = path.split('.')
+        value = document
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = projected
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+    return projected
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+# Fallback formats seen in scraped and imported post timestamps
+TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y/%m/%d', '%d-%m-%Y']
+
+
+def to_utc_datetime(value: Any) -> Optional[datetime]:
+    """Parse a post timestamp into a timezone-aware UTC datetime"""
+    if isinstance(value, str):
+        try:
+            if 'T' in value:
+                # Handle both 'Z' and '+00:00' formats
+                value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            else:
+                # Date-only timestamps count from the start of the day
+                value = datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            for fmt in TIMESTAMP_FORMATS:
+                try:
+                    value = datetime.strptime(value, fmt)
+                    break
+                except ValueError:
+                    continue
+            else:
+                return None
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    elif not isinstance(value, datetime):
+        return None
+
+    # Naive timestamps are treated as UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def to_utc_epoch(value: Any) -> Optional[int]:
+    """Convert a post timestamp to UTC epoch seconds"""
+    parsed = to_utc_datetime(value)
+    if parsed is None:
+        return None
+    return int(parsed.timestamp())